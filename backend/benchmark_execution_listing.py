@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+"""
+Benchmark execution history listing as the WorkflowExecution table grows
+
+Runs against a throwaway SQLite database, never the project database.
+Usage: python benchmark_execution_listing.py [max_rows]
+"""
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+# Add the backend directory to Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# Setup Django against a temporary database
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agent_flow_backend.settings')
+from django.conf import settings
+
+db_path = os.path.join(tempfile.mkdtemp(), 'benchmark.sqlite3')
+settings.DATABASES['default']['NAME'] = db_path
+settings.EXECUTION_WRITE_BEHIND = False
+settings.DEBUG = False  # Avoid recording every query in memory
+
+import django
+django.setup()
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+from workflows.models import Workflow, WorkflowExecution
+
+INSERT_BATCH_SIZE = 5000
+PAGE_SIZE = 100
+REPEATS = 20
+
+
+def insert_executions(users, workflows, count, offset):
+    """Insert ``count`` executions spread over users, workflows and time"""
+    now = timezone.now()
+    statuses = ['completed', 'completed', 'completed', 'error']
+    batch = []
+    for i in range(offset, offset + count):
+        workflow = workflows[i % len(workflows)]
+        batch.append(WorkflowExecution(
+            id=uuid.uuid4(),
+            workflow=workflow,
+            user_id=workflow.user_id,
+            status=statuses[i % len(statuses)],
+            finished_at=now
+        ))
+        if len(batch) >= INSERT_BATCH_SIZE:
+            WorkflowExecution.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        WorkflowExecution.objects.bulk_create(batch)
+
+    # started_at is auto_now_add, so spread rows over the last year afterwards
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE workflows_workflowexecution SET started_at = datetime('now', '-' || (abs(random()) %% 31536000) || ' seconds') "
+            "WHERE finished_at = %s", [now]
+        )
+
+
+def time_query(queryset):
+    """Return the median time in milliseconds to fetch one page"""
+    timings = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        list(queryset.values('id', 'status', 'started_at')[:PAGE_SIZE])
+        timings.append((time.perf_counter() - start) * 1000)
+    timings.sort()
+    return timings[len(timings) // 2]
+
+
+def run_benchmark(max_rows):
+    print(f"Using temporary database: {db_path}")
+    call_command('migrate', verbosity=0)
+
+    users = [User.objects.create_user(username=f'bench{i}', password='benchmark-password') for i in range(10)]
+    workflows = [
+        Workflow.objects.create(user=users[i % len(users)], name=f'Benchmark {i}')
+        for i in range(50)
+    ]
+    user = users[0]
+    workflow = workflows[0]
+    week_ago = timezone.now() - timedelta(days=7)
+
+    queries = {
+        'user listing': lambda: WorkflowExecution.objects.filter(user=user).order_by('-started_at'),
+        'workflow listing': lambda: WorkflowExecution.objects.filter(workflow=workflow).order_by('-started_at'),
+        'status filter': lambda: WorkflowExecution.objects.filter(user=user, status='error').order_by('-started_at'),
+        'last 7 days': lambda: WorkflowExecution.objects.filter(user=user, started_at__gte=week_ago).order_by('-started_at'),
+    }
+
+    print(f"{'rows':>10} " + ' '.join(f"{name:>18}" for name in queries))
+
+    total = 0
+    size = 10000
+    while total < max_rows:
+        count = min(size, max_rows) - total
+        insert_executions(users, workflows, count, total)
+        total += count
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        timings = [time_query(build()) for build in queries.values()]
+        print(f"{total:>10} " + ' '.join(f"{t:>16.2f}ms" for t in timings))
+        size *= 10
+
+    print("\nQuery plan for the user listing:")
+    sql, params = WorkflowExecution.objects.filter(user=user).order_by('-started_at')[:PAGE_SIZE].query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        for row in cursor.fetchall():
+            print(f"  {row[-1]}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -13,8 +13,10 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'agent_flow_backend.settings')
 django.setup()
 
+from asgiref.sync import async_to_sync
+
 from workflows.models import MemoryCollection, MemoryMessage
-from workflows.node_executors.ai_nodes import AgentFlowDBMemory
+from workflows.memory_store import BufferedDBMemory
 from datetime import datetime
 
 def test_db_memory():
@@ -33,7 +35,7 @@ def test_db_memory():
     print(f"Created memory collection: {collection.name}")
     
     # Create memory instance
-    memory = AgentFlowDBMemory(collection, window_size=5)
+    memory = async_to_sync(BufferedDBMemory.load)(collection, 5)
     
     # Test adding messages
     print("\n--- Adding messages ---")
@@ -41,6 +43,7 @@ def test_db_memory():
     memory.add_ai_message("Nice to meet you, Alice! How can I help you today?")
     memory.add_user_message("What's my name?")
     memory.add_ai_message("Your name is Alice.")
+    memory.flush().result()
     
     # Test retrieving messages
     print("\n--- Retrieving messages ---")
@@ -57,6 +60,7 @@ def test_db_memory():
     memory.add_ai_message("Response 5")
     memory.add_user_message("Message 6")
     memory.add_ai_message("Response 6")
+    memory.flush().result()
     
     messages = memory.messages()
     print(f"Messages after adding more: {len(messages)}")
@@ -74,7 +78,7 @@ def test_db_memory():
     # Test persistence
     print("\n--- Testing persistence ---")
     print("Creating new memory instance with same collection...")
-    memory2 = AgentFlowDBMemory(collection, window_size=5)
+    memory2 = async_to_sync(BufferedDBMemory.load)(collection, 5)
     messages2 = memory2.messages()
     print(f"New memory instance has {len(messages2)} messages")
     print("Memory persisted in database!")
@@ -0,0 +1,112 @@
+"""
+Incremental execution analytics with mergeable latency histograms
+"""
+from collections import defaultdict
+from typing import Any, Dict, Iterable, Optional, Tuple
+import math
+
+from django.db import transaction
+
+from .models import ExecutionRollup
+
+# Relative accuracy of percentile estimates (log-bucket growth factor, ~1% error)
+HISTOGRAM_GAMMA = 1.02
+_LOG_GAMMA = math.log(HISTOGRAM_GAMMA)
+# Durations at or below this many milliseconds share a single bucket
+HISTOGRAM_MIN_VALUE = 0.01
+ZERO_BUCKET = 'z'
+
+# node_type used for the rollup of whole workflow executions
+WORKFLOW_ROLLUP = ''
+
+
+class LatencyHistogram:
+    """Log-bucketed histogram (DDSketch style) that can be merged by adding bucket counts"""
+
+    def __init__(self, buckets: Optional[Dict[str, int]] = None):
+        self.buckets: Dict[str, int] = dict(buckets or {})
+
+    def add(self, value: float, count: int = 1) -> None:
+        """Record a duration in milliseconds"""
+        if value <= HISTOGRAM_MIN_VALUE:
+            key = ZERO_BUCKET
+        else:
+            key = str(math.ceil(math.log(value) / _LOG_GAMMA))
+        self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def merge(self, other: 'LatencyHistogram') -> None:
+        """Add another histogram's counts into this one"""
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Estimate the q-th percentile (0-100) in milliseconds"""
+        total = sum(self.buckets.values())
+        if not total:
+            return None
+
+        rank = q / 100 * (total - 1)
+        seen = 0
+        ordered = sorted(self.buckets.items(), key=lambda item: -math.inf if item[0] == ZERO_BUCKET else int(item[0]))
+        for key, count in ordered:
+            seen += count
+            if seen > rank:
+                if key == ZERO_BUCKET:
+                    return 0.0
+                # Midpoint of the bucket (gamma^(i-1), gamma^i]
+                return 2 * HISTOGRAM_GAMMA ** int(key) / (HISTOGRAM_GAMMA + 1)
+        return None
+
+
+def record_samples(samples: Iterable[Tuple[Any, str, float, bool]]) -> None:
+    """
+    Fold execution samples into the rollup tables
+
+    Args:
+        samples: (workflow_id, node_type, duration_ms, is_error) tuples; node_type is
+            WORKFLOW_ROLLUP for whole-execution samples
+    """
+    grouped: Dict[Tuple[Any, str], Dict[str, Any]] = defaultdict(
+        lambda: {'count': 0, 'errors': 0, 'total': 0.0, 'histogram': LatencyHistogram()}
+    )
+    for workflow_id, node_type, duration_ms, is_error in samples:
+        group = grouped[(workflow_id, node_type)]
+        group['count'] += 1
+        group['errors'] += 1 if is_error else 0
+        group['total'] += duration_ms
+        group['histogram'].add(duration_ms)
+
+    if not grouped:
+        return
+
+    with transaction.atomic():
+        for (workflow_id, node_type), group in grouped.items():
+            rollup, _ = ExecutionRollup.objects.select_for_update().get_or_create(
+                workflow_id=workflow_id,
+                node_type=node_type
+            )
+            histogram = LatencyHistogram(rollup.buckets)
+            histogram.merge(group['histogram'])
+
+            rollup.count += group['count']
+            rollup.error_count += group['errors']
+            rollup.total_duration_ms += group['total']
+            rollup.buckets = histogram.buckets
+            rollup.save()
+
+
+def summarize_rollup(rollup: Optional[ExecutionRollup]) -> Dict[str, Any]:
+    """Convert a rollup row into counts, error rate and latency percentiles"""
+    if rollup is None:
+        rollup = ExecutionRollup()
+    histogram = LatencyHistogram(rollup.buckets)
+    return {
+        'count': rollup.count,
+        'error_count': rollup.error_count,
+        'error_rate': rollup.error_count / rollup.count if rollup.count else 0,
+        'avg_ms': rollup.total_duration_ms / rollup.count if rollup.count else None,
+        'p50_ms': histogram.percentile(50),
+        'p95_ms': histogram.percentile(95),
+        'p99_ms': histogram.percentile(99),
+        'updated_at': rollup.updated_at,
+    }
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class WorkflowsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'workflows'
+
+    def ready(self):
+        # Registers the SQLite connection_created and credential cache signal handlers
+        from . import database, credentials  # noqa: F401
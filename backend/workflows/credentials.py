@@ -0,0 +1,145 @@
+"""
+Server-side resolution of execution credentials from stored Credential rows
+"""
+from typing import Any, Dict, Optional, Tuple
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Credential
+
+# Seconds a user's resolved credentials are reused before reloading from the database
+CREDENTIAL_CACHE_TTL = getattr(settings, 'CREDENTIAL_CACHE_TTL', 300)
+
+# Execution context keys and the environment variables used as server-wide defaults
+PROVIDER_ENV_VARS = {
+    'openai_api_key': 'OPENAI_API_KEY',
+    'anthropic_api_key': 'ANTHROPIC_API_KEY',
+    'google_api_key': 'GOOGLE_API_KEY',
+    'groq_api_key': 'GROQ_API_KEY',
+}
+
+
+def _credential_keys(credential: Credential) -> Dict[str, Any]:
+    """Map a stored credential to execution context keys (e.g. type 'openai' -> openai_api_key)"""
+    data = credential.data if isinstance(credential.data, dict) else {}
+    keys = {key: value for key, value in data.items() if key in PROVIDER_ENV_VARS and value}
+
+    provider_key = f'{credential.credential_type.lower()}_api_key'
+    api_key = data.get('api_key') or data.get('apiKey')
+    if provider_key in PROVIDER_ENV_VARS and api_key:
+        keys.setdefault(provider_key, api_key)
+    return keys
+
+
+class CredentialCache:
+    """
+    Process-local TTL cache of each user's credentials, keyed by user id
+
+    Saves and deletes in this process invalidate an entry immediately through
+    signals. Changes made by other worker processes are caught on the next read,
+    which compares the user's credential count and latest ``updated_at`` with the
+    values the entry was loaded at. That check is one aggregate query per read by
+    design; the cache spares loading the rows, not the round trip.
+    """
+
+    def __init__(self, ttl: float = CREDENTIAL_CACHE_TTL):
+        self.ttl = ttl
+        self._entries: Dict[Any, Tuple[float, Tuple, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, user_id: Optional[Any]) -> Dict[str, Any]:
+        """
+        Return ``{'by_id': {credential id: data}, 'keys': {context key: value}}`` for a user
+
+        ``keys`` already includes the environment defaults, so callers never read os.environ.
+        """
+        now = time.monotonic()
+        version = self._version(user_id)
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and entry[0] > now and entry[1] == version:
+                return entry[2]
+
+        resolved = self._load(user_id)
+        with self._lock:
+            self._entries[user_id] = (now + self.ttl, version, resolved)
+        return resolved
+
+    @staticmethod
+    def _version(user_id: Optional[Any]) -> Tuple:
+        """(count, latest updated_at) of a user's credentials, one indexed aggregate query"""
+        if user_id is None:
+            return ()
+        stats = Credential.objects.filter(user_id=user_id).aggregate(count=Count('id'), latest=Max('updated_at'))
+        return stats['count'], stats['latest']
+
+    def invalidate(self, user_id: Optional[Any] = None) -> None:
+        """Drop one user's entry, or every entry when no user is given"""
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def _load(self, user_id: Optional[Any]) -> Dict[str, Any]:
+        keys = {key: os.environ[env_var] for key, env_var in PROVIDER_ENV_VARS.items() if os.environ.get(env_var)}
+        by_id = {}
+
+        if user_id is not None:
+            # Oldest first, so the most recently updated credential of a type wins
+            for credential in Credential.objects.filter(user_id=user_id).order_by('updated_at'):
+                by_id[str(credential.id)] = credential.data
+                keys.update(_credential_keys(credential))
+
+        return {'by_id': by_id, 'keys': keys}
+
+
+credential_cache = CredentialCache()
+
+
+@receiver(post_save, sender=Credential)
+@receiver(post_delete, sender=Credential)
+def invalidate_credential_cache(sender, instance, **kwargs):
+    """Forget cached credentials of the owner when one of their credentials changes"""
+    credential_cache.invalidate(instance.user_id)
+
+
+def resolve_credentials(user, requested: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Build the credentials for one execution
+
+    Args:
+        user: Owner whose stored credentials are used (may be None or anonymous)
+        requested: Optional overrides from the request body. Values are either raw
+            secrets or references of the form ``{"credential_id": "<uuid>"}``.
+
+    Returns:
+        Execution credentials: request values, then the user's stored credentials,
+        then the server environment defaults
+
+    Raises:
+        ValueError: If a referenced credential does not exist or belongs to another user
+    """
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    stored = credential_cache.get(user_id)
+    credentials = dict(stored['keys'])
+
+    for key, value in (requested or {}).items():
+        if isinstance(value, dict) and 'credential_id' in value:
+            data = stored['by_id'].get(str(value['credential_id']))
+            if data is None:
+                raise ValueError(f"Credential {value['credential_id']} not found")
+            # A provider key resolves to the secret, any other key to the whole credential
+            if key in PROVIDER_ENV_VARS and isinstance(data, dict):
+                data = data.get(key) or data.get('api_key') or data.get('apiKey')
+            credentials[key] = data
+        elif value:
+            credentials[key] = value
+
+    return credentials
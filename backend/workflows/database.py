@@ -0,0 +1,39 @@
+"""
+Database routing and connection setup
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+# Read-heavy models whose reads may be served by the replica
+REPLICA_READ_MODELS = {'workflowexecution', 'noderun', 'nodepayload', 'exportedworkflow'}
+
+
+class ReadReplicaRouter:
+    """Send history and exported-workflow reads to the replica, everything else to default"""
+    
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == 'workflows' and model._meta.model_name in REPLICA_READ_MODELS:
+            return 'replica'
+        return 'default'
+    
+    def db_for_write(self, model, **hints):
+        return 'default'
+    
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+    
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+@receiver(connection_created)
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """Apply SQLITE_PRAGMAS (WAL, synchronous=NORMAL, mmap) to new SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    
+    with connection.cursor() as cursor:
+        for pragma, value in getattr(settings, 'SQLITE_PRAGMAS', {}).items():
+            cursor.execute(f"PRAGMA {pragma} = {value}")
@@ -0,0 +1,130 @@
+"""
+Cold storage of old executions in append-only compressed JSONL segments
+
+Each record is written as its own gzip member, so a segment file is still a
+valid .jsonl.gz stream while any single record can be read by seeking to its
+offset. A sidecar ``.idx`` file next to every segment maps execution ids to
+(user id, offset, length).
+"""
+from pathlib import Path
+from typing import Any, Dict, Iterable, Optional, Tuple
+import gzip
+import json
+import mmap
+import os
+import threading
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# Start a new segment once the current one grows past this size
+SEGMENT_MAX_BYTES = 64 * 1024 * 1024
+SEGMENT_SUFFIX = '.jsonl.gz'
+INDEX_SUFFIX = '.idx'
+
+
+class ExecutionArchive:
+    """Append-only archive of execution records with random access by execution id"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self._lock = threading.Lock()
+        self._index: Dict[str, Tuple[str, str, int, int]] = {}
+        self._index_sizes: Dict[str, int] = {}  # Bytes of each .idx file already loaded
+        self._maps: Dict[str, mmap.mmap] = {}
+
+    def _segment_names(self):
+        if not self.directory.exists():
+            return []
+        return sorted(path.name[:-len(SEGMENT_SUFFIX)] for path in self.directory.glob(f'*{SEGMENT_SUFFIX}'))
+
+    def append(self, records: Iterable[Dict[str, Any]]) -> int:
+        """
+        Append execution records to the current segment
+
+        Args:
+            records: Serialized executions, each with 'id' and 'user' keys
+
+        Returns:
+            Number of records written
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        names = self._segment_names()
+        name = names[-1] if names else 'segment-000001'
+        segment_path = self.directory / f'{name}{SEGMENT_SUFFIX}'
+        if segment_path.exists() and segment_path.stat().st_size >= SEGMENT_MAX_BYTES:
+            name = f'segment-{int(name.rsplit("-", 1)[1]) + 1:06d}'
+            segment_path = self.directory / f'{name}{SEGMENT_SUFFIX}'
+
+        written = 0
+        with open(segment_path, 'ab') as segment, open(self.directory / f'{name}{INDEX_SUFFIX}', 'a') as index:
+            offset = segment.tell()
+            for record in records:
+                line = json.dumps(record, cls=DjangoJSONEncoder) + '\n'
+                member = gzip.compress(line.encode('utf-8'))
+                segment.write(member)
+                index.write(f"{record['id']}\t{record.get('user') or ''}\t{offset}\t{len(member)}\n")
+                offset += len(member)
+                written += 1
+
+            # Records must be durable before the caller deletes them from the database
+            segment.flush()
+            os.fsync(segment.fileno())
+            index.flush()
+            os.fsync(index.fileno())
+
+        return written
+
+    def _refresh_index(self) -> None:
+        """Load index lines appended since the last refresh"""
+        for name in self._segment_names():
+            index_path = self.directory / f'{name}{INDEX_SUFFIX}'
+            if not index_path.exists():
+                continue
+            loaded = self._index_sizes.get(name, 0)
+            if index_path.stat().st_size <= loaded:
+                continue
+
+            with open(index_path, 'r') as index:
+                index.seek(loaded)
+                for line in index:
+                    if not line.endswith('\n'):
+                        break  # Partially written line, pick it up next time
+                    execution_id, user_id, offset, length = line.rstrip('\n').split('\t')
+                    self._index[execution_id] = (name, user_id, int(offset), int(length))
+                    loaded += len(line.encode('utf-8'))
+            self._index_sizes[name] = loaded
+
+    def _read(self, name: str, offset: int, length: int) -> bytes:
+        segment_map = self._maps.get(name)
+        if segment_map is None or offset + length > len(segment_map):
+            # Segment grew since it was mapped, map it again
+            if segment_map is not None:
+                segment_map.close()
+            with open(self.directory / f'{name}{SEGMENT_SUFFIX}', 'rb') as segment:
+                segment_map = mmap.mmap(segment.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[name] = segment_map
+        return segment_map[offset:offset + length]
+
+    def get(self, execution_id: str, user_id: Optional[Any] = None) -> Optional[Dict[str, Any]]:
+        """Fetch an archived execution, optionally only if it belongs to ``user_id``"""
+        execution_id = str(execution_id)
+        with self._lock:
+            entry = self._index.get(execution_id)
+            if entry is None:
+                self._refresh_index()
+                entry = self._index.get(execution_id)
+            if entry is None:
+                return None
+
+            name, owner_id, offset, length = entry
+            if user_id is not None and owner_id != str(user_id):
+                return None
+            data = self._read(name, offset, length)
+
+        return json.loads(gzip.decompress(data).decode('utf-8'))
+
+
+execution_archive = ExecutionArchive(
+    getattr(settings, 'EXECUTION_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'execution_archive')
+)
@@ -3,6 +3,7 @@ Workflow Execution Engine
 Orchestrates the execution of workflow nodes in the correct order
 """
 from typing import Dict, Any, List, Optional, Set
+from contextlib import nullcontext
 import asyncio
 import logging
 from datetime import datetime
@@ -16,11 +17,16 @@ from .node_executors import (
     OutputNodeExecutor
 )
 from .node_executors.ai_nodes import ChatModelExecutor, MemoryExecutor, ToolExecutor
+from .memory_backends import create_memory_backend
+from .memory_store import session_key
+from .session_locks import session_locks
 
 logger = logging.getLogger(__name__)
 
-# Global memory storage for persistent memory across executions
-_global_memory_storage = {}
+# Global memory storage for persistent memory across executions, see MEMORY_BACKEND
+_global_memory_storage = create_memory_backend()
+
+MEMORY_NODE_TYPES = ['simple-memory', 'vector-memory', 'window-buffer-memory', 'agent-flow-db-memory']
 
 
 class ExecutionContext:
@@ -120,6 +126,19 @@ class ExecutionContext:
         }
 
 
+class ExecutionPlan:
+    """Precomputed execution order and edge lookups for a workflow graph"""
+    
+    def __init__(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]], execution_order: List[str]):
+        self.nodes = nodes
+        self.edges = edges
+        self.execution_order = execution_order
+        self.nodes_by_id: Dict[str, Dict[str, Any]] = {node['id']: node for node in nodes}
+        self.incoming_edges: Dict[str, List[Dict[str, Any]]] = {node['id']: [] for node in nodes}
+        for edge in edges:
+            self.incoming_edges[edge['target']].append(edge)
+
+
 class WorkflowExecutionEngine:
     """Engine for executing workflows"""
     
@@ -150,7 +169,7 @@ class WorkflowExecutionEngine:
             executor_class = ChatModelExecutor
         
         # Memory nodes
-        elif node_type in ['simple-memory', 'vector-memory', 'window-buffer-memory', 'agent-flow-db-memory']:
+        elif node_type in MEMORY_NODE_TYPES:
             executor_class = MemoryExecutor
         
         # Tool nodes
@@ -221,6 +240,10 @@ class WorkflowExecutionEngine:
         
         return execution_order
     
+    def compile_plan(self, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]) -> ExecutionPlan:
+        """Build a reusable execution plan for running the whole workflow many times"""
+        return ExecutionPlan(nodes, edges, self._topological_sort(nodes, edges))
+    
     def _get_node_inputs(self, node_id: str, edges: List[Dict[str, Any]], context: ExecutionContext) -> Dict[str, Any]:
         """Collect inputs for a node from its predecessors"""
         inputs = {}
@@ -286,9 +309,10 @@ class WorkflowExecutionEngine:
             # Execute node
             result = await executor.execute(inputs, exec_context)
             
-            # Store result
+            # Store result, with response cache hit/miss counts reported by AI nodes
             context.set_node_result(node_id, result)
-            context.set_node_state(node_id, 'completed', output=result, input=inputs)
+            metrics = {'cache': exec_context['cache']} if 'cache' in exec_context else {}
+            context.set_node_state(node_id, 'completed', output=result, input=inputs, **metrics)
             context.execution_order.append(node_id)
             
             # Check for chat response
@@ -313,7 +337,8 @@ class WorkflowExecutionEngine:
         edges: List[Dict[str, Any]],
         trigger_data: Optional[Dict[str, Any]] = None,
         credentials: Optional[Dict[str, Any]] = None,
-        start_node_id: Optional[str] = None
+        start_node_id: Optional[str] = None,
+        plan: Optional[ExecutionPlan] = None
     ) -> ExecutionContext:
         """Execute entire workflow or from a specific node"""
         
@@ -325,16 +350,22 @@ class WorkflowExecutionEngine:
         self.active_executions[execution_id] = context
         
         try:
-            if start_node_id:
-                # Execute single node and its dependencies
-                await self._execute_from_node(start_node_id, nodes, edges, context)
-            else:
-                # Execute entire workflow
-                execution_order = self._topological_sort(nodes, edges)
-                
-                for node_id in execution_order:
-                    node = next(n for n in nodes if n['id'] == node_id)
-                    await self.execute_node(node, edges, context)
+            # Turns of one conversation run in order so they never race on its memory window
+            async with self._session_lock(workflow_id, plan.nodes if plan else nodes, context.trigger_data):
+                if start_node_id:
+                    # Execute single node and its dependencies
+                    await self._execute_from_node(start_node_id, nodes, edges, context)
+                elif plan:
+                    # Reuse a precompiled plan (e.g. across batch items)
+                    for node_id in plan.execution_order:
+                        await self.execute_node(plan.nodes_by_id[node_id], plan.incoming_edges[node_id], context)
+                else:
+                    # Execute entire workflow
+                    execution_order = self._topological_sort(nodes, edges)
+                    
+                    for node_id in execution_order:
+                        node = next(n for n in nodes if n['id'] == node_id)
+                        await self.execute_node(node, edges, context)
             
             context.complete('completed')
             
@@ -344,6 +375,12 @@ class WorkflowExecutionEngine:
         
         return context
     
+    def _session_lock(self, workflow_id: str, nodes: List[Dict[str, Any]], trigger_data: Dict[str, Any]):
+        """Per-conversation lock for workflows with memory nodes, a no-op otherwise"""
+        if not any(node['data']['type'] in MEMORY_NODE_TYPES for node in nodes):
+            return nullcontext()
+        return session_locks.hold(f"{workflow_id}:{session_key(trigger_data)}")
+    
     async def _execute_from_node(
         self,
         start_node_id: str,
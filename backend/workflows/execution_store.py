@@ -0,0 +1,355 @@
+"""
+Persistence of workflow executions and their per-node runs
+"""
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import atexit
+import hashlib
+import json
+import logging
+import queue
+import threading
+import time
+import zlib
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+
+from .models import WorkflowExecution, NodeRun, NodePayload
+from .analytics import record_samples, WORKFLOW_ROLLUP
+
+logger = logging.getLogger(__name__)
+
+# Node state keys moved out of WorkflowExecution.node_states into NodePayload rows
+PAYLOAD_KEYS = ('input', 'output')
+PAYLOAD_COMPRESSION_LEVEL = 6
+# Unreferenced payloads locked and deleted per transaction
+PAYLOAD_DELETE_BATCH_SIZE = 1000
+
+
+def encode_payload(value: Any) -> Tuple[str, bytes]:
+    """Serialize a payload to canonical JSON and return (content hash, raw bytes)"""
+    raw = json.dumps(value, sort_keys=True, cls=DjangoJSONEncoder, default=str).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest(), raw
+
+
+def decode_payload(data: bytes) -> Any:
+    """Decompress and parse a stored payload"""
+    return json.loads(zlib.decompress(bytes(data)).decode('utf-8'))
+
+
+def persist_executions(records: Iterable[Tuple[Any, Any, Dict[str, Any]]]) -> List[WorkflowExecution]:
+    """
+    Save finished executions together with their node runs and payloads
+
+    Args:
+        records: (workflow, ExecutionContext, trigger_data) tuples
+
+    Returns:
+        The created WorkflowExecution instances
+    """
+    executions = []
+    node_runs = []
+    payloads: Dict[str, bytes] = {}
+    samples = []
+
+    for workflow, context, trigger_data in records:
+        node_types = {node['id']: node.get('data', {}).get('type', '') for node in workflow.nodes}
+        execution = WorkflowExecution(
+            id=context.execution_id,
+            workflow=workflow,
+            user_id=workflow.user_id,
+            status=context.status,
+            finished_at=context.end_time,
+            execution_order=context.execution_order,
+            node_states={},
+            errors=context.errors,
+            trigger_data=trigger_data
+        )
+
+        for position, (node_id, state) in enumerate(context.node_states.items()):
+            refs = {}
+            for key in PAYLOAD_KEYS:
+                if key in state:
+                    content_hash, raw = encode_payload(state[key])
+                    payloads.setdefault(content_hash, raw)
+                    refs[key] = content_hash
+
+            # Keep only status and timings inline, payloads are referenced by hash
+            execution.node_states[node_id] = {
+                **{k: v for k, v in state.items() if k not in PAYLOAD_KEYS},
+                **{f'{key}_ref': content_hash for key, content_hash in refs.items()}
+            }
+
+            start_time = state.get('startTime')
+            end_time = state.get('endTime')
+            node_runs.append(NodeRun(
+                execution=execution,
+                node_id=node_id,
+                node_type=node_types.get(node_id, ''),
+                position=position,
+                status=state.get('status', ''),
+                start_time=start_time,
+                end_time=end_time,
+                duration_ms=(end_time - start_time) if start_time and end_time else 0,
+                error=state.get('error', ''),
+                input_payload_id=refs.get('input'),
+                output_payload_id=refs.get('output')
+            ))
+
+        executions.append(execution)
+
+        duration_ms = (context.end_time - context.start_time).total_seconds() * 1000 if context.end_time else 0
+        samples.append((workflow.pk, WORKFLOW_ROLLUP, duration_ms, context.status == 'error'))
+
+    samples.extend(
+        (run.execution.workflow_id, run.node_type, run.duration_ms, run.status == 'error')
+        for run in node_runs
+    )
+
+    with transaction.atomic():
+        if payloads:
+            # Lock the payloads this batch reuses until its node runs reference them, so
+            # delete_unreferenced_payloads() cannot remove them in between
+            existing = set(NodePayload.objects.select_for_update().filter(
+                content_hash__in=list(payloads)
+            ).values_list('content_hash', flat=True))
+            NodePayload.objects.bulk_create([
+                NodePayload(
+                    content_hash=content_hash,
+                    data=zlib.compress(raw, PAYLOAD_COMPRESSION_LEVEL),
+                    size=len(raw)
+                )
+                for content_hash, raw in payloads.items() if content_hash not in existing
+            ], ignore_conflicts=True)
+
+        WorkflowExecution.objects.bulk_create(executions)
+        NodeRun.objects.bulk_create(node_runs)
+        record_samples(samples)
+
+    return executions
+
+
+def delete_unreferenced_payloads(batch_size: int = PAYLOAD_DELETE_BATCH_SIZE) -> int:
+    """
+    Delete node payloads no node run references anymore
+
+    Candidates are locked and re-checked before each delete, so a payload that
+    persist_executions() is reusing concurrently is either kept or recreated by it.
+
+    Returns:
+        The number of payloads deleted
+    """
+    deleted = 0
+    unreferenced = NodePayload.objects.filter(input_runs__isnull=True, output_runs__isnull=True)
+    while True:
+        with transaction.atomic():
+            candidates = list(unreferenced.select_for_update(of=('self',)).values_list(
+                'content_hash', flat=True
+            )[:batch_size])
+            if not candidates:
+                return deleted
+            count, _ = unreferenced.filter(content_hash__in=candidates).delete()
+            deleted += count
+
+
+def persist_execution(workflow, context, trigger_data: Dict[str, Any]) -> WorkflowExecution:
+    """Save a single finished execution"""
+    return persist_executions([(workflow, context, trigger_data)])[0]
+
+
+def load_node_states(execution: WorkflowExecution) -> Dict[str, Dict[str, Any]]:
+    """Rebuild full node states, including inputs and outputs, for a stored execution"""
+    return load_node_states_many([execution])[execution.pk]
+
+
+def load_node_states_many(executions: Iterable[WorkflowExecution]) -> Dict[Any, Dict[str, Dict[str, Any]]]:
+    """
+    Rebuild full node states for several executions with one node run query
+
+    Returns:
+        Node states keyed by execution primary key
+    """
+    node_states = {
+        execution.pk: {node_id: dict(state) for node_id, state in execution.node_states.items()}
+        for execution in executions
+    }
+    runs = NodeRun.objects.filter(execution_id__in=list(node_states)).select_related('input_payload', 'output_payload')
+    decoded: Dict[str, Any] = {}  # Shared payloads are decompressed once
+
+    for run in runs:
+        state = node_states[run.execution_id].setdefault(run.node_id, {'status': run.status})
+        for key, payload in (('input', run.input_payload), ('output', run.output_payload)):
+            state.pop(f'{key}_ref', None)
+            if payload is not None:
+                if payload.content_hash not in decoded:
+                    decoded[payload.content_hash] = decode_payload(payload.data)
+                state[key] = decoded[payload.content_hash]
+
+    return node_states
+
+
+class ExecutionWriter:
+    """
+    Write-behind persister that batches finished executions on a background thread
+
+    Queued executions stay readable through ``pending()`` until they are written.
+    A failed batch is retried, then written record by record so one bad record
+    cannot drop the others.
+    """
+
+    _STOP = object()
+
+    def __init__(self, max_queue_size: int = 1000, batch_size: int = 100,
+                 linger: float = 0.05, overflow: str = 'sync', retries: int = 3, retry_delay: float = 0.5):
+        self.batch_size = batch_size
+        self.linger = linger  # Seconds to wait for more records before writing a partial batch
+        self.overflow = overflow  # 'sync' writes in the caller when the queue is full, 'block' waits for space
+        self.retries = retries
+        self.retry_delay = retry_delay  # Doubled after every failed attempt
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._pending: Dict[str, Tuple[Any, Any, Dict[str, Any]]] = {}
+
+    def submit(self, workflow, context, trigger_data: Dict[str, Any]) -> None:
+        """Queue an execution for persistence, applying backpressure when the queue is full"""
+        record = (workflow, context, trigger_data)
+        self._ensure_started()
+
+        with self._lock:
+            self._pending[str(context.execution_id)] = record
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            if self.overflow == 'block':
+                self._queue.put(record)
+            else:
+                logger.warning("Execution write queue is full, persisting synchronously")
+                try:
+                    persist_executions([record])
+                finally:
+                    self._forget([record])
+
+    def pending(self, execution_id: str) -> Optional[Tuple[Any, Any, Dict[str, Any]]]:
+        """The queued (workflow, context, trigger_data) of an execution not written yet, if any"""
+        with self._lock:
+            return self._pending.get(str(execution_id))
+
+    def _forget(self, records) -> None:
+        with self._lock:
+            for _, context, _ in records:
+                self._pending.pop(str(context.execution_id), None)
+
+    def _write(self, records) -> None:
+        """Persist a batch, retrying with backoff and finally one record at a time"""
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                persist_executions(records)
+                return
+            except Exception as e:
+                logger.warning(f"Failed to persist {len(records)} executions (attempt {attempt + 1}): {str(e)}")
+                connection.close_if_unusable_or_obsolete()
+                if attempt < self.retries:
+                    time.sleep(delay)
+                    delay *= 2
+
+        for record in records:
+            try:
+                persist_executions([record])
+            except Exception as e:
+                logger.error(f"Dropping execution {record[1].execution_id} after repeated failures: {str(e)}")
+
+    def flush(self) -> None:
+        """Block until every queued execution has been written"""
+        if self._thread and self._thread.is_alive():
+            self._queue.join()
+
+    def stop(self, timeout: float = 10) -> None:
+        """Flush pending executions and stop the background thread"""
+        with self._lock:
+            thread = self._thread
+            if not thread or not thread.is_alive():
+                return
+            self._queue.put(self._STOP)
+        thread.join(timeout)
+
+    def _ensure_started(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='execution-writer', daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+
+            # Coalesce whatever else arrives shortly into the same bulk insert
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get(timeout=self.linger))
+                except queue.Empty:
+                    break
+
+            records = [record for record in batch if record is not self._STOP]
+            stopping = len(records) != len(batch)
+
+            try:
+                if records:
+                    self._write(records)
+            finally:
+                self._forget(records)
+                connection.close_if_unusable_or_obsolete()
+                for _ in batch:
+                    self._queue.task_done()
+
+        connection.close()
+
+
+execution_writer = ExecutionWriter(
+    max_queue_size=getattr(settings, 'EXECUTION_WRITE_BEHIND_QUEUE_SIZE', 1000),
+    batch_size=getattr(settings, 'EXECUTION_WRITE_BEHIND_BATCH_SIZE', 100),
+    overflow=getattr(settings, 'EXECUTION_WRITE_BEHIND_OVERFLOW', 'sync'),
+    retries=getattr(settings, 'EXECUTION_WRITE_BEHIND_RETRIES', 3)
+)
+atexit.register(execution_writer.stop)
+
+
+def save_execution(workflow, context, trigger_data: Dict[str, Any]) -> None:
+    """Persist a finished execution, off the request path when write-behind is enabled"""
+    if getattr(settings, 'EXECUTION_WRITE_BEHIND', False):
+        execution_writer.submit(workflow, context, trigger_data)
+    else:
+        persist_execution(workflow, context, trigger_data)
+
+
+def pending_execution(execution_id: str, user_id) -> Optional[Dict[str, Any]]:
+    """
+    An execution queued for write-behind but not written yet, shaped like a stored one
+
+    Returns None unless the execution is pending and belongs to ``user_id``.
+    """
+    record = execution_writer.pending(execution_id)
+    if record is None:
+        return None
+    workflow, context, trigger_data = record
+    if workflow.user_id != user_id:
+        return None
+
+    return {
+        'id': str(context.execution_id),
+        'workflow': workflow.pk,
+        'status': context.status,
+        'started_at': context.start_time,
+        'finished_at': context.end_time,
+        'execution_order': context.execution_order,
+        'node_states': context.node_states,
+        'errors': context.errors,
+        'trigger_data': trigger_data,
+        'pending': True
+    }
@@ -0,0 +1,145 @@
+"""
+Idempotency-Key support for expensive execution endpoints
+"""
+from datetime import timedelta
+from functools import wraps
+from typing import Dict
+import hashlib
+import json
+import threading
+import time
+import logging
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+# How long a key and its stored response are kept
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# How long a duplicate request waits for the in-flight original to finish
+IDEMPOTENCY_WAIT_TIMEOUT = 120
+IDEMPOTENCY_POLL_INTERVAL = 0.2
+
+# Requests running in this process, so duplicates can wait on an event instead of polling
+_inflight: Dict[tuple, threading.Event] = {}
+_inflight_lock = threading.Lock()
+
+
+def _request_hash(request: Request) -> str:
+    """Fingerprint the request body so a reused key with a different payload is rejected"""
+    payload = json.dumps(request.data, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _replay(record: IdempotencyKey) -> Response:
+    response = Response(record.response_data, status=record.response_status)
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _wait_for_completion(scope: str, key: str):
+    """Block until the original request for this key finishes, or time out"""
+    with _inflight_lock:
+        event = _inflight.get((scope, key))
+
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_TIMEOUT
+    while time.monotonic() < deadline:
+        if event:
+            # Same process: wake up as soon as the original finishes
+            event.wait(timeout=deadline - time.monotonic())
+            event = None
+        else:
+            time.sleep(IDEMPOTENCY_POLL_INTERVAL)
+
+        record = IdempotencyKey.objects.filter(scope=scope, key=key).first()
+        if record is None or record.status == 'completed':
+            return record
+
+    return IdempotencyKey.objects.filter(scope=scope, key=key, status='completed').first()
+
+
+def run_idempotent(request: Request, view_func, *args, **kwargs):
+    """Run ``view_func`` once per Idempotency-Key, replaying the stored response for repeats"""
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return view_func(*args, **kwargs)
+
+    user_id = request.user.pk if request.user.is_authenticated else 'anonymous'
+    scope = f"{user_id}:{request.method}:{request.path}"[:255]
+    request_hash = _request_hash(request)
+    now = timezone.now()
+
+    # Drop expired keys so they can be reused and the table stays small
+    IdempotencyKey.objects.filter(expires_at__lt=now).delete()
+
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                key=key[:255],
+                scope=scope,
+                request_hash=request_hash,
+                expires_at=now + IDEMPOTENCY_KEY_TTL
+            )
+    except IntegrityError:
+        record = IdempotencyKey.objects.filter(scope=scope, key=key[:255]).first()
+        if record and record.request_hash != request_hash:
+            return Response({
+                'error': 'Idempotency-Key was already used with a different request body'
+            }, status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+
+        if record and record.status == 'in_progress':
+            logger.info(f"Waiting for in-flight request with idempotency key {key}")
+            record = _wait_for_completion(scope, key[:255])
+            if record is None:
+                # The original failed and released the key, so the client should retry
+                return Response({
+                    'error': 'The original request for this Idempotency-Key failed, please retry'
+                }, status=status.HTTP_409_CONFLICT)
+
+        if record and record.status == 'completed':
+            return _replay(record)
+
+        return Response({
+            'error': 'A request with this Idempotency-Key is still in progress'
+        }, status=status.HTTP_409_CONFLICT)
+
+    event = threading.Event()
+    with _inflight_lock:
+        _inflight[(scope, record.key)] = event
+
+    try:
+        response = view_func(*args, **kwargs)
+
+        if response.status_code >= 500:
+            # Server errors are not cached so a retry can run again
+            record.delete()
+        else:
+            record.status = 'completed'
+            record.response_status = response.status_code
+            record.response_data = response.data
+            record.save(update_fields=['status', 'response_status', 'response_data'])
+        return response
+    except Exception:
+        record.delete()
+        raise
+    finally:
+        with _inflight_lock:
+            _inflight.pop((scope, record.key), None)
+        event.set()
+
+
+def idempotent(view_func):
+    """Decorator enabling Idempotency-Key handling on a DRF view function or action"""
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        request = next(arg for arg in args if isinstance(arg, Request))
+        return run_idempotent(request, view_func, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,149 @@
+"""
+Minimal RFC 6902 JSON Patch implementation used for partial workflow graph updates
+"""
+from typing import Any, Dict, List, Tuple
+import copy
+
+SUPPORTED_OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+class JSONPatchError(ValueError):
+    """Raised when a patch document is malformed or cannot be applied"""
+    pass
+
+
+def _parse_pointer(pointer: str) -> List[str]:
+    """Split an RFC 6901 JSON Pointer into unescaped reference tokens"""
+    if not isinstance(pointer, str):
+        raise JSONPatchError(f"Invalid path: {pointer!r}")
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JSONPatchError(f"Path must start with '/': {pointer}")
+    return [token.replace('~1', '/').replace('~0', '~') for token in pointer[1:].split('/')]
+
+
+def _list_index(container: List[Any], token: str, allow_end: bool = False) -> int:
+    """Convert a reference token to a list index"""
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token.startswith('0') and token != '0'):
+        raise JSONPatchError(f"Invalid array index: {token}")
+    index = int(token)
+    upper = len(container) if allow_end else len(container) - 1
+    if index > upper:
+        raise JSONPatchError(f"Array index out of range: {token}")
+    return index
+
+
+def _resolve_parent(document: Any, pointer: str) -> Tuple[Any, str]:
+    """Return the container holding the target of ``pointer`` and the final token"""
+    tokens = _parse_pointer(pointer)
+    if not tokens:
+        raise JSONPatchError("Operations on the document root are not supported")
+
+    parent = document
+    for token in tokens[:-1]:
+        if isinstance(parent, list):
+            parent = parent[_list_index(parent, token)]
+        elif isinstance(parent, dict):
+            if token not in parent:
+                raise JSONPatchError(f"Path not found: {pointer}")
+            parent = parent[token]
+        else:
+            raise JSONPatchError(f"Path not found: {pointer}")
+    return parent, tokens[-1]
+
+
+def _get(document: Any, pointer: str) -> Any:
+    """Read the value at ``pointer``"""
+    value = document
+    for token in _parse_pointer(pointer):
+        if isinstance(value, list):
+            value = value[_list_index(value, token)]
+        elif isinstance(value, dict) and token in value:
+            value = value[token]
+        else:
+            raise JSONPatchError(f"Path not found: {pointer}")
+    return value
+
+
+def _add(document: Any, pointer: str, value: Any) -> None:
+    parent, token = _resolve_parent(document, pointer)
+    if isinstance(parent, list):
+        parent.insert(_list_index(parent, token, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[token] = value
+    else:
+        raise JSONPatchError(f"Path not found: {pointer}")
+
+
+def _remove(document: Any, pointer: str) -> Any:
+    parent, token = _resolve_parent(document, pointer)
+    if isinstance(parent, list):
+        return parent.pop(_list_index(parent, token))
+    if isinstance(parent, dict) and token in parent:
+        return parent.pop(token)
+    raise JSONPatchError(f"Path not found: {pointer}")
+
+
+def _replace(document: Any, pointer: str, value: Any) -> None:
+    parent, token = _resolve_parent(document, pointer)
+    if isinstance(parent, list):
+        parent[_list_index(parent, token)] = value
+    elif isinstance(parent, dict) and token in parent:
+        parent[token] = value
+    else:
+        raise JSONPatchError(f"Path not found: {pointer}")
+
+
+def apply_patch(document: Dict[str, Any], operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Apply a list of JSON Patch operations to a copy of ``document``
+
+    Args:
+        document: JSON-compatible document to patch (left untouched)
+        operations: RFC 6902 operations (add, remove, replace, move, copy, test)
+
+    Returns:
+        The patched document
+    """
+    if not isinstance(operations, list):
+        raise JSONPatchError("Patch must be a list of operations")
+
+    result = copy.deepcopy(document)
+
+    for operation in operations:
+        if not isinstance(operation, dict):
+            raise JSONPatchError("Each patch operation must be an object")
+
+        op = operation.get('op')
+        path = operation.get('path')
+
+        if op not in SUPPORTED_OPERATIONS:
+            raise JSONPatchError(f"Unsupported patch operation: {op}")
+        if not isinstance(path, str):
+            raise JSONPatchError(f"'{op}' operation requires a string path")
+        if op in ('add', 'replace', 'test') and 'value' not in operation:
+            raise JSONPatchError(f"'{op}' operation requires a value")
+        if op in ('move', 'copy') and not isinstance(operation.get('from'), str):
+            raise JSONPatchError(f"'{op}' operation requires a string from path")
+
+        if op == 'add':
+            _add(result, path, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            _remove(result, path)
+        elif op == 'replace':
+            _replace(result, path, copy.deepcopy(operation['value']))
+        elif op == 'move':
+            from_path = operation['from']
+            if path != from_path and path.startswith(from_path + '/'):
+                raise JSONPatchError(f"Cannot move {from_path} into one of its children")
+            _add(result, path, _remove(result, from_path))
+        elif op == 'copy':
+            _add(result, path, copy.deepcopy(_get(result, operation['from'])))
+        elif op == 'test':
+            if _get(result, path) != operation['value']:
+                raise JSONPatchError(f"Test failed for path: {path}")
+
+    return result
@@ -0,0 +1,58 @@
+"""
+Move old workflow executions out of the database into compressed archive segments
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from workflows.models import WorkflowExecution
+from workflows.serializers import WorkflowExecutionSerializer
+from workflows.execution_store import delete_unreferenced_payloads, load_node_states
+from workflows.execution_archive import execution_archive
+
+ARCHIVE_BATCH_SIZE = 500
+
+
+class Command(BaseCommand):
+    help = 'Archive workflow executions older than N days to compressed JSONL segments'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, required=True, help='Archive executions started more than this many days ago')
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE, help='Executions archived per batch')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be archived without archiving')
+
+    def handle(self, *args, **options):
+        days = options['days']
+        batch_size = options['batch_size']
+        if days < 0 or batch_size < 1:
+            raise CommandError('--days must not be negative and --batch-size must be positive')
+
+        cutoff = timezone.now() - timedelta(days=days)
+        queryset = WorkflowExecution.objects.filter(started_at__lt=cutoff).order_by('started_at')
+
+        if options['dry_run']:
+            self.stdout.write(f"Would archive {queryset.count()} executions")
+            return
+
+        archived = 0
+        while True:
+            batch = list(queryset[:batch_size])
+            if not batch:
+                break
+
+            records = []
+            for execution in batch:
+                record = dict(WorkflowExecutionSerializer(execution).data)
+                record['node_states'] = load_node_states(execution)
+                record['user'] = execution.user_id
+                records.append(record)
+
+            # Write (and fsync) the archive before removing rows from the database
+            execution_archive.append(records)
+            WorkflowExecution.objects.filter(pk__in=[execution.pk for execution in batch]).delete()
+            archived += len(batch)
+
+        # Payloads still shared with live node runs are kept
+        delete_unreferenced_payloads()
+        self.stdout.write(f"Archived {archived} executions to {execution_archive.directory}")
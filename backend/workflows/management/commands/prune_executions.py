@@ -0,0 +1,64 @@
+"""
+Delete old workflow executions according to age and count retention policies
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from workflows.models import WorkflowExecution
+from workflows.execution_store import delete_unreferenced_payloads
+
+DELETE_BATCH_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = 'Prune workflow execution history by age and/or per-workflow count'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, help='Delete executions started more than this many days ago')
+        parser.add_argument('--keep', type=int, help='Keep only this many most recent executions per workflow')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be deleted without deleting')
+
+    def handle(self, *args, **options):
+        days = options.get('days')
+        keep = options.get('keep')
+        dry_run = options['dry_run']
+
+        if days is None and keep is None:
+            raise CommandError('Specify at least one of --days or --keep')
+        if (days is not None and days < 0) or (keep is not None and keep < 0):
+            raise CommandError('--days and --keep must not be negative')
+
+        deleted = 0
+
+        if days is not None:
+            cutoff = timezone.now() - timedelta(days=days)
+            ids = WorkflowExecution.objects.filter(started_at__lt=cutoff).values_list('pk', flat=True)
+            deleted += self._delete(ids, dry_run)
+
+        if keep is not None:
+            workflow_ids = WorkflowExecution.objects.values_list('workflow_id', flat=True).distinct()
+            for workflow_id in list(workflow_ids):
+                ids = WorkflowExecution.objects.filter(
+                    workflow_id=workflow_id
+                ).order_by('-started_at').values_list('pk', flat=True)[keep:]
+                deleted += self._delete(ids, dry_run)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(f"{verb} {deleted} executions")
+
+        if not dry_run:
+            # Payloads are shared between node runs, so only drop ones nothing references anymore
+            payloads_deleted = delete_unreferenced_payloads()
+            self.stdout.write(f"Deleted {payloads_deleted} unreferenced node payloads")
+
+    def _delete(self, ids, dry_run: bool) -> int:
+        """Delete executions by primary key in batches so memory use stays bounded"""
+        ids = list(ids)
+        if dry_run:
+            return len(ids)
+
+        for start in range(0, len(ids), DELETE_BATCH_SIZE):
+            WorkflowExecution.objects.filter(pk__in=ids[start:start + DELETE_BATCH_SIZE]).delete()
+        return len(ids)
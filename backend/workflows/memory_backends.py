@@ -0,0 +1,392 @@
+"""
+Backends that keep window buffer memories between executions
+
+The local backend keeps live memory objects in the current process. The database
+and Redis backends store (role, content) rows instead, so every worker process
+serving a workflow sees the same conversation window.
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+import json
+import logging
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models import F
+
+from .memory_store import (
+    MessageWindow, aload_window, append_messages, await_writes, submit_write, to_alith_messages
+)
+from .models import MemoryCollection, MemoryMessage
+
+logger = logging.getLogger(__name__)
+
+# Attempts to write a shared window before giving up on a run's turn
+SHARED_WRITE_ATTEMPTS = 5
+
+def _window_rows(memory) -> List[Tuple[str, str]]:
+    """(role, content) rows held by a window memory, without an injected summary message"""
+    messages = memory._messages if isinstance(memory, MessageWindow) else memory.messages()
+    return [(message.role, message.content) for message in messages]
+
+
+def _save_window(name: str, description: str, rows: List[Tuple[str, str]], summary: str,
+                 window_size: int, workflow_id: str, node_id: str) -> None:
+    """Replace the messages and summary of the ownerless collection ``name``"""
+    with transaction.atomic():
+        collection, _ = MemoryCollection.objects.get_or_create(
+            name=name,
+            user=None,
+            defaults={
+                'workflow_id': workflow_id,
+                'node_id': node_id,
+                'window_size': window_size,
+                'description': description
+            }
+        )
+        MemoryMessage.objects.filter(collection=collection).delete()
+        collection.window_size = window_size
+        collection.summary = summary
+        collection.save(update_fields=['window_size', 'summary', 'updated_at'])
+        append_messages(collection, rows, window_size)
+
+
+async def _aload_saved_window(name: str) -> Optional[Tuple[MessageWindow, MemoryCollection]]:
+    """Rebuild a window saved by _save_window(), or None if there is none"""
+    collection = await MemoryCollection.objects.filter(name=name, user__isnull=True).afirst()
+    if collection is None:
+        return None
+
+    rows = await aload_window(collection, collection.window_size)
+    return MessageWindow(collection.window_size, to_alith_messages(rows), summary=collection.summary), collection
+
+
+def _new_rows(loaded: List[Tuple[str, str]], rows: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """
+    Rows appended to a window since it held ``loaded``
+
+    A window only appends and drops from the front, so the current rows start
+    with the longest suffix of ``loaded`` they still contain.
+    """
+    for kept in range(min(len(loaded), len(rows)), 0, -1):
+        if loaded[len(loaded) - kept:] == rows[:kept]:
+            return rows[kept:]
+    return rows
+
+
+class MemoryBackend(ABC):
+    """
+    Storage for window buffer memories, keyed like "memory_<node>_<workflow>"
+
+    ``aget()`` returns the memory for a key or None, ``put()``/``aput()`` are
+    called when a memory is created and again after every run that changed it.
+    """
+
+    @abstractmethod
+    async def aget(self, key: str):
+        pass
+
+    @abstractmethod
+    def put(self, key: str, memory, window_size: int, workflow_id: str, node_id: str) -> None:
+        pass
+
+    async def aput(self, key: str, memory, window_size: int, workflow_id: str, node_id: str) -> None:
+        """put() for async callers, run in a worker thread"""
+        await sync_to_async(self.put, thread_sensitive=False)(key, memory, window_size, workflow_id, node_id)
+
+
+class WindowMemoryStore(MemoryBackend):
+    """
+    Bounded LRU of in-process window memories
+
+    Entries are evicted when idle for ``idle_ttl`` seconds or when the store holds
+    more than ``max_entries`` windows or ``max_bytes`` of message text. Evicted
+    windows are written to a MemoryCollection in the background and rehydrated
+    by ``aget()`` on the next access.
+    """
+
+    ENTRY_OVERHEAD_BYTES = 512
+
+    def __init__(self, max_entries: int = 1000, max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 3600):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+        # key -> [memory, last access, size in bytes, window size, workflow id, node id]
+        self._entries: 'OrderedDict[str, List]' = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def spill_name(key: str) -> str:
+        return f"spill_{key}"
+
+    def _size(self, memory) -> int:
+        rows = _window_rows(memory)
+        return self.ENTRY_OVERHEAD_BYTES + len(getattr(memory, 'summary', '')) + sum(len(content) for _, content in rows)
+
+    async def aput(self, key: str, memory, window_size: int, workflow_id: str, node_id: str) -> None:
+        self.put(key, memory, window_size, workflow_id, node_id)
+
+    def put(self, key: str, memory, window_size: int, workflow_id: str, node_id: str) -> None:
+        """Store or replace a window and evict whatever no longer fits"""
+        size = self._size(memory)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous:
+                self._bytes -= previous[2]
+            self._entries[key] = [memory, time.monotonic(), size, window_size, workflow_id, node_id]
+            self._bytes += size
+        self._evict()
+
+    async def aget(self, key: str):
+        """Return the window for ``key``, rehydrating it from the database if it was evicted"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self._entries.move_to_end(key)
+                return entry[0]
+
+        await await_writes(key)
+        saved = await _aload_saved_window(self.spill_name(key))
+        if saved is None:
+            return None
+
+        memory, collection = saved
+        self.put(key, memory, collection.window_size, collection.workflow_id, collection.node_id)
+        # The live copy is authoritative again, drop the spilled one
+        submit_write(key, self._drop_spill, key)
+        return memory
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        victims = []
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if now - entry[1] > self.idle_ttl:
+                    victims.append((key, self._entries.pop(key)))
+                    self._bytes -= entry[2]
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                victims.append(self._entries.popitem(last=False))
+                self._bytes -= victims[-1][1][2]
+
+        for key, (memory, _, _, window_size, workflow_id, node_id) in victims:
+            submit_write(key, _save_window, self.spill_name(key), 'Evicted window buffer memory',
+                         _window_rows(memory), getattr(memory, 'summary', ''), window_size, workflow_id, node_id)
+
+    def _drop_spill(self, key: str) -> None:
+        MemoryCollection.objects.filter(name=self.spill_name(key), user__isnull=True).delete()
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def items(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return [(key, entry[0]) for key, entry in self._entries.items()]
+
+    @property
+    def size_bytes(self) -> int:
+        return self._bytes
+
+
+class SharedMemoryBackend(MemoryBackend):
+    """
+    Windows stored as versioned (role, content) rows outside the process
+
+    Each write is a compare-and-swap on the version the window was read at.
+    When another worker wrote the window in between, the rows this run appended
+    are replayed on top of the stored window and the write is retried, so
+    concurrent turns of one conversation on different workers are all kept.
+    """
+
+    # Version, rows and summary a memory object was last read or written at
+    STATE_ATTRIBUTE = '_shared_state'
+
+    @abstractmethod
+    def read(self, key: str) -> Optional[Tuple[int, List[Tuple[str, str]], str, int]]:
+        """(version, rows, summary, window size) of a stored window, or None"""
+
+    @abstractmethod
+    def compare_and_set(self, key: str, version: int, rows: List[Tuple[str, str]], summary: str,
+                        window_size: int, workflow_id: str, node_id: str) -> bool:
+        """Store the window as ``version + 1`` if it is still at ``version``"""
+
+    async def aget(self, key: str):
+        await await_writes(key)
+        stored = await sync_to_async(self.read, thread_sensitive=False)(key)
+        if stored is None:
+            return None
+
+        version, rows, summary, window_size = stored
+        memory = MessageWindow(window_size, to_alith_messages(rows), summary=summary)
+        setattr(memory, self.STATE_ATTRIBUTE, (version, rows, summary))
+        return memory
+
+    def put(self, key: str, memory, window_size: int, workflow_id: str, node_id: str) -> None:
+        """Write the window, merging with turns other workers stored since it was read"""
+        version, loaded_rows, loaded_summary = getattr(memory, self.STATE_ATTRIBUTE, (0, [], ''))
+        rows = _window_rows(memory)[-window_size:]
+        summary = getattr(memory, 'summary', '')
+
+        for _ in range(SHARED_WRITE_ATTEMPTS):
+            if self.compare_and_set(key, version, rows, summary, window_size, workflow_id, node_id):
+                try:
+                    setattr(memory, self.STATE_ATTRIBUTE, (version + 1, rows, summary))
+                except AttributeError:
+                    pass  # Alith memories take no attributes, their next write merges from version 0
+                return
+
+            # Lost the race: replay this run's turns on top of what is stored now
+            stored = self.read(key)
+            stored_version, stored_rows, stored_summary, _ = stored if stored else (0, [], '', window_size)
+            rows = (stored_rows + _new_rows(loaded_rows, rows))[-window_size:]
+            if summary == loaded_summary:
+                summary = stored_summary
+            version, loaded_rows, loaded_summary = stored_version, stored_rows, stored_summary
+
+        logger.error(f"Giving up writing memory window {key} after {SHARED_WRITE_ATTEMPTS} conflicting writes")
+
+
+class DatabaseMemoryBackend(SharedMemoryBackend):
+    """
+    Windows stored as MemoryCollection rows shared by every process using the database
+
+    With the default SQLite database in WAL mode this covers several workers on
+    one host. Writes are compare-and-swaps on MemoryCollection.version.
+    """
+
+    @staticmethod
+    def collection_name(key: str) -> str:
+        return f"shared_{key}"
+
+    def _collection(self, key: str) -> Optional[MemoryCollection]:
+        return MemoryCollection.objects.filter(
+            name=self.collection_name(key), user__isnull=True
+        ).order_by('created_at').first()
+
+    def read(self, key: str):
+        collection = self._collection(key)
+        if collection is None:
+            return None
+        rows = list(MemoryMessage.objects.filter(collection=collection).order_by('seq').values_list('role', 'content'))
+        return collection.version, rows[-collection.window_size:], collection.summary, collection.window_size
+
+    def compare_and_set(self, key, version, rows, summary, window_size, workflow_id, node_id) -> bool:
+        with transaction.atomic():
+            collection = self._collection(key)
+            if collection is None:
+                if version:
+                    return False
+                collection = MemoryCollection.objects.create(
+                    name=self.collection_name(key),
+                    workflow_id=workflow_id,
+                    node_id=node_id,
+                    window_size=window_size,
+                    description='Shared window buffer memory'
+                )
+
+            # The conditional UPDATE is the swap, it also locks the row until commit
+            updated = MemoryCollection.objects.filter(pk=collection.pk, version=version).update(
+                version=F('version') + 1,
+                last_seq=len(rows),
+                window_size=window_size,
+                summary=summary
+            )
+            if not updated:
+                return False
+
+            MemoryMessage.objects.filter(collection=collection).delete()
+            MemoryMessage.objects.bulk_create([
+                MemoryMessage(collection=collection, role=role, content=content, seq=seq)
+                for seq, (role, content) in enumerate(rows, start=1)
+            ])
+        return True
+
+
+class RedisMemoryBackend(SharedMemoryBackend):
+    """
+    Windows stored as JSON values in Redis, shared by processes on any host
+
+    ``client`` may be any object with Redis ``get`` and ``eval`` semantics,
+    otherwise one is created from ``url`` with the optional ``redis`` package.
+    Writes are compare-and-swaps on the stored version, done atomically by a
+    Lua script. Windows expire after ``ttl`` seconds without a write.
+    """
+
+    # KEYS[1] window, ARGV[1] expected version, ARGV[2] new value, ARGV[3] ttl ('' for none)
+    COMPARE_AND_SET_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+local version = 0
+if current then version = cjson.decode(current)['version'] or 0 end
+if version ~= tonumber(ARGV[1]) then return 0 end
+if ARGV[3] == '' then
+    redis.call('SET', KEYS[1], ARGV[2])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+    def __init__(self, url: str = 'redis://localhost:6379/0', ttl: Optional[int] = 3600,
+                 prefix: str = 'agentflow:memory:', client=None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImproperlyConfigured("MEMORY_BACKEND=redis requires the redis package: pip install redis")
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    def read(self, key: str):
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return None
+
+        data = json.loads(raw)
+        rows = [tuple(row) for row in data['messages']]
+        return data.get('version', 0), rows, data.get('summary', ''), data['window_size']
+
+    def compare_and_set(self, key, version, rows, summary, window_size, workflow_id, node_id) -> bool:
+        payload = json.dumps({
+            'version': version + 1,
+            'window_size': window_size,
+            'workflow_id': workflow_id,
+            'node_id': node_id,
+            'summary': summary,
+            'messages': rows
+        })
+        return bool(self.client.eval(self.COMPARE_AND_SET_SCRIPT, 1, self.prefix + key,
+                                     version, payload, self.ttl or ''))
+
+
+def create_memory_backend() -> MemoryBackend:
+    """Build the backend selected by the MEMORY_BACKEND setting (local, database or redis)"""
+    backend = getattr(settings, 'MEMORY_BACKEND', 'local')
+    idle_ttl = getattr(settings, 'MEMORY_STORAGE_IDLE_TTL', 3600)
+
+    if backend == 'local':
+        return WindowMemoryStore(
+            max_entries=getattr(settings, 'MEMORY_STORAGE_MAX_ENTRIES', 1000),
+            max_bytes=getattr(settings, 'MEMORY_STORAGE_MAX_BYTES', 64 * 1024 * 1024),
+            idle_ttl=idle_ttl
+        )
+    if backend == 'database':
+        return DatabaseMemoryBackend()
+    if backend == 'redis':
+        return RedisMemoryBackend(getattr(settings, 'MEMORY_REDIS_URL', 'redis://localhost:6379/0'), ttl=idle_ttl)
+    raise ImproperlyConfigured(f"Unknown MEMORY_BACKEND: {backend}")
@@ -0,0 +1,392 @@
+"""
+Database storage for conversation memory windows
+"""
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import hashlib
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import MemoryCollection, MemoryMessage
+from .token_budget import estimate_message_tokens, trim_to_token_budget
+
+logger = logging.getLogger(__name__)
+
+# Summarizes (previous summary, [(role, content), ...]) into a new summary
+Summarizer = Callable[[str, List[Tuple[str, str]]], str]
+
+SUMMARY_PREFIX = 'Summary of the earlier conversation:\n'
+
+# Longer session identifiers are hashed so keys and collection names stay bounded
+SESSION_KEY_MAX_LENGTH = 64
+
+
+def session_key(trigger_data: Optional[Dict[str, Any]]) -> str:
+    """
+    Conversation session a run belongs to, so each chat gets its own memory window
+
+    An explicit ``session_id`` wins, otherwise the chat ``channel`` and ``user``
+    are combined. Runs without any of them share the session ''.
+    """
+    trigger_data = trigger_data or {}
+    if trigger_data.get('session_id'):
+        key = str(trigger_data['session_id'])
+    else:
+        key = ':'.join(str(trigger_data[field]) for field in ('channel', 'user') if trigger_data.get(field))
+
+    if len(key) > SESSION_KEY_MAX_LENGTH:
+        key = hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return key
+
+
+class OrderedExecutor:
+    """Bounded thread pool that runs jobs sharing a key one after another, in submission order"""
+
+    def __init__(self, max_workers: int, thread_name_prefix: str):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=thread_name_prefix)
+        self._last: Dict[Any, Future] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, previous: Optional[Future], func, args) -> None:
+        if previous is not None:
+            previous.result()  # Never raises, failures are logged below
+        try:
+            func(*args)
+        except Exception as e:
+            logger.error(f"Memory job {getattr(func, '__name__', func)} failed: {str(e)}")
+        finally:
+            connection.close_if_unusable_or_obsolete()
+
+    def submit(self, key: Any, func, *args) -> Future:
+        """Run ``func(*args)`` after every job already submitted for ``key``"""
+        with self._lock:
+            future = self._executor.submit(self._run, self._last.get(key), func, args)
+            self._last[key] = future
+
+        def _forget(done):
+            with self._lock:
+                if self._last.get(key) is done:
+                    del self._last[key]
+
+        future.add_done_callback(_forget)
+        return future
+
+    def pending(self, key: Any) -> Optional[Future]:
+        """The last job submitted for ``key`` if it has not finished yet"""
+        with self._lock:
+            return self._last.get(key)
+
+
+# One bounded pool shared by every agent run, so thread count stays flat under load
+_write_executor = OrderedExecutor(getattr(settings, 'MEMORY_WRITE_WORKERS', 2), 'memory-writer')
+# LLM summarization is slow, so it gets its own pool and never delays message writes
+_summary_executor = OrderedExecutor(getattr(settings, 'MEMORY_SUMMARY_WORKERS', 2), 'memory-summarizer')
+
+
+def append_messages(collection: MemoryCollection, messages: Iterable[Tuple[str, str]],
+                    window_size: int, trim: bool = True) -> Optional[int]:
+    """
+    Append (role, content) messages to a collection and trim it to the window
+
+    Sequence numbers are reserved with a single counter update, the messages are
+    written with one bulk insert and everything older than the window is removed
+    with one DELETE on the (collection, seq) index. With ``trim=False`` old
+    messages are kept for compact_collection() to fold into the summary.
+
+    Returns:
+        The collection version after the write, or None if there was nothing to write
+    """
+    messages = list(messages)
+    if not messages:
+        return None
+
+    with transaction.atomic():
+        # The UPDATE locks the collection row, so concurrent appends get disjoint ranges
+        MemoryCollection.objects.filter(pk=collection.pk).update(
+            last_seq=F('last_seq') + len(messages),
+            version=F('version') + 1
+        )
+        last_seq, version = MemoryCollection.objects.filter(pk=collection.pk).values_list('last_seq', 'version').get()
+
+        first_seq = last_seq - len(messages) + 1
+        MemoryMessage.objects.bulk_create([
+            MemoryMessage(collection=collection, role=role, content=content, seq=first_seq + offset)
+            for offset, (role, content) in enumerate(messages)
+        ])
+        if trim:
+            MemoryMessage.objects.filter(collection=collection, seq__lte=last_seq - window_size).delete()
+
+    collection.last_seq = last_seq
+    collection.version = version
+    return version
+
+
+def load_window(collection: MemoryCollection, window_size: int) -> List[Tuple[str, str]]:
+    """Return the newest ``window_size`` messages as (role, content), oldest first"""
+    rows = MemoryMessage.objects.filter(collection=collection).order_by('-seq').values_list('role', 'content')
+    return list(reversed(rows[:window_size]))
+
+
+async def aload_window(collection: MemoryCollection, window_size: int) -> List[Tuple[str, str]]:
+    """Async version of load_window using the async ORM"""
+    rows = MemoryMessage.objects.filter(collection=collection).order_by('-seq').values_list('role', 'content')
+    return list(reversed([row async for row in rows[:window_size]]))
+
+
+def clear_messages(collection: MemoryCollection) -> None:
+    """Delete every message in a collection along with its summary"""
+    with transaction.atomic():
+        MemoryMessage.objects.filter(collection=collection).delete()
+        MemoryCollection.objects.filter(pk=collection.pk).update(
+            version=F('version') + 1,
+            summary='',
+            summary_seq=F('last_seq')
+        )
+
+
+def compact_collection(collection: MemoryCollection, window_size: int, summarize: Summarizer) -> None:
+    """Fold messages that fell out of the window into the collection summary, then delete them"""
+    summary, summary_seq, last_seq = MemoryCollection.objects.filter(pk=collection.pk).values_list(
+        'summary', 'summary_seq', 'last_seq'
+    ).get()
+    cutoff = last_seq - window_size
+    if cutoff <= summary_seq:
+        return
+
+    rows = list(MemoryMessage.objects.filter(
+        collection=collection, seq__gt=summary_seq, seq__lte=cutoff
+    ).order_by('seq').values_list('role', 'content'))
+    new_summary = summarize(summary, rows) if rows else summary
+
+    with transaction.atomic():
+        # Only the compaction that still sees the same summary_seq may commit
+        updated = MemoryCollection.objects.filter(pk=collection.pk, summary_seq=summary_seq).update(
+            summary=new_summary,
+            summary_seq=cutoff
+        )
+        if updated:
+            MemoryMessage.objects.filter(collection=collection, seq__lte=cutoff).delete()
+
+
+def build_summary_prompt(summary: str, turns: List[Tuple[str, str]]) -> str:
+    """Prompt asking an LLM to merge new turns into an existing summary"""
+    transcript = '\n'.join(f"{role}: {content}" for role, content in turns)
+    return f"Existing summary:\n{summary or '(none)'}\n\nNew conversation turns:\n{transcript}"
+
+
+def to_alith_messages(rows: Iterable[Tuple[str, str]]) -> List:
+    """Convert (role, content) rows to Alith message objects"""
+    from alith import MessageBuilder
+
+    builders = {
+        'user': MessageBuilder.new_human_message,
+        'assistant': MessageBuilder.new_ai_message,
+        'system': MessageBuilder.new_system_message,
+    }
+    return [builders.get(role, MessageBuilder.new_tool_message)(content) for role, content in rows]
+
+
+def submit_write(collection_id: Any, func, *args) -> Future:
+    """Run ``func(*args)`` on the shared writer pool after earlier writes to the same collection"""
+    return _write_executor.submit(collection_id, func, *args)
+
+
+async def await_writes(collection_id: Any) -> None:
+    """Wait until queued writes to a collection have been committed"""
+    future = _write_executor.pending(collection_id)
+    if future is not None:
+        await asyncio.wrap_future(future)
+
+
+class MemoryWindowCache:
+    """Process-local LRU of built message windows, keyed by collection id"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: 'OrderedDict[Any, Tuple[int, int, List]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, collection_id: Any, version: int, window_size: int) -> Optional[List]:
+        """Return the cached window if it was built for this version and window size"""
+        with self._lock:
+            entry = self._entries.get(collection_id)
+            if entry is None or entry[0] != version or entry[1] != window_size:
+                return None
+            self._entries.move_to_end(collection_id)
+            return list(entry[2])
+
+    def put(self, collection_id: Any, version: int, window_size: int, messages: List) -> None:
+        with self._lock:
+            self._entries[collection_id] = (version, window_size, list(messages))
+            self._entries.move_to_end(collection_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_id: Any) -> None:
+        with self._lock:
+            self._entries.pop(collection_id, None)
+
+
+memory_window_cache = MemoryWindowCache(getattr(settings, 'MEMORY_WINDOW_CACHE_SIZE', 256))
+
+
+class MessageWindow:
+    """
+    In-memory conversation window for Alith agents
+
+    Keeps at most ``window_size`` messages. With a ``token_budget`` only the newest
+    messages fitting in that many estimated tokens are handed to the agent. With
+    ``compaction`` enabled, messages pushed out of the window are folded into a
+    running summary by ``compact()``, which is prepended as a system message.
+    """
+
+    def __init__(self, window_size: int, messages: Optional[List] = None, token_budget: Optional[int] = None,
+                 compaction: bool = False, summary: str = ''):
+        self.window_size = window_size
+        self.token_budget = token_budget
+        self.compaction = compaction
+        self.summary = summary
+        self._messages = list(messages or [])[-window_size:]
+        self._overflow: List[Tuple[str, str]] = []
+
+    def set_token_budget(self, token_budget: Optional[int]) -> None:
+        self.token_budget = token_budget
+
+    def _append(self, message, role: str, content: str) -> None:
+        self._messages.append(message)
+        dropped = self._messages[:-self.window_size]
+        self._messages = self._messages[-self.window_size:]
+        if self.compaction:
+            self._overflow.extend((msg.role, msg.content) for msg in dropped)
+
+    def add_user_message(self, content: str):
+        from alith import MessageBuilder
+        self._append(MessageBuilder.new_human_message(content), 'user', content)
+
+    def add_ai_message(self, content: str):
+        from alith import MessageBuilder
+        self._append(MessageBuilder.new_ai_message(content), 'assistant', content)
+
+    def add_message(self, message):
+        self._append(message, message.role, message.content)
+
+    def messages(self) -> List:
+        messages = self._messages
+        if self.token_budget is not None:
+            summary_tokens = estimate_message_tokens(SUMMARY_PREFIX + self.summary) if self.summary else 0
+            messages = trim_to_token_budget(messages, max(self.token_budget - summary_tokens, 0))
+        if self.summary:
+            from alith import MessageBuilder
+            messages = [MessageBuilder.new_system_message(SUMMARY_PREFIX + self.summary)] + messages
+        return messages
+
+    def to_string(self) -> str:
+        return '\n'.join([f"{msg.role}: {msg.content}" for msg in self.messages()])
+
+    def clear(self):
+        self._messages = []
+        self._overflow = []
+        self.summary = ''
+
+    def compact(self, summarize: Summarizer) -> Optional[Future]:
+        """Fold overflowed messages into the summary in the background"""
+        overflow, self._overflow = self._overflow, []
+        if not overflow:
+            return None
+
+        def _compact():
+            self.summary = summarize(self.summary, overflow)
+
+        return _summary_executor.submit(id(self), _compact)
+
+
+class BufferedDBMemory(MessageWindow):
+    """
+    Alith memory backed by a MemoryCollection
+
+    The window is read once when the agent starts, from memory_window_cache when
+    the collection version is unchanged. New messages are kept in memory and
+    written in one background batch by ``flush()`` after the agent responds; the
+    cache is updated once that write has committed (write-through). The summary
+    lives on the collection and is re-read on every load.
+    """
+
+    def __init__(self, collection: MemoryCollection, window_size: int, messages: Optional[List] = None,
+                 version: int = 0, token_budget: Optional[int] = None, compaction: bool = False,
+                 summary: str = ''):
+        super().__init__(window_size, messages, token_budget, compaction, summary)
+        self.collection = collection
+        self.version = version
+        self._pending: List[Tuple[str, str]] = []
+        self._overflowed = False
+
+    @classmethod
+    async def load(cls, collection: MemoryCollection, window_size: int, token_budget: Optional[int] = None,
+                   compaction: bool = False) -> 'BufferedDBMemory':
+        """Build the memory from the stored window, after any in-flight writes land"""
+        await await_writes(collection.pk)
+
+        # One primary-key lookup tells whether another process changed the collection
+        version, summary = await MemoryCollection.objects.filter(pk=collection.pk).values_list(
+            'version', 'summary'
+        ).aget()
+        messages = memory_window_cache.get(collection.pk, version, window_size)
+        if messages is None:
+            messages = to_alith_messages(await aload_window(collection, window_size))
+            memory_window_cache.put(collection.pk, version, window_size, messages)
+
+        return cls(collection, window_size, messages, version, token_budget, compaction, summary)
+
+    def _append(self, message, role: str, content: str) -> None:
+        # Dropped messages stay in the database until compact_collection() folds them
+        self._overflowed = self._overflowed or len(self._messages) >= self.window_size
+        self._messages = (self._messages + [message])[-self.window_size:]
+        self._pending.append((role, content))
+
+    def clear(self):
+        self._messages = []
+        self._pending = []
+        self.summary = ''
+        self.version += 1
+        memory_window_cache.invalidate(self.collection.pk)
+        submit_write(self.collection.pk, clear_messages, self.collection)
+
+    def flush(self) -> Optional[Future]:
+        """Queue pending messages for a single background insert without blocking"""
+        pending, self._pending = self._pending, []
+        if not pending:
+            return None
+
+        expected_version = self.version + 1
+        self.version = expected_version
+        messages = list(self._messages)
+
+        def append_and_cache():
+            version = append_messages(self.collection, pending, self.window_size, not self.compaction)
+            # Cache the window only once it is stored, and only if no other process
+            # wrote since it was read, otherwise this copy is missing their turns
+            if version == expected_version:
+                memory_window_cache.put(self.collection.pk, version, self.window_size, messages)
+
+        return submit_write(self.collection.pk, append_and_cache)
+
+    def compact(self, summarize: Summarizer) -> Optional[Future]:
+        """Fold messages that left the window into the stored summary once pending writes land"""
+        if not self.compaction or not self._overflowed:
+            return None
+        self._overflowed = False
+        write = _write_executor.pending(self.collection.pk)
+
+        def _compact():
+            if write is not None:
+                write.result()
+            compact_collection(self.collection, self.window_size, summarize)
+
+        return _summary_executor.submit(self.collection.pk, _compact)
+
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0006_idempotencykey'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodePayload',
+            fields=[
+                ('content_hash', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('data', models.BinaryField()),
+                ('size', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='NodeRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_id', models.CharField(max_length=255)),
+                ('node_type', models.CharField(blank=True, max_length=100)),
+                ('position', models.PositiveIntegerField(default=0)),
+                ('status', models.CharField(max_length=50)),
+                ('start_time', models.FloatField(blank=True, null=True)),
+                ('end_time', models.FloatField(blank=True, null=True)),
+                ('duration_ms', models.FloatField(default=0)),
+                ('error', models.TextField(blank=True)),
+                ('execution', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='node_runs', to='workflows.workflowexecution')),
+                ('input_payload', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='input_runs', to='workflows.nodepayload')),
+                ('output_payload', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='output_runs', to='workflows.nodepayload')),
+            ],
+            options={
+                'ordering': ['execution', 'position'],
+                'indexes': [models.Index(fields=['execution', 'node_id'], name='workflows_n_executi_65f0cd_idx'), models.Index(fields=['node_type', 'status'], name='workflows_n_node_ty_8a12d5_idx')],
+            },
+        ),
+    ]
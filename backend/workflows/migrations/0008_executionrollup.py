@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0007_noderun_nodepayload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExecutionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('node_type', models.CharField(blank=True, max_length=100)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('error_count', models.PositiveIntegerField(default=0)),
+                ('total_duration_ms', models.FloatField(default=0)),
+                ('buckets', models.JSONField(default=dict)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('workflow', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='workflows.workflow')),
+            ],
+            options={
+                'unique_together': {('workflow', 'node_type')},
+            },
+        ),
+    ]
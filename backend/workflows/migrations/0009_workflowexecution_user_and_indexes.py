@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def backfill_execution_user(apps, schema_editor):
+    """Copy the owning workflow's user onto existing executions"""
+    Workflow = apps.get_model('workflows', 'Workflow')
+    WorkflowExecution = apps.get_model('workflows', 'WorkflowExecution')
+    WorkflowExecution.objects.filter(user__isnull=True).update(
+        user=models.Subquery(
+            Workflow.objects.filter(pk=models.OuterRef('workflow_id')).values('user')[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0008_executionrollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workflowexecution',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='workflow_executions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.RunPython(backfill_execution_user, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='workflowexecution',
+            index=models.Index(fields=['workflow', '-started_at'], name='workflows_w_workflo_fbfff8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workflowexecution',
+            index=models.Index(fields=['status', '-started_at'], name='workflows_w_status_fa67fe_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workflowexecution',
+            index=models.Index(fields=['user', '-started_at'], name='workflows_w_user_id_e08858_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workflowexecution',
+            index=models.Index(fields=['user', 'status', '-started_at'], name='workflows_w_user_id_0d8a72_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:48
+
+from django.db import migrations, models
+
+
+def backfill_message_seq(apps, schema_editor):
+    """Number existing messages by timestamp within each collection"""
+    MemoryCollection = apps.get_model('workflows', 'MemoryCollection')
+    MemoryMessage = apps.get_model('workflows', 'MemoryMessage')
+    for collection in MemoryCollection.objects.all():
+        messages = list(MemoryMessage.objects.filter(collection=collection).order_by('timestamp', 'id'))
+        for seq, message in enumerate(messages, start=1):
+            message.seq = seq
+        MemoryMessage.objects.bulk_update(messages, ['seq'], batch_size=500)
+        collection.last_seq = len(messages)
+        collection.save(update_fields=['last_seq'])
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0009_workflowexecution_user_and_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorycollection',
+            name='last_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='memorymessage',
+            name='seq',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_message_seq, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='memorymessage',
+            index=models.Index(fields=['collection', 'seq'], name='workflows_m_collect_9a8da9_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:50
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0010_memorymessage_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorycollection',
+            name='version',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 23:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0011_memorycollection_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='memorycollection',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='memorycollection',
+            name='summary_seq',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:02
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('workflows', '0012_memorycollection_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AlterUniqueTogether(
+            name='memorycollection',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='memorycollection',
+            name='session',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='memorycollection',
+            unique_together={('user', 'name', 'session')},
+        ),
+        migrations.AddIndex(
+            model_name='memorycollection',
+            index=models.Index(fields=['name', 'session'], name='workflows_m_name_e48e1a_idx'),
+        ),
+    ]
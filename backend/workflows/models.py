@@ -3,6 +3,7 @@ Django models for workflows
 """
 from django.db import models
 from django.contrib.auth.models import User
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 
 
@@ -32,6 +33,8 @@ class WorkflowExecution(models.Model):
     """Workflow execution history"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE, related_name='executions')
+    # Denormalized from workflow.user so history listings avoid the join
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='workflow_executions', null=True, blank=True)
     status = models.CharField(max_length=50, choices=[
         ('running', 'Running'),
         ('completed', 'Completed'),
@@ -47,11 +50,96 @@ class WorkflowExecution(models.Model):
     
     class Meta:
         ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=['workflow', '-started_at']),
+            models.Index(fields=['status', '-started_at']),
+            models.Index(fields=['user', '-started_at']),
+            models.Index(fields=['user', 'status', '-started_at']),
+        ]
     
     def __str__(self):
         return f"{self.workflow.name} - {self.status} - {self.started_at}"
 
 
+class NodePayload(models.Model):
+    """Compressed node input/output payload, deduplicated by content hash"""
+    content_hash = models.CharField(max_length=64, primary_key=True)
+    data = models.BinaryField()  # zlib-compressed JSON
+    size = models.PositiveIntegerField(default=0)  # Uncompressed size in bytes
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"{self.content_hash[:12]} ({self.size} bytes)"
+
+
+class NodeRun(models.Model):
+    """Execution record of a single node within a workflow execution"""
+    execution = models.ForeignKey(WorkflowExecution, on_delete=models.CASCADE, related_name='node_runs')
+    node_id = models.CharField(max_length=255)
+    node_type = models.CharField(max_length=100, blank=True)
+    position = models.PositiveIntegerField(default=0)  # Order in which the node finished
+    status = models.CharField(max_length=50)
+    start_time = models.FloatField(null=True, blank=True)  # Epoch milliseconds, as recorded by the engine
+    end_time = models.FloatField(null=True, blank=True)
+    duration_ms = models.FloatField(default=0)
+    error = models.TextField(blank=True)
+    input_payload = models.ForeignKey(NodePayload, on_delete=models.SET_NULL, null=True, blank=True, related_name='input_runs')
+    output_payload = models.ForeignKey(NodePayload, on_delete=models.SET_NULL, null=True, blank=True, related_name='output_runs')
+    
+    class Meta:
+        ordering = ['execution', 'position']
+        indexes = [
+            models.Index(fields=['execution', 'node_id']),
+            models.Index(fields=['node_type', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.node_id} - {self.status}"
+
+
+class ExecutionRollup(models.Model):
+    """Running execution statistics per workflow and node type"""
+    workflow = models.ForeignKey(Workflow, on_delete=models.CASCADE, related_name='rollups')
+    node_type = models.CharField(max_length=100, blank=True)  # Empty for whole-workflow executions
+    count = models.PositiveIntegerField(default=0)
+    error_count = models.PositiveIntegerField(default=0)
+    total_duration_ms = models.FloatField(default=0)
+    buckets = models.JSONField(default=dict)  # Log-scale latency histogram, see analytics.LatencyHistogram
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = [['workflow', 'node_type']]
+    
+    def __str__(self):
+        return f"{self.workflow_id} {self.node_type or 'workflow'} ({self.count})"
+
+
+class IdempotencyKey(models.Model):
+    """Stored outcome of a request made with an Idempotency-Key header"""
+    STATUS_CHOICES = [
+        ('in_progress', 'In Progress'),
+        ('completed', 'Completed'),
+    ]
+    
+    key = models.CharField(max_length=255)
+    scope = models.CharField(max_length=255)  # User and endpoint the key was used on
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_progress')
+    response_status = models.PositiveSmallIntegerField(null=True, blank=True)
+    response_data = models.JSONField(null=True, blank=True, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = [['scope', 'key']]
+        indexes = [
+            models.Index(fields=['expires_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.key} ({self.status})"
+
+
 class MemoryCollection(models.Model):
     """Memory collection for storing conversation memory"""
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -60,16 +148,22 @@ class MemoryCollection(models.Model):
     workflow_id = models.CharField(max_length=255)
     node_id = models.CharField(max_length=255)
     window_size = models.IntegerField(default=20)
+    last_seq = models.BigIntegerField(default=0)  # Highest MemoryMessage.seq handed out
+    version = models.BigIntegerField(default=0)  # Bumped on every change to the messages
+    summary = models.TextField(blank=True, default='')  # Running summary of compacted turns
+    summary_seq = models.BigIntegerField(default=0)  # Last MemoryMessage.seq folded into the summary
+    session = models.CharField(max_length=64, blank=True, default='')  # Conversation within the memory node, '' when shared
     description = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['-created_at']
-        # Make name unique per user
-        unique_together = [['user', 'name']]
+        # Make name unique per user and conversation session
+        unique_together = [['user', 'name', 'session']]
         indexes = [
             models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['name', 'session']),
         ]
     
     def __str__(self):
@@ -87,10 +181,14 @@ class MemoryMessage(models.Model):
         ('tool', 'Tool')
     ])
     content = models.TextField()
+    seq = models.BigIntegerField(default=0)  # Increases monotonically within a collection
     timestamp = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['timestamp']
+        indexes = [
+            models.Index(fields=['collection', 'seq']),
+        ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
@@ -1,102 +1,40 @@
 """
 AI Node Executors using Alith SDK
 """
-from typing import Dict, Any, List
+from typing import Callable, Dict, Any, List, Optional
 from .base import BaseNodeExecutor, NodeExecutionError
-import os
+import asyncio
 import json
-from datetime import datetime
+import re
 
 
-class AgentFlowDBMemory:
-    """Custom memory class that uses Django database for persistent storage"""
-    
-    def __init__(self, collection, window_size: int = 20):
-        self.collection = collection
-        self.window_size = window_size
-    
-    def add_user_message(self, content: str):
-        """Add a user message to memory"""
-        from ..models import MemoryMessage
-        MemoryMessage.objects.create(
-            collection=self.collection,
-            role='user',
-            content=content,
-            timestamp=datetime.now()
-        )
-        self._enforce_window_size()
-    
-    def add_ai_message(self, content: str):
-        """Add an AI message to memory"""
-        from ..models import MemoryMessage
-        MemoryMessage.objects.create(
-            collection=self.collection,
-            role='assistant',
-            content=content,
-            timestamp=datetime.now()
-        )
-        self._enforce_window_size()
-    
-    def add_message(self, message):
-        """Add a message object to memory"""
-        from ..models import MemoryMessage
-        MemoryMessage.objects.create(
-            collection=self.collection,
-            role=message.role,
-            content=message.content,
-            timestamp=datetime.now()
-        )
-        self._enforce_window_size()
-    
-    def messages(self) -> List:
-        """Get all messages from memory"""
-        from ..models import MemoryMessage
-        from alith import MessageBuilder
-        
-        db_messages = MemoryMessage.objects.filter(
-            collection=self.collection
-        ).order_by('timestamp')
-        
-        # Convert to Alith message objects
-        messages = []
-        for msg in db_messages:
-            if msg.role == 'user':
-                message = MessageBuilder.new_human_message(msg.content)
-            elif msg.role == 'assistant':
-                message = MessageBuilder.new_ai_message(msg.content)
-            elif msg.role == 'system':
-                message = MessageBuilder.new_system_message(msg.content)
-            else:
-                message = MessageBuilder.new_tool_message(msg.content)
-            
-            messages.append(message)
-        
-        return messages
-    
-    def to_string(self) -> str:
-        """Convert memory to string format"""
-        messages = self.messages()
-        return '\n'.join([f"{msg.role}: {msg.content}" for msg in messages])
+# "3. positive" / "3) positive" lines of a numbered batch answer
+NUMBERED_LINE = re.compile(r'^\s*(\d+)\s*[.):-]\s*(.*?)\s*$')
+
+
+def parse_numbered_answers(response: str, count: int) -> Dict[int, str]:
+    """Map 1-based item numbers to their answers, ignoring lines outside 1..count"""
+    answers = {}
+    for line in response.splitlines():
+        match = NUMBERED_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= count and match.group(2):
+            answers.setdefault(int(match.group(1)), match.group(2))
+    return answers
+
+
+def parse_sentiment(result: str):
+    """Split "positive 0.9" style answers into (sentiment, confidence)"""
+    parts = result.lower().split()
+    sentiment = parts[0].strip('.,:;') if parts else 'neutral'
+    confidence = 0.5
     
-    def clear(self):
-        """Clear all messages from memory"""
-        from ..models import MemoryMessage
-        MemoryMessage.objects.filter(collection=self.collection).delete()
+    try:
+        if len(parts) > 1:
+            confidence = float(parts[1].strip('(),'))
+    except ValueError:
+        pass
     
-    def _enforce_window_size(self):
-        """Remove oldest messages if we exceed window size"""
-        from ..models import MemoryMessage
-        
-        total_messages = MemoryMessage.objects.filter(collection=self.collection).count()
-        if total_messages > self.window_size:
-            # Delete oldest messages
-            messages_to_delete = total_messages - self.window_size
-            oldest_messages = MemoryMessage.objects.filter(
-                collection=self.collection
-            ).order_by('timestamp')[:messages_to_delete]
-            
-            for msg in oldest_messages:
-                msg.delete()
+    return sentiment, confidence
 
 
 class AINodeExecutor(BaseNodeExecutor):
@@ -125,6 +63,74 @@ class AINodeExecutor(BaseNodeExecutor):
         
         return await handler(inputs, context)
     
+    async def _cached_prompt(self, call: Callable[[], str], context: Dict[str, Any], model: str,
+                             preamble: str, prompt: str, provider: str = 'openai',
+                             temperature: Optional[float] = None, max_tokens: Optional[int] = None,
+                             threaded: bool = False, always: bool = False) -> str:
+        """
+        Run a model call, or reuse the stored response when the node has cacheResponses on
+        
+        ``temperature`` and ``max_tokens`` must be the values ``call`` generates
+        with, None where it leaves them to the provider default. With ``threaded``
+        the call runs in a worker thread so several can be awaited concurrently.
+        ``always`` caches regardless of cacheResponses.
+        """
+        if not (always or self.get_property('cacheResponses', False)):
+            if threaded:
+                from asgiref.sync import sync_to_async
+                return await sync_to_async(call, thread_sensitive=False)()
+            return call()
+        
+        from ..response_cache import response_cache
+        key = response_cache.key(provider, model, preamble, prompt, temperature, max_tokens)
+        # Hit/miss counts end up in this node's state
+        stats = context.setdefault('cache', {'hits': 0, 'misses': 0})
+        return await response_cache.aget_or_call(key, call, stats)
+    
+    async def _prompt_numbered(self, texts: List[str], instructions: str, context: Dict[str, Any],
+                               model: str = 'gpt-4-turbo') -> List[Optional[str]]:
+        """
+        Get one answer per text, packing ``batchSize`` texts into each numbered prompt
+        
+        Up to ``maxConcurrentBatches`` batches are in flight at once. Items missing
+        from a batch answer are retried on their own; answers still missing are None.
+        """
+        from alith import Agent
+        
+        batch_size = max(int(self.get_property('batchSize', 20)), 1)
+        semaphore = asyncio.Semaphore(max(int(self.get_property('maxConcurrentBatches', 4)), 1))
+        preamble = (
+            f"{instructions} You will receive numbered texts. Answer every text on its own line as "
+            "'<number>. <answer>', in the same order, with no other output."
+        )
+        api_key = context.get('openai_api_key')
+        
+        async def run_batch(batch: List[str]) -> Dict[int, str]:
+            # Newlines inside an item would break the one-line-per-item format
+            prompt = "\n".join(f"{number}. {' '.join(text.split())}" for number, text in enumerate(batch, 1))
+            # One Agent per call, calls run concurrently in worker threads
+            call = lambda: Agent(name=self.label, model=model, api_key=api_key, preamble=preamble).prompt(prompt)
+            async with semaphore:
+                response = await self._cached_prompt(call, context, model, preamble, prompt, threaded=True)
+            return parse_numbered_answers(response, len(batch))
+        
+        batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+        self.log_execution(f"Processing {len(texts)} texts in {len(batches)} batches of up to {batch_size}")
+        results = await asyncio.gather(*(run_batch(batch) for batch in batches))
+        
+        answers: List[Optional[str]] = []
+        for batch, batch_answers in zip(batches, results):
+            answers.extend(batch_answers.get(number) for number in range(1, len(batch) + 1))
+        
+        missing = [index for index, answer in enumerate(answers) if answer is None]
+        if missing:
+            self.log_execution(f"Retrying {len(missing)} texts missing from batch answers", 'warning')
+            retried = await asyncio.gather(*(run_batch([texts[index]]) for index in missing))
+            for index, retry in zip(missing, retried):
+                answers[index] = retry.get(1)
+        
+        return answers
+    
     async def _execute_ai_agent(self, inputs: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         """Execute AI Agent node"""
         try:
@@ -151,10 +157,19 @@ class AINodeExecutor(BaseNodeExecutor):
             
             # Create memory if provided
             memory = None
+            memory_key = None
+            token_budget = None
             if memory_input:
                 # Get window size from memory input (could be windowSize or maxMessages for legacy)
                 window_size = memory_input.get('window_size', memory_input.get('maxMessages', 20))
                 memory_type = memory_input.get('type', 'WindowBufferMemory')
+                # In 'tokens' mode the window is also bounded by an estimated token budget
+                if memory_input.get('window_mode') == 'tokens':
+                    token_budget = memory_input.get('token_budget', 2000)
+                
+                # Every chat user/session gets its own window instead of sharing the node's
+                from ..memory_store import session_key
+                session = session_key(context.get('trigger_data'))
                 
                 # Handle different memory types
                 if memory_type == 'AgentFlowDBMemory':
@@ -172,6 +187,7 @@ class AINodeExecutor(BaseNodeExecutor):
                         with transaction.atomic():
                             collection, created = MemoryCollection.objects.get_or_create(
                                 name=collection_name,
+                                session=session,
                                 defaults={
                                     'workflow_id': workflow_id,
                                     'node_id': self.node_id,
@@ -184,141 +200,15 @@ class AINodeExecutor(BaseNodeExecutor):
                     collection, created = await get_or_create_collection()
                     
                     if created:
-                        self.log_execution(f"Created new database memory collection: {collection_name}")
+                        self.log_execution(f"Created new database memory collection: {collection_name} (session '{session}')")
                     else:
-                        self.log_execution(f"Loaded existing database memory collection: {collection_name}")
-                    
-                    # Create a custom memory class that uses Django database with proper persistence
-                    # We'll use a thread-safe approach to avoid async context issues
-                    import threading
-                    from concurrent.futures import ThreadPoolExecutor
-                    
-                    class ThreadSafeDBMemory:
-                        def __init__(self, collection, window_size):
-                            self.collection = collection
-                            self.window_size = window_size
-                            self._messages = []
-                            self._executor = ThreadPoolExecutor(max_workers=1)
-                            self._load_messages_from_db()
-                        
-                        def _load_messages_from_db(self):
-                            """Load messages from database using thread pool"""
-                            def _load():
-                                try:
-                                    from ..models import MemoryMessage
-                                    db_messages = MemoryMessage.objects.filter(
-                                        collection=self.collection
-                                    ).order_by('timestamp')
-                                    
-                                    from alith import MessageBuilder
-                                    messages = []
-                                    for msg in db_messages:
-                                        if msg.role == 'user':
-                                            message = MessageBuilder.new_human_message(msg.content)
-                                        elif msg.role == 'assistant':
-                                            message = MessageBuilder.new_ai_message(msg.content)
-                                        elif msg.role == 'system':
-                                            message = MessageBuilder.new_system_message(msg.content)
-                                        else:
-                                            message = MessageBuilder.new_tool_message(msg.content)
-                                        
-                                        messages.append(message)
-                                    return messages
-                                except Exception as e:
-                                    print(f"Error loading messages from DB: {e}")
-                                    return []
-                            
-                            try:
-                                future = self._executor.submit(_load)
-                                self._messages = future.result(timeout=5)
-                            except Exception as e:
-                                print(f"Error in thread pool: {e}")
-                                self._messages = []
-                        
-                        def add_user_message(self, content: str):
-                            from alith import MessageBuilder
-                            message = MessageBuilder.new_human_message(content)
-                            self._messages.append(message)
-                            self._enforce_window_size()
-                            self._save_to_db('user', content)
-                        
-                        def add_ai_message(self, content: str):
-                            from alith import MessageBuilder
-                            message = MessageBuilder.new_ai_message(content)
-                            self._messages.append(message)
-                            self._enforce_window_size()
-                            self._save_to_db('assistant', content)
-                        
-                        def add_message(self, message):
-                            self._messages.append(message)
-                            self._enforce_window_size()
-                            self._save_to_db(message.role, message.content)
-                        
-                        def messages(self):
-                            return self._messages
-                        
-                        def to_string(self):
-                            return '\n'.join([f"{msg.role}: {msg.content}" for msg in self._messages])
-                        
-                        def clear(self):
-                            self._messages.clear()
-                            def _clear():
-                                try:
-                                    from ..models import MemoryMessage
-                                    MemoryMessage.objects.filter(collection=self.collection).delete()
-                                except Exception as e:
-                                    print(f"Error clearing DB messages: {e}")
-                            
-                            try:
-                                future = self._executor.submit(_clear)
-                                future.result(timeout=5)
-                            except Exception as e:
-                                print(f"Error in clear thread: {e}")
-                        
-                        def _enforce_window_size(self):
-                            if len(self._messages) > self.window_size:
-                                # Remove oldest messages
-                                messages_to_remove = len(self._messages) - self.window_size
-                                self._messages = self._messages[messages_to_remove:]
-                        
-                        def _save_to_db(self, role: str, content: str):
-                            """Save message to database using thread pool"""
-                            def _save():
-                                try:
-                                    from ..models import MemoryMessage
-                                    MemoryMessage.objects.create(
-                                        collection=self.collection,
-                                        role=role,
-                                        content=content,
-                                        timestamp=datetime.now()
-                                    )
-                                    self._enforce_window_size_db()
-                                except Exception as e:
-                                    print(f"Error saving to DB: {e}")
-                            
-                            try:
-                                future = self._executor.submit(_save)
-                                future.result(timeout=5)
-                            except Exception as e:
-                                print(f"Error in save thread: {e}")
-                        
-                        def _enforce_window_size_db(self):
-                            """Enforce window size in database"""
-                            try:
-                                from ..models import MemoryMessage
-                                total_messages = MemoryMessage.objects.filter(collection=self.collection).count()
-                                if total_messages > self.window_size:
-                                    messages_to_delete = total_messages - self.window_size
-                                    oldest_messages = MemoryMessage.objects.filter(
-                                        collection=self.collection
-                                    ).order_by('timestamp')[:messages_to_delete]
-                                    
-                                    for msg in oldest_messages:
-                                        msg.delete()
-                            except Exception as e:
-                                print(f"Error enforcing DB window size: {e}")
+                        self.log_execution(f"Loaded existing database memory collection: {collection_name} (session '{session}')")
                     
-                    memory = ThreadSafeDBMemory(collection, window_size)
+                    # Reads the window once; new turns are written in the background after the response
+                    from ..memory_store import BufferedDBMemory
+                    memory = await BufferedDBMemory.load(
+                        collection, window_size, token_budget, bool(memory_input.get('compaction'))
+                    )
                     
                     # Get message count
                     message_count = len(memory.messages())
@@ -330,13 +220,26 @@ class AINodeExecutor(BaseNodeExecutor):
                     # Handle both ExecutionContext object and dict
                     workflow_id = context.workflow_id if hasattr(context, 'workflow_id') else context.get('workflow_id', 'unknown')
                     memory_key = f"memory_{self.node_id}_{workflow_id}"
+                    if session:
+                        memory_key = f"{memory_key}_{session}"
                     
-                    if memory_key in _global_memory_storage:
-                        memory = _global_memory_storage[memory_key]
+                    # Windows evicted from the bounded store are rehydrated from the database
+                    memory = await _global_memory_storage.aget(memory_key)
+                    
+                    if token_budget is not None or memory_input.get('compaction'):
+                        from ..memory_store import MessageWindow
+                        if not isinstance(memory, MessageWindow):
+                            # Keep any history from a message-count window when switching modes
+                            memory = MessageWindow(window_size, memory.messages() if memory else [])
+                            await _global_memory_storage.aput(memory_key, memory, window_size, workflow_id, self.node_id)
+                        memory.set_token_budget(token_budget)
+                        memory.compaction = bool(memory_input.get('compaction'))
+                        self.log_execution(f"Using window memory with token budget {token_budget}, compaction {memory.compaction}")
+                    elif memory is not None:
                         self.log_execution(f"Loaded existing WindowBufferMemory with {len(memory.messages())} messages")
                     else:
                         memory = WindowBufferMemory(window_size=window_size)
-                        _global_memory_storage[memory_key] = memory
+                        await _global_memory_storage.aput(memory_key, memory, window_size, workflow_id, self.node_id)
                         self.log_execution(f"Created new WindowBufferMemory with window_size: {window_size}")
                 
                 # Log current memory state
@@ -358,25 +261,25 @@ class AINodeExecutor(BaseNodeExecutor):
             if not api_key:
                 if model.startswith('llama-') or model.startswith('mixtral-') or model.startswith('gemma-'):
                     # Use Groq API key
-                    api_key = context.get('groq_api_key') or os.getenv('GROQ_API_KEY')
+                    api_key = context.get('groq_api_key')
                     if not api_key:
                         raise NodeExecutionError("Groq API key not found. Please configure it in the chat model node settings.")
                     base_url = base_url or "https://api.groq.com/openai/v1"
                 elif model.startswith('claude-'):
                     # Use Anthropic API key
-                    api_key = context.get('anthropic_api_key') or os.getenv('ANTHROPIC_API_KEY')
+                    api_key = context.get('anthropic_api_key')
                     if not api_key:
                         raise NodeExecutionError("Anthropic API key not found. Please configure it in the chat model node settings.")
                     base_url = base_url or "https://api.anthropic.com/v1"
                 elif model.startswith('gemini-'):
                     # Use Google API key
-                    api_key = context.get('google_api_key') or os.getenv('GOOGLE_API_KEY')
+                    api_key = context.get('google_api_key')
                     if not api_key:
                         raise NodeExecutionError("Google API key not found. Please configure it in the chat model node settings.")
                     base_url = base_url or "https://generativelanguage.googleapis.com/v1"
                 else:
                     # Default to OpenAI
-                    api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+                    api_key = context.get('openai_api_key')
                     if not api_key:
                         raise NodeExecutionError("OpenAI API key not found. Please configure it in the chat model node settings.")
                     base_url = base_url or "https://api.openai.com/v1"
@@ -444,8 +347,32 @@ class AINodeExecutor(BaseNodeExecutor):
                     enhanced_system_prompt += f"\n\nAvailable tools:\n" + "\n".join(tool_info)
                     enhanced_system_prompt += "\n\nIMPORTANT: Only use the exact tool names listed above. Do not use alternative names like 'brave_search' - use the exact names provided."
             
+            # Recall earlier turns similar to this prompt that are no longer in the window
+            vector_index = None
+            if memory_input and memory_input.get('memory_type') == 'vector-memory':
+                from asgiref.sync import sync_to_async
+                from ..vector_memory import format_recall, get_embedder, get_vector_index, recall
+                
+                vector_index = get_vector_index(f"{workflow_id}:{self.node_id}:{memory_input.get('collection_name', 'default')}:{session}")
+                embedder = get_embedder(memory_input.get('embedding_model'))
+                query = main_input.get('text') or main_input.get('message') or main_input.get('prompt', '')
+                recalled = await sync_to_async(recall, thread_sensitive=False)(
+                    vector_index, embedder, query, memory_input.get('top_k', 4),
+                    len(memory.messages()), memory_input.get('min_score', 0.0)
+                )
+                if recalled:
+                    enhanced_system_prompt += "\n\n" + format_recall(recalled)
+                self.log_execution(f"Recalled {len(recalled)} messages from vector memory")
+            
             self.log_execution(f"Enhanced system prompt: {enhanced_system_prompt[:200]}...")
             
+            # Leave room for the system prompt and tool schemas inside the memory token budget
+            if token_budget is not None and memory_input.get('reserve_headroom'):
+                from ..token_budget import estimate_tokens, estimate_tool_tokens
+                headroom = estimate_tokens(enhanced_system_prompt) + estimate_tool_tokens(tool_instances)
+                memory.set_token_budget(max(token_budget - headroom, 0))
+                self.log_execution(f"Reserved {headroom} tokens of the memory budget for system prompt and tools")
+            
             # Create agent
             agent = Agent(
                 name=self.label,
@@ -471,8 +398,78 @@ class AINodeExecutor(BaseNodeExecutor):
                 if current_messages:
                     self.log_execution(f"Latest message: {current_messages[-1].content[:50]}...")
             
+            # Paraphrases of prompts this node already answered can be served from the semantic cache
+            semantic_cache = None
+            cached_response = None
+            if self.get_property('semanticCache', False):
+                from asgiref.sync import sync_to_async
+                from ..semantic_cache import agent_fingerprint, get_semantic_cache, similarity_threshold
+                
+                embedding_model = self.get_property('embeddingModel') or None
+                fingerprint = agent_fingerprint(model, system_prompt, tool_names, embedding_model)
+                workflow_id = context.get('workflow_id', 'unknown')
+                semantic_cache = get_semantic_cache(workflow_id, self.node_id, fingerprint, embedding_model)
+                cached_response, similarity, prompt_vector = await sync_to_async(semantic_cache.match, thread_sensitive=False)(
+                    prompt, similarity_threshold(self.get_property('semanticCacheThreshold'))
+                )
+                hit = cached_response is not None
+                context['cache'] = {'hits': int(hit), 'misses': int(not hit), 'similarity': round(similarity, 4)}
+                self.log_execution(f"Semantic cache {'hit' if hit else 'miss'} (similarity {similarity:.3f})")
+            
             # Execute
-            response = agent.prompt(prompt)
+            if cached_response is not None:
+                response = cached_response
+                # Keep the conversation history as if the agent had answered
+                if memory:
+                    memory.add_user_message(prompt)
+                    memory.add_ai_message(response)
+            else:
+                response = agent.prompt(prompt)
+                if semantic_cache is not None:
+                    from ..memory_store import submit_write
+                    submit_write(semantic_cache.directory, semantic_cache.add, prompt, response, prompt_vector)
+            
+            # Queue this turn's messages for persistence without waiting on the database
+            if hasattr(memory, 'flush'):
+                memory.flush()
+            elif memory_key:
+                # Save the grown window back to the memory backend
+                await _global_memory_storage.aput(memory_key, memory, window_size, workflow_id, self.node_id)
+            
+            # Embed this turn in the background so later prompts can recall it
+            if vector_index is not None:
+                from ..memory_store import submit_write
+                from ..vector_memory import remember
+                submit_write(vector_index.key, remember, vector_index, embedder, [('user', prompt), ('assistant', response)])
+            
+            # Fold turns that left the window into the running summary, off the response path
+            if memory_input.get('compaction') and hasattr(memory, 'compact'):
+                from ..memory_store import build_summary_prompt
+                summary_words = memory_input.get('summary_max_words', 200)
+                
+                def summarize(summary, turns):
+                    summarizer = Agent(
+                        name=f"{self.label} memory summarizer",
+                        model=model,
+                        api_key=api_key,
+                        base_url=base_url,
+                        preamble=(
+                            "You maintain a running summary of a conversation. Merge the new turns into the "
+                            "existing summary, keeping names, facts, decisions and open questions. "
+                            f"Reply with the updated summary only, in at most {summary_words} words."
+                        )
+                    )
+                    return summarizer.prompt(build_summary_prompt(summary, turns))
+                
+                compacted = memory.compact(summarize)
+                if compacted is not None and memory_key:
+                    # Save the new summary once it is ready, shared backends keep no live memory object.
+                    # The callback may run on this event loop, so the write goes to the writer pool.
+                    from ..memory_store import submit_write
+                    compacted.add_done_callback(
+                        lambda _: submit_write(memory_key, _global_memory_storage.put,
+                                               memory_key, memory, window_size, workflow_id, self.node_id)
+                    )
             
             # Log memory state after execution
             if memory:
@@ -500,7 +497,7 @@ class AINodeExecutor(BaseNodeExecutor):
         try:
             from alith import Agent
             
-            api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+            api_key = context.get('openai_api_key')
             if not api_key:
                 raise NodeExecutionError("OpenAI API key not found")
             
@@ -538,14 +535,13 @@ class AINodeExecutor(BaseNodeExecutor):
         try:
             from alith import Agent
             
-            # Get API key from node properties first, then context, then environment
-            api_key = self.get_property('api_key', '') or context.get('groq_api_key') or os.getenv('GROQ_API_KEY')
+            # Get API key from node properties first, then the resolved execution credentials
+            api_key = self.get_property('api_key', '') or context.get('groq_api_key')
             
             # Debug logging
             self.log_execution(f"Groq API key sources:")
             self.log_execution(f"  - Node properties: {self.properties}")
             self.log_execution(f"  - Context groq_api_key: {context.get('groq_api_key')}")
-            self.log_execution(f"  - Environment GROQ_API_KEY: {os.getenv('GROQ_API_KEY')}")
             self.log_execution(f"  - Final API key: {api_key[:10] + '...' if api_key else 'None'}")
             
             if not api_key:
@@ -605,7 +601,7 @@ class AINodeExecutor(BaseNodeExecutor):
         try:
             from alith import Agent
             
-            api_key = context.get('anthropic_api_key') or os.getenv('ANTHROPIC_API_KEY')
+            api_key = context.get('anthropic_api_key')
             if not api_key:
                 raise NodeExecutionError("Anthropic API key not found")
             
@@ -644,7 +640,7 @@ class AINodeExecutor(BaseNodeExecutor):
         try:
             from alith import Agent
             
-            api_key = context.get('google_api_key') or os.getenv('GOOGLE_API_KEY')
+            api_key = context.get('google_api_key')
             if not api_key:
                 raise NodeExecutionError("Google API key not found")
             
@@ -709,7 +705,7 @@ class AINodeExecutor(BaseNodeExecutor):
             store.save_docs(all_chunks)
             
             # Create agent with RAG
-            api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+            api_key = context.get('openai_api_key')
             agent = Agent(
                 name=self.label,
                 model='gpt-4-turbo',
@@ -744,16 +740,33 @@ class AINodeExecutor(BaseNodeExecutor):
             
             max_length = self.get_property('maxLength', 500)
             
-            api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+            # Texts longer than one chunk are summarized chunk by chunk, then the partial summaries are combined
+            from ..token_budget import estimate_tokens
+            mode = self.get_property('mode', 'auto')
+            if mode == 'map-reduce' or mode == 'auto' and estimate_tokens(text) > int(self.get_property('chunkSize', 2000)):
+                summary, chunk_count, levels = await self._summarize_map_reduce(text, max_length, context)
+                if summary is not None:
+                    return {
+                        'main': {
+                            'summary': summary,
+                            'original_length': len(text),
+                            'summary_length': len(summary),
+                            'chunks': chunk_count,
+                            'reduce_levels': levels
+                        }
+                    }
+            
+            api_key = context.get('openai_api_key')
+            preamble = f"You are a summarization assistant. Summarize the following text in approximately {max_length} words or less."
             agent = Agent(
                 name=self.label,
                 model='gpt-4-turbo',
                 api_key=api_key,
-                preamble=f"You are a summarization assistant. Summarize the following text in approximately {max_length} words or less."
+                preamble=preamble
             )
             
             self.log_execution(f"Summarizing text of length: {len(text)}")
-            summary = agent.prompt(text)
+            summary = await self._cached_prompt(lambda: agent.prompt(text), context, 'gpt-4-turbo', preamble, text)
             
             return {
                 'main': {
@@ -766,6 +779,57 @@ class AINodeExecutor(BaseNodeExecutor):
         except Exception as e:
             raise NodeExecutionError(f"Summarization execution failed: {str(e)}")
     
+    async def _summarize_map_reduce(self, text: str, max_length: int, context: Dict[str, Any],
+                                    model: str = 'gpt-4-turbo'):
+        """
+        Summarize ``chunkSize``-token chunks concurrently, then reduce the partial summaries hierarchically
+        
+        Every intermediate summary goes through the response cache keyed by its
+        input, so re-summarizing an edited document only calls the model for
+        changed chunks and the reduce steps above them.
+        
+        Returns:
+            (summary, number of chunks, number of levels), or (None, 1, 0) when the
+            text fits in a single chunk
+        """
+        from alith import Agent, chunk_text
+        
+        chunks = chunk_text(text, max_chunk_token_size=int(self.get_property('chunkSize', 2000)))
+        if len(chunks) <= 1:
+            return None, 1, 0
+        
+        fan_in = max(int(self.get_property('reduceFanIn', 8)), 2)
+        semaphore = asyncio.Semaphore(max(int(self.get_property('maxConcurrentChunks', 4)), 1))
+        api_key = context.get('openai_api_key')
+        map_preamble = (
+            "You are a summarization assistant. Summarize this section of a longer document in "
+            f"approximately {max_length} words or less, keeping key facts, names and figures."
+        )
+        reduce_preamble = (
+            "You are a summarization assistant. Combine these summaries of consecutive sections of one "
+            f"document into a single summary of approximately {max_length} words or less."
+        )
+        
+        async def summarize(preamble: str, prompt: str) -> str:
+            call = lambda: Agent(name=self.label, model=model, api_key=api_key, preamble=preamble).prompt(prompt)
+            async with semaphore:
+                return await self._cached_prompt(call, context, model, preamble, prompt, threaded=True, always=True)
+        
+        self.log_execution(f"Summarizing {len(chunks)} chunks, reducing {fan_in} summaries at a time")
+        partials = await asyncio.gather(*(summarize(map_preamble, chunk) for chunk in chunks))
+        
+        levels = 1
+        while len(partials) > 1:
+            groups = [partials[start:start + fan_in] for start in range(0, len(partials), fan_in)]
+            partials = await asyncio.gather(*(
+                summarize(reduce_preamble, "\n\n".join(f"Section {number}:\n{partial}" for number, partial in enumerate(group, 1)))
+                if len(group) > 1 else asyncio.sleep(0, group[0])
+                for group in groups
+            ))
+            levels += 1
+        
+        return partials[0], len(chunks), levels
+    
     async def _execute_extractor(self, inputs: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
         """Execute Information Extractor"""
         try:
@@ -789,17 +853,19 @@ class AINodeExecutor(BaseNodeExecutor):
             field_definitions = {field: (str, ...) for field in fields}
             ExtractionModel = create_model('ExtractionModel', **field_definitions)
             
-            api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+            api_key = context.get('openai_api_key')
             agent = Agent(model='gpt-4-turbo', api_key=api_key)
             
             extractor = Extractor(agent=agent, model=ExtractionModel)
             
             self.log_execution(f"Extracting fields: {', '.join(fields)}")
-            result = extractor.extract(text)
+            extracted = await self._cached_prompt(
+                lambda: json.dumps(extractor.extract(text).dict()), context, 'gpt-4-turbo', f"extract:{json.dumps(fields)}", text
+            )
             
             return {
                 'main': {
-                    'extracted': result.dict(),
+                    'extracted': json.loads(extracted),
                     'fields': fields
                 }
             }
@@ -808,13 +874,13 @@ class AINodeExecutor(BaseNodeExecutor):
             raise NodeExecutionError(f"Information extraction failed: {str(e)}")
     
     async def _execute_classifier(self, inputs: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute Text Classifier"""
+        """Execute Text Classifier on one text or, batched, on a list of texts"""
         try:
             from alith import Agent
             
             text = self.get_property('text', '')
             if not text:
-                text = inputs.get('main', {}).get('text', '')
+                text = inputs.get('main', {}).get('texts') or inputs.get('main', {}).get('text', '')
             
             if not text:
                 raise NodeExecutionError("No text provided for classification")
@@ -822,16 +888,40 @@ class AINodeExecutor(BaseNodeExecutor):
             categories = self.get_property('categories', 'positive, negative, neutral')
             category_list = [cat.strip() for cat in categories.split(',')]
             
-            api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+            if isinstance(text, list):
+                self.log_execution(f"Classifying {len(text)} texts into categories: {category_list}")
+                texts = [str(item) for item in text]
+                labels = await self._prompt_numbered(
+                    texts,
+                    f"You are a text classifier. Classify each text into one of these categories: {', '.join(category_list)}. Answer with only the category name.",
+                    context
+                )
+                # Texts the model still skipped after the retry are flagged rather than guessed
+                results = [
+                    {'text': item, 'category': label.strip()} if label is not None
+                    else {'text': item, 'category': None, 'missing': True}
+                    for item, label in zip(texts, labels)
+                ]
+                
+                return {
+                    'main': {
+                        'categories': [result['category'] for result in results],
+                        'results': results,
+                        'available_categories': category_list
+                    }
+                }
+            
+            api_key = context.get('openai_api_key')
+            preamble = f"You are a text classifier. Classify the following text into one of these categories: {', '.join(category_list)}. Respond with only the category name."
             agent = Agent(
                 name=self.label,
                 model='gpt-4-turbo',
                 api_key=api_key,
-                preamble=f"You are a text classifier. Classify the following text into one of these categories: {', '.join(category_list)}. Respond with only the category name."
+                preamble=preamble
             )
             
             self.log_execution(f"Classifying text into categories: {category_list}")
-            category = agent.prompt(text)
+            category = await self._cached_prompt(lambda: agent.prompt(text), context, 'gpt-4-turbo', preamble, text)
             
             return {
                 'main': {
@@ -845,38 +935,55 @@ class AINodeExecutor(BaseNodeExecutor):
             raise NodeExecutionError(f"Text classification failed: {str(e)}")
     
     async def _execute_sentiment(self, inputs: Dict[str, Any], context: Dict[str, Any]) -> Dict[str, Any]:
-        """Execute Sentiment Analysis"""
+        """Execute Sentiment Analysis on one text or, batched, on a list of texts"""
         try:
             from alith import Agent
             
             text = self.get_property('text', '')
             if not text:
-                text = inputs.get('main', {}).get('text', '')
+                text = inputs.get('main', {}).get('texts') or inputs.get('main', {}).get('text', '')
             
             if not text:
                 raise NodeExecutionError("No text provided for sentiment analysis")
             
-            api_key = context.get('openai_api_key') or os.getenv('OPENAI_API_KEY')
+            if isinstance(text, list):
+                self.log_execution(f"Analyzing sentiment of {len(text)} texts...")
+                texts = [str(item) for item in text]
+                answers = await self._prompt_numbered(
+                    texts,
+                    "You are a sentiment analysis assistant. For each text answer with: positive, negative, or neutral, followed by a confidence score (0-1).",
+                    context
+                )
+                results = []
+                for item, answer in zip(texts, answers):
+                    if answer is None:
+                        # Still unanswered after the retry, flagged rather than reported as neutral
+                        results.append({'text': item, 'sentiment': None, 'confidence': None, 'missing': True})
+                        continue
+                    sentiment, confidence = parse_sentiment(answer)
+                    results.append({'text': item, 'sentiment': sentiment, 'confidence': confidence})
+                
+                return {
+                    'main': {
+                        'sentiments': [result['sentiment'] for result in results],
+                        'results': results
+                    }
+                }
+            
+            api_key = context.get('openai_api_key')
+            preamble = "You are a sentiment analysis assistant. Analyze the sentiment of the text and respond with: positive, negative, or neutral, followed by a confidence score (0-1)."
             agent = Agent(
                 name=self.label,
                 model='gpt-4-turbo',
                 api_key=api_key,
-                preamble="You are a sentiment analysis assistant. Analyze the sentiment of the text and respond with: positive, negative, or neutral, followed by a confidence score (0-1)."
+                preamble=preamble
             )
             
             self.log_execution("Analyzing sentiment...")
-            result = agent.prompt(text)
+            result = await self._cached_prompt(lambda: agent.prompt(text), context, 'gpt-4-turbo', preamble, text)
             
             # Parse result
-            parts = result.lower().split()
-            sentiment = parts[0] if parts else 'neutral'
-            confidence = 0.5
-            
-            try:
-                if len(parts) > 1:
-                    confidence = float(parts[1])
-            except:
-                pass
+            sentiment, confidence = parse_sentiment(result)
             
             return {
                 'main': {
@@ -942,6 +1049,7 @@ class MemoryExecutor(BaseNodeExecutor):
                     'window_size': window_size,
                     'description': 'Maintains a sliding window of recent messages using Alith SDK'
                 })
+                memory_config.update(self._window_options())
                 
             elif self.node_type == 'agent-flow-db-memory':
                 window_size = self.get_property('windowSize', 20)
@@ -951,6 +1059,7 @@ class MemoryExecutor(BaseNodeExecutor):
                     'description': 'Persistent memory storage using Django database',
                     'storage_type': 'database'
                 })
+                memory_config.update(self._window_options())
                 
             # Legacy support for old memory types - all map to WindowBufferMemory
             elif self.node_type == 'simple-memory':
@@ -962,14 +1071,17 @@ class MemoryExecutor(BaseNodeExecutor):
                 })
                 
             elif self.node_type == 'vector-memory':
-                # For vector memory, we still use WindowBufferMemory as the base
-                # Vector operations would be handled by the Agent's store parameter
+                # Recent messages come from a window buffer, older turns are recalled by embedding similarity
+                from ..vector_memory import DEFAULT_EMBEDDING_MODEL
                 collection = self.get_property('collection', 'default')
                 memory_config.update({
                     'type': 'WindowBufferMemory',
-                    'window_size': 20,  # Default window size
+                    'window_size': self.get_property('windowSize', 20),
                     'collection_name': collection,
-                    'description': 'Memory with vector store integration (legacy)'
+                    'top_k': self.get_property('topK', 4),
+                    'min_score': self.get_property('minScore', 0.3),
+                    'embedding_model': self.get_property('embeddingModel', DEFAULT_EMBEDDING_MODEL),
+                    'description': 'Recent message window plus semantic recall of older turns'
                 })
             
             self.log_execution(f"Memory configuration: {memory_config}")
@@ -982,6 +1094,16 @@ class MemoryExecutor(BaseNodeExecutor):
             raise NodeExecutionError("Alith SDK not installed. Please install: pip install alith")
         except Exception as e:
             raise NodeExecutionError(f"Memory configuration failed: {str(e)}")
+    
+    def _window_options(self) -> Dict[str, Any]:
+        """Window settings: 'tokens' mode also caps estimated tokens, compaction summarizes dropped turns"""
+        return {
+            'window_mode': self.get_property('windowMode', 'messages'),
+            'token_budget': self.get_property('tokenBudget', 2000),
+            'reserve_headroom': self.get_property('reserveHeadroom', False),
+            'compaction': self.get_property('compaction', False),
+            'summary_max_words': self.get_property('summaryMaxWords', 200)
+        }
 
 
 class ToolExecutor(BaseNodeExecutor):
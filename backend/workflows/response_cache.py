@@ -0,0 +1,150 @@
+"""
+Exact-match cache of LLM responses in a local SQLite file
+"""
+from concurrent.futures import Future
+from pathlib import Path
+from typing import Callable, Dict, Optional
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+# Size eviction sums the table, so it only runs once per this many writes
+EVICT_EVERY_WRITES = 64
+
+
+class ResponseCache:
+    """
+    Responses keyed by everything that determines them, with TTL and LRU size eviction
+
+    Concurrent requests for the same key, from any thread or event loop in the
+    process, share one model call.
+    """
+
+    def __init__(self, path, ttl: float = 86400, max_bytes: int = 256 * 1024 * 1024):
+        self.path = Path(path)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, Future] = {}
+        self._writes = 0
+
+    @staticmethod
+    def key(provider: str, model: str, preamble: str, prompt: str,
+            temperature: Optional[float] = None, max_tokens: Optional[int] = None) -> str:
+        """Cache key for one model call"""
+        parts = [provider, model, preamble, prompt, temperature, max_tokens]
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses ('
+                'key TEXT PRIMARY KEY, value TEXT NOT NULL, created_at REAL NOT NULL, '
+                'accessed_at REAL NOT NULL, size INTEGER NOT NULL)'
+            )
+            connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> Optional[str]:
+        """Stored response for ``key``, or None if missing or expired"""
+        connection = self._connection()
+        row = connection.execute('SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+
+        now = time.time()
+        if self.ttl and row[1] < now - self.ttl:
+            connection.execute('DELETE FROM responses WHERE key = ?', (key,))
+            return None
+        connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+        return row[0]
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response, evicting expired and least recently used ones as needed"""
+        now = time.time()
+        connection = self._connection()
+        connection.execute(
+            'INSERT OR REPLACE INTO responses (key, value, created_at, accessed_at, size) VALUES (?, ?, ?, ?, ?)',
+            (key, value, now, now, len(value.encode('utf-8')))
+        )
+        with self._lock:
+            self._writes += 1
+            evict = self._writes % EVICT_EVERY_WRITES == 0
+        if evict:
+            self.evict()
+
+    def evict(self) -> None:
+        """Drop expired responses, then the least recently used until under max_bytes"""
+        connection = self._connection()
+        if self.ttl:
+            connection.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl,))
+
+        excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+        victims = []
+        for key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            victims.append((key,))
+            excess -= size
+            if excess <= 0:
+                break
+        connection.executemany('DELETE FROM responses WHERE key = ?', victims)
+
+    def _call_and_store(self, key: str, call: Callable[[], str]) -> str:
+        value = call()
+        self.set(key, value)
+        return value
+
+    async def aget_or_call(self, key: str, call: Callable[[], str], stats: Dict[str, int]) -> str:
+        """
+        Return the cached response for ``key``, or run ``call`` in a thread and store its result
+
+        ``stats`` counts 'hits' and 'misses'; waiting on an identical in-flight
+        call counts as a hit.
+        """
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+
+        if not leader:
+            stats['hits'] = stats.get('hits', 0) + 1
+            return await asyncio.wrap_future(future)
+
+        try:
+            value = await sync_to_async(self.get, thread_sensitive=False)(key)
+            if value is not None:
+                stats['hits'] = stats.get('hits', 0) + 1
+            else:
+                stats['misses'] = stats.get('misses', 0) + 1
+                value = await sync_to_async(self._call_and_store, thread_sensitive=False)(key, call)
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+response_cache = ResponseCache(
+    getattr(settings, 'LLM_CACHE_PATH', Path(settings.BASE_DIR) / 'llm_cache.sqlite3'),
+    ttl=getattr(settings, 'LLM_CACHE_TTL', 86400),
+    max_bytes=getattr(settings, 'LLM_CACHE_MAX_BYTES', 256 * 1024 * 1024)
+)
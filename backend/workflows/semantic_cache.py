@@ -0,0 +1,95 @@
+"""
+Semantic cache of AI Agent answers, matched by prompt embedding similarity
+"""
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+import hashlib
+import json
+import threading
+
+from django.conf import settings
+
+from .vector_memory import VectorIndex, get_embedder
+
+DEFAULT_THRESHOLD = 0.92
+
+
+def agent_fingerprint(model: str, system_prompt: str, tool_names, embedding_model: Optional[str] = None) -> str:
+    """Identifies the agent configuration cached answers were produced and embedded with"""
+    parts = [model, system_prompt, sorted(tool_names), embedding_model]
+    return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+
+def similarity_threshold(value) -> float:
+    """
+    Coerce a node's semanticCacheThreshold into (0, 1]
+
+    Missing, non-numeric or non-positive values fall back to the default so a
+    threshold saved as 0 never serves every stored answer.
+    """
+    try:
+        threshold = float(value)
+    except (TypeError, ValueError):
+        return DEFAULT_THRESHOLD
+    if not threshold > 0:
+        return DEFAULT_THRESHOLD
+    return min(threshold, 1.0)
+
+
+class SemanticCache:
+    """
+    Answered prompts of one agent node, stored as (prompt, answer) rows of a VectorIndex
+
+    Each fingerprint gets its own directory, so an edited system prompt, model or
+    tool set never serves answers written for the old one, and processes still
+    running the old configuration keep reading an index nobody deletes under them.
+    """
+
+    def __init__(self, directory, fingerprint: str, embedding_model: Optional[str] = None):
+        self.directory = Path(directory)
+        self.fingerprint = fingerprint
+        self.embedding_model = embedding_model
+        self._lock = threading.Lock()
+        self._index: Optional[VectorIndex] = None
+
+    def _open(self) -> VectorIndex:
+        with self._lock:
+            if self._index is None:
+                self._index = VectorIndex(self.directory, self.fingerprint)
+            return self._index
+
+    def match(self, prompt: str, threshold: float) -> Tuple[Optional[str], float, list]:
+        """
+        Look up the most similar answered prompt
+
+        Returns:
+            (answer or None, best similarity, prompt embedding to pass to add())
+        """
+        vector = get_embedder(self.embedding_model).embed_texts([prompt])[0]
+        results = self._open().search(vector, 1)
+        if results and results[0][0] >= threshold:
+            return results[0][2], results[0][0], vector
+        return None, results[0][0] if results else 0.0, vector
+
+    def add(self, prompt: str, answer: str, vector) -> None:
+        """Remember the answer to a prompt embedded by match()"""
+        self._open().add([(prompt, answer)], [vector])
+
+
+_caches: Dict[str, SemanticCache] = {}
+_caches_lock = threading.Lock()
+
+
+def get_semantic_cache(workflow_id: str, node_id: str, fingerprint: str,
+                       embedding_model: Optional[str] = None) -> SemanticCache:
+    """Process-wide semantic cache of an agent node, starting afresh when its fingerprint changes"""
+    key = f"{workflow_id}:{node_id}"
+    with _caches_lock:
+        cache = _caches.get(key)
+        if cache is None or cache.fingerprint != fingerprint:
+            root = Path(getattr(settings, 'VECTOR_MEMORY_DIR', Path(settings.BASE_DIR) / 'vector_memory'))
+            directory = (root / 'semantic_cache' / hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+                         / fingerprint[:32])
+            cache = SemanticCache(directory, fingerprint, embedding_model)
+            _caches[key] = cache
+        return cache
@@ -50,6 +50,19 @@ class ExecuteNodeSerializer(serializers.Serializer):
     credentials = serializers.JSONField(required=False, default=dict)
 
 
+class ExecuteBatchSerializer(serializers.Serializer):
+    """Serializer for running one workflow over many trigger payloads"""
+    items = serializers.ListField(child=serializers.JSONField(), allow_empty=False)
+    credentials = serializers.JSONField(required=False, default=dict)
+    concurrency = serializers.IntegerField(required=False, default=4, min_value=1, max_value=32)
+
+
+class WorkflowGraphPatchSerializer(serializers.Serializer):
+    """Serializer for JSON Patch updates to a workflow's nodes and edges"""
+    operations = serializers.ListField(child=serializers.DictField(), allow_empty=False)
+    updated_at = serializers.DateTimeField(required=False, allow_null=True)
+
+
 class ExportedWorkflowSerializer(serializers.ModelSerializer):
     """Serializer for ExportedWorkflow model"""
     
@@ -0,0 +1,84 @@
+"""
+Keyed FIFO locks that serialize executions of one conversation
+"""
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Tuple
+import asyncio
+import threading
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class SessionLocks:
+    """
+    One FIFO lock per key, shared by every event loop in the process
+
+    Sync views run each execution on its own event loop through async_to_sync,
+    so asyncio.Lock cannot be shared between requests. Waiters are queued per
+    key in arrival order and woken on their own loop; different keys never wait
+    on each other.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # A key is held while present; the deque holds the waiting (loop, future) pairs
+        self._waiters: Dict[str, Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+
+    @asynccontextmanager
+    async def hold(self, key: str):
+        """Run the block once every earlier holder of ``key`` has finished"""
+        loop = asyncio.get_running_loop()
+        waiter = None
+        with self._lock:
+            queue = self._waiters.get(key)
+            if queue is None:
+                self._waiters[key] = deque()
+            else:
+                waiter = loop.create_future()
+                queue.append((loop, waiter))
+
+        if waiter is not None:
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._lock:
+                    try:
+                        queue.remove((loop, waiter))
+                        handed_over = False
+                    except ValueError:
+                        handed_over = True
+                if handed_over:
+                    # The lock was passed to us as we were cancelled, pass it on
+                    self._release(key)
+                raise
+
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    def _release(self, key: str) -> None:
+        while True:
+            with self._lock:
+                queue = self._waiters[key]
+                if not queue:
+                    del self._waiters[key]
+                    return
+                loop, waiter = queue.popleft()
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+                return
+            except RuntimeError:
+                # The waiter's event loop is closed, nobody is left to run it
+                continue
+
+    def locked(self, key: str) -> bool:
+        with self._lock:
+            return key in self._waiters
+
+
+session_locks = SessionLocks()
@@ -1,3 +1,1306 @@
-from django.test import TestCase
+from datetime import timedelta
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import mock, skipUnless
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import uuid
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .analytics import HISTOGRAM_GAMMA, LatencyHistogram
+from .credentials import CredentialCache
+from .execution_archive import ExecutionArchive
+from .execution_engine import ExecutionContext
+from .execution_store import ExecutionWriter, delete_unreferenced_payloads, persist_executions
+from .json_patch import JSONPatchError, apply_patch
+from .memory_backends import DatabaseMemoryBackend, RedisMemoryBackend, SharedMemoryBackend, WindowMemoryStore
+from .memory_store import (
+    BufferedDBMemory, MessageWindow, append_messages, compact_collection, load_window, memory_window_cache, session_key
+)
+from .models import Credential, IdempotencyKey, MemoryCollection, NodePayload, NodeRun, Workflow, WorkflowExecution
+from .node_executors.ai_nodes import AINodeExecutor, parse_numbered_answers, parse_sentiment
+from .response_cache import ResponseCache
+from .session_locks import SessionLocks
+from .semantic_cache import DEFAULT_THRESHOLD, get_semantic_cache, similarity_threshold
+from .token_budget import MESSAGE_OVERHEAD_TOKENS, estimate_message_tokens, estimate_tokens, trim_to_token_budget
+from .vector_memory import VectorIndex
+
+
+class APITestCase(TestCase):
+    """Authenticated API client for one user"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('tester', password='correct-horse-battery')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class NDJSONImportExportTests(APITestCase):
+    def test_export_import_round_trip(self):
+        for i in range(3):
+            Workflow.objects.create(user=self.user, name=f'workflow {i}', nodes=[{'id': str(i)}])
+
+        response = self.client.get('/api/workflows/export.ndjson/')
+        self.assertEqual(response.status_code, 200)
+        body = b''.join(response.streaming_content).decode()
+        self.assertEqual(len(body.strip().split('\n')), 3)
+
+        response = self.client.post('/api/workflows/import/', data=body + 'not json\n',
+                                    content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['imported'], 3)
+        self.assertEqual(response.json()['failed'], 1)
+        self.assertEqual(Workflow.objects.count(), 6)
+
+    def test_import_empty_body(self):
+        response = self.client.post('/api/workflows/import/', data='', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.post('/api/workflows/import/', data='\n\n', content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 400)
+
+
+class JSONPatchTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflow = Workflow.objects.create(
+            user=self.user, name='graph',
+            nodes=[{'id': 'a', 'position': {'x': 1, 'y': 2}, 'data': {'properties': {}}}], edges=[]
+        )
+        self.url = f'/api/workflows/{self.workflow.id}/graph/'
+
+    def test_apply_patch_operations(self):
+        document = apply_patch({'a': [1, 2, 3], 'b': {}}, [
+            {'op': 'move', 'from': '/a/0', 'path': '/b/x'},
+            {'op': 'copy', 'from': '/b/x', 'path': '/a/-'},
+            {'op': 'test', 'path': '/a', 'value': [2, 3, 1]},
+        ])
+        self.assertEqual(document, {'a': [2, 3, 1], 'b': {'x': 1}})
+
+    def test_malformed_operations_raise_patch_error(self):
+        for operation in ({'op': 'move', 'from': 5, 'path': '/a'},
+                          {'op': 'copy', 'from': '/a', 'path': None},
+                          {'op': 'move', 'path': '/a'},
+                          {'op': 'frobnicate', 'path': '/a'}):
+            with self.assertRaises(JSONPatchError):
+                apply_patch({'a': 1}, [operation])
+
+        response = self.client.patch(self.url, {'operations': [{'op': 'move', 'from': 1, 'path': 2}]}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_patch_compare_and_swap(self):
+        operations = [
+            {'op': 'replace', 'path': '/nodes/0/position/x', 'value': 50},
+            {'op': 'add', 'path': '/edges/-', 'value': {'id': 'e', 'source': 'a', 'target': 'b'}},
+        ]
+        response = self.client.patch(self.url, {
+            'operations': operations, 'updated_at': self.workflow.updated_at.isoformat()
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.workflow.refresh_from_db()
+        self.assertEqual(self.workflow.nodes[0]['position']['x'], 50)
+        self.assertEqual(len(self.workflow.edges), 1)
+
+        # The first patch moved updated_at on, so the stale timestamp conflicts
+        response = self.client.patch(self.url, {
+            'operations': operations, 'updated_at': '2020-01-01T00:00:00Z'
+        }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.workflow.refresh_from_db()
+        self.assertEqual(len(self.workflow.edges), 1)
+
+    def test_patch_loses_race_to_concurrent_write(self):
+        def concurrent_apply(document, operations):
+            # Another request saves between this request's read and its conditional update
+            Workflow.objects.filter(pk=self.workflow.pk).update(name='renamed', updated_at=timezone.now())
+            return apply_patch(document, operations)
+
+        with mock.patch('workflows.views.apply_patch', side_effect=concurrent_apply):
+            response = self.client.patch(self.url, {
+                'operations': [{'op': 'remove', 'path': '/nodes/0'}]
+            }, format='json')
+        self.assertEqual(response.status_code, 409)
+        self.workflow.refresh_from_db()
+        self.assertEqual(len(self.workflow.nodes), 1)
+
+
+MANUAL_CHAT_NODES = [
+    {'id': 'trigger', 'data': {'type': 'manual-trigger', 'properties': {}}},
+    {'id': 'reply', 'data': {'type': 'respond-to-chat', 'properties': {}}},
+]
+MANUAL_CHAT_EDGES = [{'source': 'trigger', 'target': 'reply'}]
+
+
+@override_settings(EXECUTION_WRITE_BEHIND=False)
+class IdempotencyTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                                edges=MANUAL_CHAT_EDGES)
+        self.url = f'/api/workflows/{self.workflow.id}/execute/'
+
+    def execute(self, message, key=None):
+        headers = {'HTTP_IDEMPOTENCY_KEY': key} if key else {}
+        return self.client.post(self.url, {'trigger_data': {'message': message}}, format='json', **headers)
+
+    def test_repeated_key_replays_stored_response(self):
+        first = self.execute('hi', key='key-1')
+        second = self.execute('hi', key='key-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(WorkflowExecution.objects.count(), 1)
+
+    def test_reused_key_with_different_body_is_rejected(self):
+        self.execute('hi', key='key-1')
+        self.assertEqual(self.execute('bye', key='key-1').status_code, 422)
+
+        self.execute('bye')
+        self.assertEqual(WorkflowExecution.objects.count(), 2)
+
+    def test_server_error_releases_key(self):
+        with mock.patch('workflows.views.save_execution', side_effect=RuntimeError('disk full')):
+            self.assertEqual(self.execute('hi', key='key-1').status_code, 500)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+        # The retry runs again instead of replaying the failure
+        response = self.execute('hi', key='key-1')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+
+class BatchExecutionTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                                edges=MANUAL_CHAT_EDGES)
+        self.url = f'/api/workflows/{self.workflow.id}/execute_batch/'
+
+    def results(self, response):
+        self.assertEqual(response.status_code, 200)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        return sorted((json.loads(line) for line in lines), key=lambda result: result['index'])
+
+    def test_json_body_runs_and_persists_every_item(self):
+        response = self.client.post(self.url, {'items': [{'message': 'a'}, {'message': 'b'}]}, format='json')
+        results = self.results(response)
+        self.assertEqual([result['status'] for result in results], ['completed', 'completed'])
+        self.assertEqual(WorkflowExecution.objects.filter(workflow=self.workflow).count(), 2)
+        # One run per node of each execution
+        for result in results:
+            self.assertEqual(NodeRun.objects.filter(execution_id=result['execution_id']).count(), 2)
+
+    def test_ndjson_body_reports_malformed_items_inline(self):
+        body = '{"message": "a"}\nnot json\n\n[1, 2]\n{"message": "b"}\n'
+        results = self.results(self.client.post(self.url, data=body, content_type='application/x-ndjson'))
+        self.assertEqual([result['status'] for result in results], ['completed', 'error', 'error', 'completed'])
+        self.assertIn('input', results[1]['errors'])
+        self.assertEqual(WorkflowExecution.objects.count(), 2)
+
+    def test_empty_body_is_rejected(self):
+        for body in ('', '\n\n'):
+            response = self.client.post(self.url, data=body, content_type='application/x-ndjson')
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.post(self.url, {'items': []}, format='json').status_code, 400)
+
+    def test_persist_failure_is_reported_for_its_chunk(self):
+        calls = []
+
+        def persist(records):
+            calls.append(1)
+            if len(calls) == 1:
+                raise DatabaseError('database is locked')
+            return persist_executions(records)
+
+        items = [{'message': str(number)} for number in range(3)]
+        with mock.patch('workflows.views.EXECUTE_BATCH_CHUNK_SIZE', 2), \
+                mock.patch('workflows.views.persist_executions', side_effect=persist):
+            results = self.results(self.client.post(self.url, {'items': items}, format='json'))
+
+        self.assertEqual([result['status'] for result in results], ['error', 'error', 'completed'])
+        self.assertIn('persist', results[0]['errors'])
+        self.assertEqual(list(WorkflowExecution.objects.values_list('id', flat=True)),
+                         [uuid.UUID(results[2]['execution_id'])])
+
+
+@override_settings(EXECUTION_WRITE_BEHIND=False)
+class ExecutionHistoryTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                                edges=MANUAL_CHAT_EDGES)
+        for message in ('one', 'two'):
+            self.client.post(f'/api/workflows/{self.workflow.id}/execute/',
+                             {'trigger_data': {'message': message}}, format='json')
+
+    def test_listings_restore_node_payloads(self):
+        listed = self.client.get('/api/executions/').json()['results']
+        history = self.client.get(f'/api/workflows/{self.workflow.id}/executions/').json()
+        self.assertEqual(len(listed), 2)
+        self.assertEqual(len(history), 2)
+
+        for execution in listed + history:
+            state = execution['node_states']['trigger']
+            self.assertIn('output', state)
+            self.assertNotIn('output_ref', state)
+            detail = self.client.get(f"/api/executions/{execution['id']}/").json()
+            self.assertEqual(detail['node_states'], execution['node_states'])
+
+    def test_listing_without_payloads(self):
+        listed = self.client.get('/api/executions/?payloads=false').json()['results']
+        state = listed[0]['node_states']['trigger']
+        self.assertNotIn('output', state)
+        self.assertIn('output_ref', state)
+
+    def test_listing_filters(self):
+        self.assertEqual(len(self.client.get(f'/api/executions/?workflow={self.workflow.id}').json()['results']), 2)
+        self.assertEqual(len(self.client.get('/api/executions/?started_after=2000-01-01T00:00:00Z').json()['results']), 2)
+        self.assertEqual(len(self.client.get('/api/executions/?started_before=2000-01-01T00:00:00Z').json()['results']), 0)
+
+    def test_invalid_listing_filters_are_rejected(self):
+        for query in ('workflow=not-a-uuid', 'started_after=yesterday', 'started_before=2024-13-45T00:00:00'):
+            response = self.client.get(f'/api/executions/?{query}')
+            self.assertEqual(response.status_code, 400, query)
+
+
+class AnalyticsTests(APITestCase):
+    # Bucket midpoints are within this relative error of every value in the bucket
+    RELATIVE_ERROR = (HISTOGRAM_GAMMA - 1) / (HISTOGRAM_GAMMA + 1) + 1e-9
+
+    def assert_percentiles_close(self, histogram, values):
+        ordered = sorted(values)
+        for q in (50, 95, 99):
+            exact = ordered[int(q / 100 * (len(ordered) - 1))]
+            self.assertLessEqual(abs(histogram.percentile(q) - exact) / exact, self.RELATIVE_ERROR, q)
+
+    def test_percentiles_are_within_the_relative_error_bound(self):
+        generator = random.Random(7)
+        values = [generator.lognormvariate(4, 1.5) for _ in range(20000)]
+        histogram = LatencyHistogram()
+        for value in values:
+            histogram.add(value)
+        self.assert_percentiles_close(histogram, values)
+        self.assertIsNone(LatencyHistogram().percentile(50))
+
+    def test_merged_histograms_equal_one_built_from_both_samples(self):
+        generator = random.Random(11)
+        first_values = [generator.expovariate(1 / 200) for _ in range(5000)]
+        second_values = [generator.uniform(0, 5000) for _ in range(3000)] + [0.0]
+        first, second, combined = LatencyHistogram(), LatencyHistogram(), LatencyHistogram()
+        for value in first_values:
+            first.add(value)
+            combined.add(value)
+        for value in second_values:
+            second.add(value)
+            combined.add(value)
+
+        first.merge(second)
+        self.assertEqual(first.buckets, combined.buckets)
+        self.assertEqual(first.percentile(95), combined.percentile(95))
+
+    def test_stats_endpoint_reports_rolled_up_executions(self):
+        workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                           edges=MANUAL_CHAT_EDGES)
+        records = []
+        for number in range(1, 11):
+            context = ExecutionContext(str(workflow.id), str(uuid.uuid4()))
+            context.end_time = context.start_time + timedelta(milliseconds=number * 10)
+            context.status = 'error' if number == 10 else 'completed'
+            context.node_states['trigger'] = {'status': 'completed', 'startTime': 1000.0,
+                                              'endTime': 1000.0 + number, 'output': {'number': number}}
+            records.append((workflow, context, {}))
+        # Two writes, so the endpoint reads histograms merged across persist calls
+        persist_executions(records[:4])
+        persist_executions(records[4:])
+
+        stats = self.client.get(f'/api/workflows/{workflow.id}/stats/').json()
+        executions = stats['executions']
+        self.assertEqual((executions['count'], executions['error_count']), (10, 1))
+        self.assertAlmostEqual(executions['error_rate'], 0.1)
+        self.assertAlmostEqual(executions['avg_ms'], 55)
+        for key, exact in (('p50_ms', 50), ('p95_ms', 90), ('p99_ms', 90)):
+            self.assertLessEqual(abs(executions[key] - exact) / exact, self.RELATIVE_ERROR, key)
+
+        trigger = stats['node_types']['manual-trigger']
+        self.assertEqual((trigger['count'], trigger['error_count']), (10, 0))
+        self.assertAlmostEqual(trigger['p50_ms'], 5, delta=5 * self.RELATIVE_ERROR)
+
+
+class ExecutionWriterTests(APITestCase):
+    def test_pending_execution_is_served_before_it_is_written(self):
+        workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                           edges=MANUAL_CHAT_EDGES)
+        writer = ExecutionWriter()
+        with override_settings(EXECUTION_WRITE_BEHIND=True), \
+                mock.patch('workflows.execution_store.execution_writer', writer), \
+                mock.patch.object(writer, '_ensure_started'):
+            response = self.client.post(f'/api/workflows/{workflow.id}/execute/',
+                                        {'trigger_data': {'message': 'hi'}}, format='json')
+            execution_id = response.json()['execution_id']
+            self.assertFalse(WorkflowExecution.objects.exists())
+
+            detail = self.client.get(f'/api/executions/{execution_id}/')
+            self.assertEqual(detail.status_code, 200)
+            self.assertTrue(detail.json()['pending'])
+            self.assertEqual(detail.json()['status'], 'completed')
+
+            other = User.objects.create_user('other', password='correct-horse-battery')
+            self.client.force_authenticate(other)
+            self.assertEqual(self.client.get(f'/api/executions/{execution_id}/').status_code, 404)
+
+    def test_failed_batch_is_retried_then_written_record_by_record(self):
+        writer = ExecutionWriter(retries=1, retry_delay=0)
+        records = [(None, mock.Mock(execution_id=str(i)), {}) for i in range(2)]
+        failure = RuntimeError('database is locked')
+
+        with mock.patch('workflows.execution_store.persist_executions',
+                        side_effect=[failure, failure, None, failure]) as persist:
+            writer._write(records)
+
+        self.assertEqual(persist.call_count, 4)
+        self.assertEqual(persist.call_args_list[2], mock.call([records[0]]))
+        self.assertEqual(persist.call_args_list[3], mock.call([records[1]]))
+
+        with mock.patch('workflows.execution_store.persist_executions', side_effect=[failure, None]) as persist:
+            writer._write(records)
+        self.assertEqual(persist.call_args_list, [mock.call(records), mock.call(records)])
+
+
+
+@override_settings(EXECUTION_WRITE_BEHIND=False)
+class ExecutionArchiveTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.archive = ExecutionArchive(directory)
+        for target in ('workflows.views.execution_archive',
+                       'workflows.management.commands.archive_executions.execution_archive'):
+            patcher = mock.patch(target, self.archive)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_archive_round_trip(self):
+        workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                           edges=MANUAL_CHAT_EDGES)
+        execution_ids = [
+            self.client.post(f'/api/workflows/{workflow.id}/execute/',
+                             {'trigger_data': {'message': f'message {i}'}}, format='json').json()['execution_id']
+            for i in range(6)
+        ]
+        before = self.client.get(f'/api/executions/{execution_ids[2]}/').json()
+
+        # A tiny segment size spreads the records over several segments
+        with mock.patch('workflows.execution_archive.SEGMENT_MAX_BYTES', 1000):
+            call_command('archive_executions', days=0, batch_size=2, stdout=io.StringIO())
+        self.assertFalse(WorkflowExecution.objects.exists())
+        self.assertFalse(NodePayload.objects.exists())
+        self.assertGreater(len(list(self.archive.directory.glob('*.jsonl.gz'))), 1)
+
+        for i, execution_id in enumerate(execution_ids):
+            archived = self.client.get(f'/api/executions/{execution_id}/').json()
+            self.assertTrue(archived['archived'])
+            self.assertEqual(archived['node_states']['reply']['input']['main']['message'], f'message {i}')
+        archived = self.client.get(f'/api/executions/{execution_ids[2]}/').json()
+        self.assertEqual(archived['node_states'], before['node_states'])
+
+        # Archived records stay private to their owner
+        self.client.force_authenticate(User.objects.create_user('other', password='correct-horse-battery'))
+        self.assertEqual(self.client.get(f'/api/executions/{execution_ids[0]}/').status_code, 404)
+
+
+class PayloadCleanupTests(APITestCase):
+    def setUp(self):
+        super().setUp()
+        self.workflow = Workflow.objects.create(user=self.user, name='chat', nodes=MANUAL_CHAT_NODES,
+                                                edges=MANUAL_CHAT_EDGES)
+
+    def persist(self, *outputs):
+        records = []
+        for output in outputs:
+            context = ExecutionContext(str(self.workflow.id), str(uuid.uuid4()))
+            context.status = 'completed'
+            context.node_states['trigger'] = {'status': 'completed', 'output': output}
+            records.append((self.workflow, context, {}))
+        return persist_executions(records)
+
+    def test_only_unreferenced_payloads_are_deleted(self):
+        shared, unique = self.persist('shared', 'unique')
+        self.persist('shared')
+        self.assertEqual(NodePayload.objects.count(), 2)
+
+        shared.delete()
+        unique.delete()
+        self.assertEqual(delete_unreferenced_payloads(batch_size=1), 1)
+        self.assertEqual(NodePayload.objects.count(), 1)
+        self.assertEqual(NodeRun.objects.get().output_payload_id, NodePayload.objects.get().pk)
+
+        call_command('prune_executions', keep=0, stdout=io.StringIO())
+        self.assertFalse(NodePayload.objects.exists())
+
+    def test_payload_deleted_before_reuse_is_recreated(self):
+        execution, = self.persist('again')
+        execution.delete()
+        delete_unreferenced_payloads()
+
+        self.persist('again')
+        run = NodeRun.objects.select_related('output_payload').get()
+        self.assertIsNotNone(run.output_payload)
+
+
+class CredentialCacheTests(APITestCase):
+    def test_changes_from_other_processes_are_picked_up(self):
+        cache = CredentialCache(ttl=300)
+        credential = Credential.objects.create(user=self.user, name='openai', credential_type='openai',
+                                               data={'api_key': 'old-key'})
+        self.assertEqual(cache.get(self.user.pk)['keys']['openai_api_key'], 'old-key')
+
+        # queryset.update() skips the save signal, like a write from another worker process
+        Credential.objects.filter(pk=credential.pk).update(data={'api_key': 'new-key'}, updated_at=timezone.now())
+        self.assertEqual(cache.get(self.user.pk)['keys']['openai_api_key'], 'new-key')
+
+        Credential.objects.filter(pk=credential.pk).delete()
+        self.assertNotEqual(cache.get(self.user.pk)['keys'].get('openai_api_key'), 'new-key')
+
+    def test_ai_chat_uses_the_callers_stored_key(self):
+        # Without alith the view stops at its dependency check, after resolving the key
+        with mock.patch.dict(os.environ, {'GROQ_API_KEY': ''}), mock.patch.dict(sys.modules, {'alith': None}):
+            response = self.client.post('/api/ai-chat/', {'message': 'hi'}, format='json')
+            self.assertIn('configure your AI settings', response.json()['response'])
+
+            Credential.objects.create(user=self.user, name='groq', credential_type='groq', data={'api_key': 'gsk-stored'})
+            response = self.client.post('/api/ai-chat/', {'message': 'hi'}, format='json')
+            self.assertEqual(response.status_code, 503)
+
+
+class DatabaseMemoryTests(TestCase):
+    def setUp(self):
+        self.collection = MemoryCollection.objects.create(name='memory', workflow_id='workflow', node_id='agent',
+                                                          window_size=4)
+
+    def test_append_trims_the_window_in_three_writes(self):
+        append_messages(self.collection, [('user', 'one'), ('assistant', 'reply one')], 4)
+        append_messages(self.collection, [('user', 'two'), ('assistant', 'reply two')], 4)
+
+        with CaptureQueriesContext(connection) as queries:
+            append_messages(self.collection, [('user', 'three'), ('assistant', 'reply three')], 4)
+        statements = [query['sql'].split()[0].upper() for query in queries.captured_queries
+                      if 'SAVEPOINT' not in query['sql'].upper()]
+        # Counter UPDATE, reading the reserved seq back, one INSERT for both messages, one trimming DELETE
+        self.assertEqual(statements, ['UPDATE', 'SELECT', 'INSERT', 'DELETE'])
+
+        self.assertEqual(load_window(self.collection, 4), [('user', 'two'), ('assistant', 'reply two'),
+                                                           ('user', 'three'), ('assistant', 'reply three')])
+        self.assertEqual(self.collection.messages.count(), 4)
+        self.assertEqual(list(self.collection.messages.order_by('seq').values_list('seq', flat=True)), [3, 4, 5, 6])
+
+    def flush_turn(self, memory, prompt):
+        memory.add_message(SimpleNamespace(role='user', content=prompt))
+        memory.add_message(SimpleNamespace(role='assistant', content=f'reply {prompt}'))
+
+        def run_inline(key, func, *args):
+            # Like the background writer, which logs failures instead of raising them
+            try:
+                func(*args)
+            except DatabaseError:
+                pass
+
+        with mock.patch('workflows.memory_store.submit_write', run_inline):
+            memory.flush()
+
+    def test_window_is_cached_after_its_write_commits(self):
+        self.addCleanup(memory_window_cache.invalidate, self.collection.pk)
+        memory = BufferedDBMemory(self.collection, 4)
+        self.flush_turn(memory, 'one')
+        self.assertEqual([message.content for message in memory_window_cache.get(self.collection.pk, 1, 4)],
+                         ['one', 'reply one'])
+
+    def test_failed_write_leaves_the_cache_alone(self):
+        self.addCleanup(memory_window_cache.invalidate, self.collection.pk)
+        memory = BufferedDBMemory(self.collection, 4)
+        with mock.patch('workflows.memory_store.append_messages', side_effect=DatabaseError('database is locked')):
+            self.flush_turn(memory, 'lost')
+        self.assertIsNone(memory_window_cache.get(self.collection.pk, 1, 4))
+
+        # Another process's write takes version 1, which must not serve the lost turn
+        append_messages(self.collection, [('user', 'other'), ('assistant', 'reply other')], 4)
+        self.assertIsNone(memory_window_cache.get(self.collection.pk, 1, 4))
+
+    def test_window_written_over_another_process_is_not_cached(self):
+        self.addCleanup(memory_window_cache.invalidate, self.collection.pk)
+        memory = BufferedDBMemory(self.collection, 4)
+        append_messages(self.collection, [('user', 'other'), ('assistant', 'reply other')], 4)
+        self.flush_turn(memory, 'mine')
+        # Stored at version 2 with both turns, while this copy only holds its own
+        self.assertIsNone(memory_window_cache.get(self.collection.pk, 2, 4))
+        self.assertEqual(len(load_window(self.collection, 4)), 4)
+
+
+    def test_load_reuses_the_cached_window_until_another_process_writes(self):
+        self.addCleanup(memory_window_cache.invalidate, self.collection.pk)
+        append_messages(self.collection, [('user', 'one'), ('assistant', 'reply one')], 4)
+        load = async_to_sync(BufferedDBMemory.load)
+
+        with mock.patch('workflows.memory_store.to_alith_messages',
+                        side_effect=lambda rows: [SimpleNamespace(role=r, content=c) for r, c in rows]) as convert:
+            load(self.collection, 4)
+            # Only the version lookup, the window comes from the cache
+            with self.assertNumQueries(1):
+                memory = load(self.collection, 4)
+            self.assertEqual([message.content for message in memory.messages()], ['one', 'reply one'])
+            self.assertEqual(convert.call_count, 1)
+
+            # A write from another process bumps the version, so the window is rebuilt
+            append_messages(self.collection, [('user', 'two'), ('assistant', 'reply two')], 4)
+            memory = load(self.collection, 4)
+            self.assertEqual(convert.call_count, 2)
+            self.assertEqual(memory.version, 2)
+            self.assertEqual([message.content for message in memory.messages()],
+                             ['one', 'reply one', 'two', 'reply two'])
+
+
+    def test_compaction_folds_turns_that_left_the_window_into_the_summary(self):
+        for prompt in ('one', 'two', 'three'):
+            append_messages(self.collection, [('user', prompt), ('assistant', f'reply {prompt}')], 2, trim=False)
+        folded = []
+
+        def summarize(summary, rows):
+            folded.append(rows)
+            return f"{summary} {' '.join(content for _, content in rows)}".strip()
+
+        compact_collection(self.collection, 2, summarize)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.summary, 'one reply one two reply two')
+        self.assertEqual(self.collection.summary_seq, 4)
+        self.assertEqual(load_window(self.collection, 10), [('user', 'three'), ('assistant', 'reply three')])
+
+        # Nothing new left the window
+        compact_collection(self.collection, 2, summarize)
+        self.assertEqual(len(folded), 1)
+
+        append_messages(self.collection, [('user', 'four'), ('assistant', 'reply four')], 2, trim=False)
+        compact_collection(self.collection, 2, summarize)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.summary, 'one reply one two reply two three reply three')
+
+    def test_concurrent_compactions_fold_each_turn_once(self):
+        for prompt in ('one', 'two'):
+            append_messages(self.collection, [('user', prompt), ('assistant', f'reply {prompt}')], 2, trim=False)
+
+        def summarize(summary, rows):
+            if not summarize.nested:
+                # Another worker compacts the same collection while this summary is generated
+                summarize.nested = True
+                compact_collection(self.collection, 2, lambda summary, rows: 'from the other worker')
+            return 'from this worker'
+        summarize.nested = False
+
+        compact_collection(self.collection, 2, summarize)
+        self.collection.refresh_from_db()
+        self.assertEqual(self.collection.summary, 'from the other worker')
+        self.assertEqual(self.collection.messages.count(), 2)
+
+    def test_window_memory_summarizes_dropped_messages(self):
+        window = MessageWindow(2, compaction=True)
+        for prompt in ('one', 'two'):
+            window.add_message(SimpleNamespace(role='user', content=prompt))
+            window.add_message(SimpleNamespace(role='assistant', content=f'reply {prompt}'))
+
+        window.compact(lambda summary, rows: ', '.join(content for _, content in rows)).result(5)
+        self.assertEqual(window.summary, 'one, reply one')
+        self.assertEqual([message.content for message in window._messages], ['two', 'reply two'])
+        self.assertIsNone(window.compact(lambda summary, rows: 'unused'))
+
+
+class MemorySessionTests(TestCase):
+    def test_session_key(self):
+        self.assertEqual(session_key({'session_id': 'abc', 'channel': 'slack', 'user': 'ann'}), 'abc')
+        self.assertEqual(session_key({'channel': 'slack', 'user': 'ann'}), 'slack:ann')
+        self.assertEqual(session_key({'user': 'ann'}), 'ann')
+        self.assertEqual(session_key({'message': 'hi'}), '')
+        self.assertEqual(session_key(None), '')
+        self.assertEqual(len(session_key({'session_id': 'x' * 500})), 64)
+
+    def test_each_session_gets_its_own_collection(self):
+        def collection(session):
+            return MemoryCollection.objects.get_or_create(
+                name='workflow_1_node_agent', session=session,
+                defaults={'workflow_id': '1', 'node_id': 'agent', 'window_size': 4}
+            )[0]
+
+        first, second = collection('slack:ann'), collection('slack:bob')
+        self.assertNotEqual(first.pk, second.pk)
+        self.assertEqual(collection('slack:ann').pk, first.pk)
+
+        append_messages(first, [('user', 'hi from ann'), ('assistant', 'hello ann')], 4)
+        self.assertEqual(load_window(second, 4), [])
+        self.assertEqual(len(load_window(first, 4)), 2)
+
+        # The per-run lookup is one query served by the (name, session) index
+        lookup = MemoryCollection.objects.filter(name='workflow_1_node_agent', session='slack:bob')
+        with self.assertNumQueries(1):
+            self.assertEqual(lookup.get().pk, second.pk)
+        if connection.vendor == 'sqlite':
+            index = next(index.name for index in MemoryCollection._meta.indexes if index.fields == ['name', 'session'])
+            self.assertIn(index, lookup.explain())
+
+
+class TokenBudgetTests(TestCase):
+    @staticmethod
+    def message(role, content):
+        return SimpleNamespace(role=role, content=content)
+
+    def test_estimates(self):
+        self.assertEqual(estimate_tokens(''), 0)
+        self.assertEqual(estimate_tokens('abcdefgh'), 2)
+        # Many short words count at least one token each
+        self.assertEqual(estimate_tokens('a b c d e'), 5)
+        self.assertEqual(estimate_message_tokens('abcd'), 1 + MESSAGE_OVERHEAD_TOKENS)
+
+    def test_trim_keeps_newest_messages_within_budget(self):
+        messages = [self.message('user', 'x' * 40) for _ in range(5)]  # 10 + 4 tokens each
+        self.assertEqual(trim_to_token_budget(messages, 28), messages[-2:])
+        self.assertEqual(trim_to_token_budget(messages, 41), messages[-2:])
+        self.assertEqual(trim_to_token_budget(messages, 42), messages[-3:])
+        self.assertEqual(trim_to_token_budget(messages, 1000), messages)
+
+    def test_trim_always_keeps_the_current_turn(self):
+        messages = [self.message('user', 'short'), self.message('user', 'x' * 4000)]
+        self.assertEqual(trim_to_token_budget(messages, 10), messages[-1:])
+        self.assertEqual(trim_to_token_budget([], 10), [])
+
+    def test_message_window_applies_budget_after_window_size(self):
+        messages = [self.message('user', f'{i}' * 40) for i in range(6)]
+        window = MessageWindow(4, messages)
+        self.assertEqual(window.messages(), messages[-4:])
+
+        window.set_token_budget(28)
+        self.assertEqual(window.messages(), messages[-2:])
+        window.set_token_budget(None)
+        self.assertEqual(window.messages(), messages[-4:])
+
+
+class FakeRedis:
+    """Local stand-in for a Redis client, evaluating the compare-and-set script in Python"""
+
+    def __init__(self):
+        self.values = {}
+
+    def get(self, name):
+        return self.values.get(name)
+
+    def set(self, name, value, ex=None):
+        self.values[name] = value.encode('utf-8')
+
+    def eval(self, script, numkeys, name, version, value, ttl):
+        assert script == RedisMemoryBackend.COMPARE_AND_SET_SCRIPT
+        current = self.values.get(name)
+        if (json.loads(current)['version'] if current else 0) != version:
+            return 0
+        self.set(name, value, ex=ttl or None)
+        return 1
+
+
+class SharedMemoryBackendTests:
+    """Checks shared by every SharedMemoryBackend, mixed into a TestCase with a ``backend()``"""
+
+    key = 'memory_agent_workflow_session'
+
+    def load(self, backend):
+        """What aget() returns, built from plain message objects"""
+        version, rows, summary, window_size = backend.read(self.key) or (0, [], '', 4)
+        memory = MessageWindow(window_size, [SimpleNamespace(role=r, content=c) for r, c in rows], summary=summary)
+        setattr(memory, SharedMemoryBackend.STATE_ATTRIBUTE, (version, rows, summary))
+        return memory
+
+    @staticmethod
+    def add_turn(memory, prompt):
+        memory.add_message(SimpleNamespace(role='user', content=prompt))
+        memory.add_message(SimpleNamespace(role='assistant', content=f'reply {prompt}'))
+
+    def test_round_trip(self):
+        backend = self.backend()
+        self.assertIsNone(backend.read(self.key))
+
+        memory = self.load(backend)
+        for prompt in ('one', 'two', 'three'):
+            self.add_turn(memory, prompt)
+            backend.put(self.key, memory, 4, 'workflow', 'agent')
+
+        version, rows, _, window_size = backend.read(self.key)
+        self.assertEqual(version, 3)
+        self.assertEqual(window_size, 4)
+        self.assertEqual(rows, [('user', 'two'), ('assistant', 'reply two'),
+                                ('user', 'three'), ('assistant', 'reply three')])
+
+    def test_concurrent_turns_on_different_workers_are_merged(self):
+        backend = self.backend()
+        memory = self.load(backend)
+        self.add_turn(memory, 'first')
+        backend.put(self.key, memory, 6, 'workflow', 'agent')
+
+        # Two workers read the same version, then both write a turn
+        worker_a, worker_b = self.load(backend), self.load(backend)
+        self.add_turn(worker_a, 'from a')
+        self.add_turn(worker_b, 'from b')
+        worker_a.summary = 'summary from a'
+        backend.put(self.key, worker_a, 6, 'workflow', 'agent')
+        backend.put(self.key, worker_b, 6, 'workflow', 'agent')
+
+        version, rows, summary, _ = backend.read(self.key)
+        self.assertEqual(version, 3)
+        self.assertEqual([content for _, content in rows],
+                         ['first', 'reply first', 'from a', 'reply from a', 'from b', 'reply from b'])
+        # worker_b left the summary alone, so worker_a's new summary survives the merge
+        self.assertEqual(summary, 'summary from a')
+
+        # worker_b continues from its merged write without conflicting again
+        self.add_turn(worker_b, 'again')
+        backend.put(self.key, worker_b, 6, 'workflow', 'agent')
+        self.assertEqual(backend.read(self.key)[1][-2:], [('user', 'again'), ('assistant', 'reply again')])
+
+    def test_memory_without_read_state_is_appended(self):
+        backend = self.backend()
+        memory = self.load(backend)
+        self.add_turn(memory, 'stored')
+        backend.put(self.key, memory, 4, 'workflow', 'agent')
+
+        # A fresh window created by a worker that found nothing stored yet
+        fresh = MessageWindow(4)
+        self.add_turn(fresh, 'fresh')
+        backend.put(self.key, fresh, 4, 'workflow', 'agent')
+        self.assertEqual([content for _, content in backend.read(self.key)[1]],
+                         ['stored', 'reply stored', 'fresh', 'reply fresh'])
+
+
+class DatabaseMemoryBackendTests(SharedMemoryBackendTests, TestCase):
+    def backend(self):
+        return DatabaseMemoryBackend()
+
+
+class RedisMemoryBackendTests(SharedMemoryBackendTests, TestCase):
+    def backend(self):
+        self.client = FakeRedis()
+        return RedisMemoryBackend(client=self.client, ttl=60)
+
+    def test_values_are_prefixed_json(self):
+        backend = self.backend()
+        memory = self.load(backend)
+        self.add_turn(memory, 'hello')
+        backend.put(self.key, memory, 4, 'workflow', 'agent')
+
+        stored = json.loads(self.client.values[f'agentflow:memory:{self.key}'])
+        self.assertEqual(stored['version'], 1)
+        self.assertEqual(stored['messages'], [['user', 'hello'], ['assistant', 'reply hello']])
+
+
+class WindowMemoryStoreTests(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.writes = []
+        for target, replacement in (
+            # Spills are queued here and run by drain() on the test's own connection
+            ('workflows.memory_backends.submit_write', lambda key, func, *args: self.writes.append((func, args))),
+            ('workflows.memory_backends.time', SimpleNamespace(monotonic=lambda: self.now)),
+            # Rehydrated windows hold plain message objects instead of Alith ones
+            ('workflows.memory_backends.to_alith_messages',
+             lambda rows: [SimpleNamespace(role=role, content=content) for role, content in rows]),
+        ):
+            patcher = mock.patch(target, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @staticmethod
+    def window(text):
+        return MessageWindow(4, [SimpleNamespace(role='user', content=text),
+                                 SimpleNamespace(role='assistant', content=f'reply {text}')])
+
+    def drain(self):
+        while self.writes:
+            func, args = self.writes.pop(0)
+            func(*args)
+
+    def spilled(self, key):
+        collection = MemoryCollection.objects.filter(name=WindowMemoryStore.spill_name(key)).first()
+        if collection is None:
+            return None
+        return list(collection.messages.order_by('seq').values_list('content', flat=True))
+
+    def assert_rehydrated(self, store, key, text):
+        memory = async_to_sync(store.aget)(key)
+        self.assertEqual([message.content for message in memory.messages()], [text, f'reply {text}'])
+        self.assertIn(key, store)
+        self.drain()
+        # The live copy is authoritative again
+        self.assertIsNone(self.spilled(key))
+
+    def test_least_recently_used_window_is_spilled_past_max_entries(self):
+        store = WindowMemoryStore(max_entries=2)
+        for key in ('a', 'b'):
+            store.put(key, self.window(key), 4, 'workflow', 'agent')
+        async_to_sync(store.aget)('a')
+        store.put('c', self.window('c'), 4, 'workflow', 'agent')
+        self.drain()
+
+        self.assertEqual(store.keys(), ['a', 'c'])
+        self.assertEqual(self.spilled('b'), ['b', 'reply b'])
+        self.assert_rehydrated(store, 'b', 'b')
+        self.assertEqual(store.keys(), ['c', 'b'])
+
+    def test_windows_are_spilled_past_max_bytes(self):
+        one_window = WindowMemoryStore()._size(self.window('a'))
+        store = WindowMemoryStore(max_bytes=one_window * 2)
+        for key in ('a', 'b', 'c'):
+            store.put(key, self.window(key), 4, 'workflow', 'agent')
+        self.drain()
+
+        self.assertEqual(store.keys(), ['b', 'c'])
+        self.assertEqual(store.size_bytes, one_window * 2)
+        self.assertEqual(self.spilled('a'), ['a', 'reply a'])
+        self.assert_rehydrated(store, 'a', 'a')
+
+        # A window larger than the whole budget is spilled straight away
+        store.max_bytes = one_window - 1
+        store._evict()
+        self.drain()
+        self.assertEqual(len(store), 0)
+        self.assertEqual(store.size_bytes, 0)
+
+    def test_idle_windows_are_spilled(self):
+        store = WindowMemoryStore(idle_ttl=60)
+        store.put('a', self.window('a'), 4, 'workflow', 'agent')
+        self.now = 30
+        store.put('b', self.window('b'), 4, 'workflow', 'agent')
+        self.now = 70
+        store.put('c', self.window('c'), 4, 'workflow', 'agent')
+        self.drain()
+
+        self.assertEqual(store.keys(), ['b', 'c'])
+        self.assertEqual(self.spilled('a'), ['a', 'reply a'])
+
+        self.now = 200
+        store._evict()
+        self.drain()
+        self.assertEqual(store.size_bytes, 0)
+        self.assertEqual(self.spilled('c'), ['c', 'reply c'])
+        self.assert_rehydrated(store, 'c', 'c')
+
+
+def _append_rows(directory, worker, count):
+    """Append rows whose vector encodes their text, run in a separate process"""
+    index = VectorIndex(directory, 'shared')
+    for i in range(count):
+        row = worker * 1000 + i
+        index.add([('user', str(row))], [[float(row), 1.0]])
+
+
+class SessionLocksTests(TestCase):
+    def setUp(self):
+        self.locks = SessionLocks()
+        self.order = []
+
+    async def hold(self, key, name, release=None):
+        async with self.locks.hold(key):
+            self.order.append(f'{name} in')
+            await (release.wait() if release else asyncio.sleep(0))
+            self.order.append(f'{name} out')
+
+    def test_same_key_runs_in_arrival_order(self):
+        async def run():
+            release = asyncio.Event()
+            first = asyncio.create_task(self.hold('chat', 'first', release))
+            await asyncio.sleep(0)
+            waiting = []
+            for name in ('second', 'third', 'fourth'):
+                waiting.append(asyncio.create_task(self.hold('chat', name)))
+                await asyncio.sleep(0)
+            release.set()
+            await asyncio.gather(first, *waiting)
+
+        asyncio.run(run())
+        self.assertEqual(self.order, ['first in', 'first out', 'second in', 'second out',
+                                      'third in', 'third out', 'fourth in', 'fourth out'])
+
+    def test_waiter_on_another_event_loop_is_woken(self):
+        entered = threading.Event()
+        release = threading.Event()
+
+        async def holder():
+            async with self.locks.hold('chat'):
+                entered.set()
+                await asyncio.get_running_loop().run_in_executor(None, release.wait)
+
+        thread = threading.Thread(target=asyncio.run, args=(holder(),))
+        thread.start()
+        entered.wait(5)
+
+        async def waiter():
+            task = asyncio.create_task(self.hold('chat', 'waiter'))
+            await asyncio.sleep(0.05)
+            self.assertEqual(self.order, [])
+            release.set()
+            await asyncio.wait_for(task, 5)
+
+        asyncio.run(waiter())
+        thread.join(5)
+        self.assertEqual(self.order, ['waiter in', 'waiter out'])
+
+    def test_different_keys_run_in_parallel(self):
+        async def run():
+            release = asyncio.Event()
+            first = asyncio.create_task(self.hold('chat-a', 'a', release))
+            await asyncio.sleep(0)
+            # Would time out if chat-b waited for chat-a
+            await asyncio.wait_for(self.hold('chat-b', 'b'), 1)
+            release.set()
+            await first
+
+        asyncio.run(run())
+        self.assertEqual(self.order, ['a in', 'b in', 'b out', 'a out'])
+
+    def test_cancelled_waiter_passes_the_lock_on(self):
+        async def run(cancel_after_handover):
+            release = asyncio.Event()
+            first = asyncio.create_task(self.hold('chat', 'first', release))
+            await asyncio.sleep(0)
+            cancelled = asyncio.create_task(self.hold('chat', 'cancelled'))
+            last = asyncio.create_task(self.hold('chat', 'last'))
+            await asyncio.sleep(0)
+
+            if cancel_after_handover:
+                # The lock is handed to the waiter just before it is cancelled
+                release.set()
+                await first
+                cancelled.cancel()
+            else:
+                cancelled.cancel()
+                release.set()
+            await asyncio.wait_for(last, 1)
+            await asyncio.gather(first, cancelled, return_exceptions=True)
+
+        for cancel_after_handover in (False, True):
+            self.order = []
+            asyncio.run(run(cancel_after_handover))
+            self.assertEqual(self.order, ['first in', 'first out', 'last in', 'last out'])
+            self.assertFalse(self.locks.locked('chat'))
+
+    def test_entry_removed_after_last_holder(self):
+        async def run():
+            release = asyncio.Event()
+            first = asyncio.create_task(self.hold('chat', 'first', release))
+            second = asyncio.create_task(self.hold('chat', 'second'))
+            await asyncio.sleep(0)
+            self.assertTrue(self.locks.locked('chat'))
+            release.set()
+            await first
+            # Handed to the waiter, not released
+            self.assertTrue(self.locks.locked('chat'))
+            await second
+
+        asyncio.run(run())
+        self.assertFalse(self.locks.locked('chat'))
+        self.assertEqual(self.locks._waiters, {})
+
+
+@skipUnless(numpy, 'vector memory requires NumPy')
+class VectorIndexTests(TestCase):
+    def setUp(self):
+        self.directory = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def assert_rows_paired(self, index):
+        # Every vector was built from its own text, so each row's vector must decode to it
+        matrix = numpy.fromfile(self.directory / 'vectors.f32', dtype=numpy.float32).reshape(-1, 2)
+        texts = [json.loads(line)[1] for line in (self.directory / 'texts.jsonl').read_text().splitlines()]
+        self.assertEqual(len(matrix), len(texts))
+        for (x, y), text in zip(matrix, texts):
+            self.assertAlmostEqual(x / y, float(text), delta=0.5)
+        self.assertEqual(len(index), len(texts))
+
+    def test_search(self):
+        index = VectorIndex(self.directory, 'search')
+        index.add([('user', 'north'), ('user', 'east'), ('user', 'south')], [[0, 1], [1, 0], [0, -1]])
+        results = index.search([0.1, 1], 2)
+        self.assertEqual([content for _, _, content in results], ['north', 'east'])
+        self.assertEqual(index.search([0.1, 1], 2, min_score=0.5)[0][2], 'north')
+        self.assertEqual(len(index.search([0.1, 1], 2, min_score=0.5)), 1)
+        # The newest rows are already in the prompt window
+        self.assertNotIn('south', [content for _, _, content in index.search([0, -1], 3, exclude_last=1)])
+
+    @skipUnless(hasattr(os, 'fork'), 'needs fork to share the test setup with worker processes')
+    def test_concurrent_appends_from_several_processes_stay_paired(self):
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_append_rows, args=(self.directory, worker, 40)) for worker in range(1, 4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        self.assert_rows_paired(VectorIndex(self.directory, 'shared'))
+        self.assertEqual(len(VectorIndex(self.directory, 'shared')), 120)
+
+    def test_interrupted_append_is_repaired(self):
+        index = VectorIndex(self.directory, 'shared')
+        index.add([('user', '1'), ('user', '2')], [[1, 1], [2, 1]])
+
+        # A writer died after its vector and half of its text line
+        with open(self.directory / 'vectors.f32', 'ab') as vectors_file:
+            vectors_file.write(numpy.asarray([[9, 1]], dtype=numpy.float32).tobytes())
+        with open(self.directory / 'texts.jsonl', 'a') as texts_file:
+            texts_file.write('["user", "9')
+
+        reopened = VectorIndex(self.directory, 'shared')
+        self.assertEqual(len(reopened), 2)
+        reopened.add([('user', '3')], [[3, 1]])
+        self.assert_rows_paired(reopened)
+        self.assertEqual([content for _, _, content in reopened.search([3, 1], 1)], ['3'])
+
+
+@skipUnless(numpy, 'vector memory requires NumPy')
+class SemanticCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings_override = override_settings(VECTOR_MEMORY_DIR=directory)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        embedder = SimpleNamespace(embed_texts=lambda texts: [[len(text), 1] for text in texts])
+        embedder_patch = mock.patch('workflows.semantic_cache.get_embedder', return_value=embedder)
+        embedder_patch.start()
+        self.addCleanup(embedder_patch.stop)
+
+    def test_threshold_is_coerced_into_range(self):
+        self.assertEqual(similarity_threshold('0.85'), 0.85)
+        self.assertEqual(similarity_threshold(3), 1.0)
+        for value in (None, 0, -1, 'high'):
+            self.assertEqual(similarity_threshold(value), DEFAULT_THRESHOLD)
+
+    def test_new_fingerprint_starts_afresh_without_deleting_the_old_index(self):
+        old = get_semantic_cache('wf', 'agent', 'a' * 64)
+        answer, _, vector = old.match('hello', 0.99)
+        self.assertIsNone(answer)
+        old.add('hello', 'hi there', vector)
+
+        new = get_semantic_cache('wf', 'agent', 'b' * 64)
+        self.assertNotEqual(new.directory, old.directory)
+        self.assertIsNone(new.match('hello', 0.99)[0])
+        # A process still on the old configuration keeps its answers
+        self.assertEqual(old.match('hello', 0.99)[0], 'hi there')
+
+
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.cache = ResponseCache(Path(directory) / 'cache.sqlite3', ttl=60, max_bytes=100)
+
+    def test_key_covers_every_generation_parameter(self):
+        base = ('openai', 'gpt-4-turbo', 'preamble', 'prompt')
+        keys = {
+            ResponseCache.key(*base),
+            ResponseCache.key(*base, temperature=0.2),
+            ResponseCache.key(*base, temperature=0.7),
+            ResponseCache.key(*base, temperature=0.7, max_tokens=256),
+            ResponseCache.key('groq', *base[1:]),
+            ResponseCache.key(*base[:3], 'other prompt'),
+        }
+        self.assertEqual(len(keys), 6)
+        self.assertEqual(ResponseCache.key(*base, 0.7, 256), ResponseCache.key(*base, temperature=0.7, max_tokens=256))
+
+    def test_entries_expire_after_ttl(self):
+        with mock.patch('workflows.response_cache.time.time', return_value=1000):
+            self.cache.set('key', 'answer')
+        with mock.patch('workflows.response_cache.time.time', return_value=1059):
+            self.assertEqual(self.cache.get('key'), 'answer')
+        with mock.patch('workflows.response_cache.time.time', return_value=1061):
+            self.assertIsNone(self.cache.get('key'))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_least_recently_used_entries_are_evicted_over_max_bytes(self):
+        for i, name in enumerate(('old', 'used', 'new')):
+            with mock.patch('workflows.response_cache.time.time', return_value=1000 + i):
+                self.cache.set(name, 'x' * 40)
+        with mock.patch('workflows.response_cache.time.time', return_value=1010):
+            self.cache.get('old')
+            self.cache.evict()
+
+            self.assertIsNone(self.cache.get('used'))
+            self.assertEqual(self.cache.get('old'), 'x' * 40)
+            self.assertEqual(self.cache.get('new'), 'x' * 40)
+
+    def test_concurrent_identical_calls_share_one_model_call(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        def call():
+            calls.append(1)
+            started.set()
+            release.wait(5)
+            return 'answer'
+
+        async def run():
+            stats = {}
+            first = asyncio.ensure_future(self.cache.aget_or_call('key', call, stats))
+            await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+            second = asyncio.ensure_future(self.cache.aget_or_call('key', call, stats))
+            await asyncio.sleep(0)
+            release.set()
+            return await asyncio.gather(first, second), stats
+
+        answers, stats = async_to_sync(run)()
+        self.assertEqual(answers, ['answer', 'answer'])
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(stats, {'hits': 1, 'misses': 1})
+
+        self.assertEqual(async_to_sync(self.cache.aget_or_call)('key', call, stats), 'answer')
+        self.assertEqual(len(calls), 1)
+
+    def test_node_cache_key_includes_temperature_and_max_tokens(self):
+        executor = AINodeExecutor('classifier', 'text-classifier', {'properties': {'cacheResponses': True}})
+        calls = []
+
+        def call():
+            calls.append(1)
+            return 'answer'
+
+        def prompt(**parameters):
+            return async_to_sync(executor._cached_prompt)(call, {}, 'gpt-4-turbo', 'preamble', 'text', **parameters)
+
+        with mock.patch('workflows.response_cache.response_cache', self.cache):
+            prompt(temperature=0.2)
+            prompt(temperature=0.2)
+            prompt(temperature=0.9)
+            prompt(temperature=0.9, max_tokens=64)
+        self.assertEqual(len(calls), 3)
+
+
+class BatchPromptTests(TestCase):
+    def setUp(self):
+        # Agents are only built inside the patched model calls
+        alith_patch = mock.patch.dict(sys.modules, {'alith': SimpleNamespace(Agent=mock.Mock())})
+        alith_patch.start()
+        self.addCleanup(alith_patch.stop)
+        self.prompts = []
+
+    async def answer(self, call, context, model, preamble, prompt, **parameters):
+        """Answer numbered texts with their sentiment, skipping 'lost' always and 'flaky' in batches"""
+        self.prompts.append(prompt)
+        lines = prompt.splitlines()
+        answers = []
+        for line in lines:
+            number, text = line.split('. ', 1)
+            if text == 'lost' or (text == 'flaky' and len(lines) > 1):
+                continue
+            answers.append(f"{number}) {text.split()[0]} 0.8")
+        return "\n".join(answers)
+
+    def run_node(self, node_type, texts, **properties):
+        executor = AINodeExecutor('batch', node_type, {'properties': properties})
+        with mock.patch.object(executor, '_cached_prompt', self.answer):
+            return async_to_sync(executor.execute)({'main': {'texts': texts}}, {})['main']
+
+    def test_parse_numbered_answers(self):
+        response = "Sure:\n1. positive\n2) negative\n 3 - neutral\n7. out of range\n1. duplicate\n4."
+        self.assertEqual(parse_numbered_answers(response, 4), {1: 'positive', 2: 'negative', 3: 'neutral'})
+
+    def test_parse_sentiment(self):
+        self.assertEqual(parse_sentiment('Positive, (0.9)'), ('positive', 0.9))
+        self.assertEqual(parse_sentiment('negative sure'), ('negative', 0.5))
+        self.assertEqual(parse_sentiment(''), ('neutral', 0.5))
+
+    def test_missing_items_are_retried_alone(self):
+        result = self.run_node('sentiment-analysis', ['positive one', 'flaky', 'negative two'], batchSize=10)
+        self.assertEqual(result['sentiments'], ['positive', 'flaky', 'negative'])
+        self.assertEqual(self.prompts[1:], ['1. flaky'])
+
+    def test_items_missing_after_retry_are_flagged(self):
+        texts = ['positive one', 'lost', 'negative two']
+        sentiment = self.run_node('sentiment-analysis', texts, batchSize=2)
+        self.assertEqual(len(self.prompts), 3)
+        self.assertEqual(sentiment['results'][1], {'text': 'lost', 'sentiment': None, 'confidence': None, 'missing': True})
+        self.assertEqual(sentiment['results'][2], {'text': 'negative two', 'sentiment': 'negative', 'confidence': 0.8})
+
+        classified = self.run_node('text-classifier', texts, batchSize=2)
+        self.assertEqual(classified['categories'], ['positive 0.8', None, 'negative 0.8'])
+        self.assertTrue(classified['results'][1]['missing'])
+
+
+class MapReduceSummaryTests(TestCase):
+    def setUp(self):
+        self.calls = []
+
+        class Agent:
+            def __init__(agent, preamble, **options):
+                agent.preamble = preamble
+
+            def prompt(agent, prompt):
+                self.calls.append(('reduce' if 'Combine' in agent.preamble else 'map', prompt))
+                return f"summary {len(self.calls)}"
+
+        # Documents are chunked on '|' so the chunk count is set by the test
+        alith = SimpleNamespace(Agent=Agent, chunk_text=lambda text, max_chunk_token_size: text.split('|'))
+        alith_patch = mock.patch.dict(sys.modules, {'alith': alith})
+        alith_patch.start()
+        self.addCleanup(alith_patch.stop)
+
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        cache_patch = mock.patch('workflows.response_cache.response_cache',
+                                 ResponseCache(Path(directory) / 'cache.sqlite3', ttl=60, max_bytes=10 ** 6))
+        cache_patch.start()
+        self.addCleanup(cache_patch.stop)
+        self.executor = AINodeExecutor('summary', 'summarization-chain', {'properties': {'reduceFanIn': 3}})
+
+    def summarize(self, chunks):
+        context = {}
+        result = async_to_sync(self.executor._summarize_map_reduce)('|'.join(chunks), 100, context)
+        return result, context.get('cache')
+
+    def test_single_chunk_is_left_to_the_caller(self):
+        self.assertEqual(self.summarize(['short'])[0], (None, 1, 0))
+        self.assertEqual(self.calls, [])
+
+    def test_partial_summaries_are_reduced_level_by_level(self):
+        (summary, chunk_count, levels), stats = self.summarize([f"chunk {number}" for number in range(10)])
+        # 10 chunks -> 4 -> 2 -> 1, a lone trailing summary is carried up unchanged
+        self.assertEqual((chunk_count, levels), (10, 4))
+        stages = [stage for stage, _ in self.calls]
+        self.assertEqual(stages.count('map'), 10)
+        self.assertEqual(stages.count('reduce'), 3 + 1 + 1)
+        self.assertEqual(summary, f"summary {len(self.calls)}")
+        self.assertEqual(stats, {'hits': 0, 'misses': 15})
+
+    def test_edited_chunk_only_recomputes_its_path(self):
+        chunks = [f"chunk {number}" for number in range(6)]
+        self.summarize(chunks)
+        self.calls.clear()
+
+        chunks[5] = 'edited'
+        (_, _, levels), stats = self.summarize(chunks)
+        self.assertEqual(levels, 3)
+        # The edited chunk, its group's reduce and the final reduce
+        self.assertEqual([stage for stage, _ in self.calls], ['map', 'reduce', 'reduce'])
+        self.assertEqual(stats, {'hits': 6, 'misses': 3})
@@ -0,0 +1,52 @@
+"""
+Fast local token estimates for sizing prompts and memory windows
+"""
+from typing import Any, Callable, Iterable, List
+import json
+
+# BPE tokenizers average roughly four characters of English text per token
+CHARS_PER_TOKEN = 4
+# Role markers and separators added around every chat message
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the token count of ``text`` without loading a tokenizer"""
+    if not text:
+        return 0
+    # Short words and punctuation tokenize worse than four characters per token
+    return max((len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN, len(text.split()))
+
+
+def estimate_message_tokens(content: str) -> int:
+    """Estimate the tokens one chat message occupies in a prompt"""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+
+
+def estimate_tool_tokens(tools: Iterable[Any]) -> int:
+    """Estimate the tokens taken by tool names, descriptions and parameter schemas"""
+    total = 0
+    for tool in tools:
+        parameters = getattr(tool, 'parameters', None)
+        if hasattr(parameters, 'model_json_schema'):
+            parameters = parameters.model_json_schema()
+        schema = json.dumps(parameters, default=str) if parameters else ''
+        total += estimate_tokens(f"{getattr(tool, 'name', '')} {getattr(tool, 'description', '')} {schema}")
+    return total
+
+
+def trim_to_token_budget(messages: List, budget: int, content: Callable[[Any], str] = lambda m: m.content) -> List:
+    """
+    Keep the newest messages whose estimated size fits in ``budget`` tokens
+
+    The newest message is always kept, even if on its own it exceeds the budget,
+    so the current turn is never dropped from the prompt.
+    """
+    kept = 0
+    used = 0
+    for message in reversed(messages):
+        used += estimate_message_tokens(content(message))
+        if used > budget and kept:
+            break
+        kept += 1
+    return messages[len(messages) - kept:]
@@ -0,0 +1,256 @@
+"""
+Semantic recall for vector memory using memory-mapped float32 embedding matrices
+
+Every index lives in its own directory holding ``vectors.f32`` (L2-normalized
+float32 rows appended in message order), ``texts.jsonl`` (the (role, content)
+of each row) and ``meta.json`` (embedding dimension and index key). Appends
+hold an exclusive lock on ``.lock`` so rows of both files stay paired when
+several worker processes share a directory. NumPy is an optional dependency and
+only imported once a vector memory is used.
+"""
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import threading
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+VECTORS_FILE = 'vectors.f32'
+TEXTS_FILE = 'texts.jsonl'
+META_FILE = 'meta.json'
+LOCK_FILE = '.lock'
+
+DEFAULT_EMBEDDING_MODEL = 'BAAI/bge-small-en-v1.5'
+
+RECALL_HEADER = 'Relevant earlier conversation:'
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Vector memory requires NumPy. Please install: pip install numpy")
+    return numpy
+
+
+@contextmanager
+def _exclusive_file_lock(path: Path):
+    """Hold an exclusive lock on ``path`` shared by every process on the host"""
+    with open(path, 'a+b') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class VectorIndex:
+    """Append-only embedding matrix with cosine top-k search"""
+
+    def __init__(self, directory, key: str):
+        self.directory = Path(directory)
+        self.key = key
+        self._lock = threading.Lock()
+        self._dim: Optional[int] = None
+        self._matrix = None  # Read-only memmap, remapped when the file grows
+        self._texts: List[Tuple[str, str]] = []
+        self._texts_size = 0  # Bytes of texts.jsonl already loaded
+        self._line_ends: List[int] = []  # Byte offset after each loaded text line
+        self._checked = False  # Row counts of both files compared once on open
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._refresh()
+            return self._count()
+
+    def add(self, rows: List[Tuple[str, str]], vectors) -> None:
+        """Append (role, content) rows with their embeddings"""
+        np = _numpy()
+        matrix = np.asarray(vectors, dtype=np.float32).reshape(len(rows), -1)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        matrix = matrix / np.where(norms == 0, 1, norms)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with self._lock, _exclusive_file_lock(self.directory / LOCK_FILE):
+            meta_path = self.directory / META_FILE
+            if meta_path.exists():
+                dim = json.loads(meta_path.read_text())['dim']
+                if dim != matrix.shape[1]:
+                    raise ValueError(f"Embedding dimension {matrix.shape[1]} does not match index dimension {dim}")
+            else:
+                meta_path.write_text(json.dumps({'key': self.key, 'dim': matrix.shape[1]}))
+
+            self._refresh()
+            self._repair()
+
+            # Vectors first: a row only becomes searchable once its text line exists
+            with open(self.directory / VECTORS_FILE, 'ab') as vectors_file:
+                vectors_file.write(matrix.astype(np.float32).tobytes())
+            with open(self.directory / TEXTS_FILE, 'a') as texts_file:
+                for role, content in rows:
+                    texts_file.write(json.dumps([role, content]) + '\n')
+
+    def search(self, vector, k: int, exclude_last: int = 0, min_score: float = 0.0) -> List[Tuple[float, str, str]]:
+        """
+        Return up to ``k`` (score, role, content) rows most similar to ``vector``
+
+        The newest ``exclude_last`` rows are skipped, they are already in the
+        recent message window.
+        """
+        np = _numpy()
+        with self._lock:
+            self._refresh()
+            count = self._count() - exclude_last
+            if count <= 0 or k <= 0:
+                return []
+
+            query = np.asarray(vector, dtype=np.float32).reshape(-1)
+            norm = np.linalg.norm(query)
+            if norm == 0 or query.shape[0] != self._dim:
+                return []
+            scores = self._matrix[:count] @ (query / norm)
+
+            k = min(k, count)
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(float(scores[i]), *self._texts[i]) for i in top if scores[i] >= min_score]
+
+    def _count(self) -> int:
+        rows = self._matrix.shape[0] if self._matrix is not None else 0
+        return min(rows, len(self._texts))
+
+    def _vector_rows(self) -> int:
+        vectors_path = self.directory / VECTORS_FILE
+        return vectors_path.stat().st_size // (self._dim * 4) if vectors_path.exists() else 0
+
+    def _repair(self) -> None:
+        """
+        Cut both files back to their last complete, paired row
+
+        Only called under the file lock, where no other append is in progress,
+        so any unpaired or partial row was left by a writer that died mid-append.
+        """
+        count = min(self._vector_rows(), len(self._texts))
+        vectors_path = self.directory / VECTORS_FILE
+        texts_path = self.directory / TEXTS_FILE
+        vectors_size = count * self._dim * 4
+        texts_size = self._line_ends[count - 1] if count else 0
+
+        if vectors_path.exists() and vectors_path.stat().st_size != vectors_size:
+            logger.warning(f"Truncating {vectors_path} to {count} rows after an interrupted append")
+            self._matrix = None
+            with open(vectors_path, 'r+b') as vectors_file:
+                vectors_file.truncate(vectors_size)
+        if texts_path.exists() and texts_path.stat().st_size != texts_size:
+            logger.warning(f"Truncating {texts_path} to {count} rows after an interrupted append")
+            with open(texts_path, 'r+b') as texts_file:
+                texts_file.truncate(texts_size)
+            del self._texts[count:]
+            del self._line_ends[count:]
+            self._texts_size = texts_size
+
+    def _refresh(self) -> None:
+        """Map vectors and load text lines appended since the last refresh"""
+        np = _numpy()
+        meta_path = self.directory / META_FILE
+        if not meta_path.exists():
+            return
+        if self._dim is None:
+            self._dim = json.loads(meta_path.read_text())['dim']
+
+        vectors_path = self.directory / VECTORS_FILE
+        rows = self._vector_rows()
+        if rows and (self._matrix is None or self._matrix.shape[0] != rows):
+            self._matrix = np.memmap(vectors_path, dtype=np.float32, mode='r', shape=(rows, self._dim))
+
+        texts_path = self.directory / TEXTS_FILE
+        texts_size = texts_path.stat().st_size if texts_path.exists() else 0
+        if texts_size < self._texts_size:
+            # Another process repaired the file, reload it from the start
+            self._texts, self._line_ends, self._texts_size = [], [], 0
+        if texts_size > self._texts_size:
+            with open(texts_path, 'rb') as texts_file:
+                texts_file.seek(self._texts_size)
+                for line in texts_file:
+                    if not line.endswith(b'\n'):
+                        break  # Partially written line, pick it up next time
+                    self._texts.append(tuple(json.loads(line)))
+                    self._texts_size += len(line)
+                    self._line_ends.append(self._texts_size)
+
+        if not self._checked:
+            self._checked = True
+            if rows != len(self._texts):
+                logger.warning(
+                    f"Vector index {self.directory} has {rows} vectors but {len(self._texts)} texts, "
+                    f"searching the first {min(rows, len(self._texts))}; the next append repairs it"
+                )
+
+
+_indexes: Dict[str, VectorIndex] = {}
+_embedders: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+
+def get_vector_index(key: str) -> VectorIndex:
+    """Process-wide index for ``key``, stored under VECTOR_MEMORY_DIR"""
+    with _registry_lock:
+        index = _indexes.get(key)
+        if index is None:
+            root = Path(getattr(settings, 'VECTOR_MEMORY_DIR', Path(settings.BASE_DIR) / 'vector_memory'))
+            index = VectorIndex(root / hashlib.sha256(key.encode('utf-8')).hexdigest()[:32], key)
+            _indexes[key] = index
+        return index
+
+
+def get_embedder(model_name: Optional[str] = None):
+    """Shared Alith FastEmbeddings instance, loading the model only once per process"""
+    model_name = model_name or DEFAULT_EMBEDDING_MODEL
+    with _registry_lock:
+        embedder = _embedders.get(model_name)
+        if embedder is None:
+            from alith import FastEmbeddings
+            embedder = FastEmbeddings(model_name=model_name)
+            _embedders[model_name] = embedder
+        return embedder
+
+
+def recall(index: VectorIndex, embedder, query: str, k: int, exclude_last: int = 0,
+           min_score: float = 0.0) -> List[Tuple[float, str, str]]:
+    """Earlier (score, role, content) rows most similar to ``query``"""
+    if not query or not len(index):
+        return []
+    vector = embedder.embed_texts([query])[0]
+    return index.search(vector, k, exclude_last, min_score)
+
+
+def remember(index: VectorIndex, embedder, rows: List[Tuple[str, str]]) -> None:
+    """Embed (role, content) rows in one batch and append them to the index"""
+    rows = [(role, content) for role, content in rows if content]
+    if rows:
+        index.add(rows, embedder.embed_texts([content for _, content in rows]))
+
+
+def format_recall(results: List[Tuple[float, str, str]]) -> str:
+    """Prompt section listing recalled messages"""
+    lines = [f"- {role}: {content}" for _, role, content in results]
+    return f"{RECALL_HEADER}\n" + "\n".join(lines)
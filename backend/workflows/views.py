@@ -5,26 +5,150 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from django.shortcuts import get_object_or_404
 from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.http import StreamingHttpResponse, Http404
+from django.core.serializers.json import DjangoJSONEncoder
 import uuid
 import asyncio
-import os
+import itertools
+import json
+import logging
 import time
 from asgiref.sync import async_to_sync
 
 from .models import Workflow, WorkflowExecution, Credential, ExportedWorkflow
+from .analytics import summarize_rollup, WORKFLOW_ROLLUP
 from .serializers import (
     WorkflowSerializer,
     WorkflowExecutionSerializer,
     CredentialSerializer,
     ExecuteWorkflowSerializer,
     ExecuteNodeSerializer,
+    ExecuteBatchSerializer,
+    WorkflowGraphPatchSerializer,
     ExportedWorkflowSerializer,
     ExportedWorkflowCreateSerializer,
     ExportedWorkflowListSerializer
 )
 from .execution_engine import execution_engine
+from .json_patch import apply_patch, JSONPatchError
+from .idempotency import idempotent
+from .execution_store import (
+    save_execution, persist_executions, pending_execution, load_node_states, load_node_states_many
+)
+from .execution_archive import execution_archive
+from .credentials import resolve_credentials
+
+logger = logging.getLogger(__name__)
+
+# Rows fetched per round trip when streaming workflows out as NDJSON
+NDJSON_EXPORT_CHUNK_SIZE = 500
+# Workflows written per INSERT when importing NDJSON
+NDJSON_IMPORT_BATCH_SIZE = 500
+# Maximum number of per-line errors echoed back from an import
+NDJSON_IMPORT_MAX_ERRORS = 100
+# Fields included in each exported NDJSON line
+NDJSON_EXPORT_FIELDS = ['id', 'name', 'description', 'nodes', 'edges', 'is_active', 'created_at', 'updated_at']
+# Batch items executed, streamed back and persisted together
+EXECUTE_BATCH_CHUNK_SIZE = 50
+EXECUTE_BATCH_MAX_CONCURRENCY = 32
+
+
+async def _run_batch_chunk(workflow, plan, chunk, credentials, concurrency):
+    """Run a chunk of batch items on a shared plan with bounded concurrency"""
+    semaphore = asyncio.Semaphore(concurrency)
+    
+    async def run_item(index, trigger_data):
+        async with semaphore:
+            execution_id = str(uuid.uuid4())
+            context = await execution_engine.execute_workflow(
+                workflow_id=str(workflow.id),
+                execution_id=execution_id,
+                nodes=workflow.nodes,
+                edges=workflow.edges,
+                trigger_data=trigger_data,
+                credentials=credentials,
+                plan=plan
+            )
+            # Batch results are persisted below, no need to keep them in the live registry
+            execution_engine.active_executions.pop(execution_id, None)
+            return index, trigger_data, context
+    
+    return await asyncio.gather(*(run_item(index, trigger_data) for index, trigger_data in chunk))
+
+
+def _stream_batch_execution(workflow, plan, items, credentials, concurrency):
+    """Execute batch items chunk by chunk, yielding one NDJSON result line per item"""
+    
+    def process(chunk):
+        results = async_to_sync(_run_batch_chunk)(workflow, plan, chunk, credentials, concurrency)
+        
+        try:
+            persist_executions([(workflow, context, trigger_data) for _, trigger_data, context in results])
+        except Exception as e:
+            # The chunk ran but was not saved, report that per item and keep streaming
+            logger.exception(f"Failed to persist batch executions of workflow {workflow.pk}")
+            for index, _, context in results:
+                yield json.dumps({
+                    'index': index,
+                    'execution_id': context.execution_id,
+                    'status': 'error',
+                    'errors': {'persist': f'Failed to save execution: {str(e)}'}
+                }) + '\n'
+            return
+        
+        for index, _, context in results:
+            yield json.dumps({
+                'index': index,
+                'execution_id': context.execution_id,
+                'status': context.status,
+                'errors': context.errors,
+                'chat_response': context.chat_response
+            }, cls=DjangoJSONEncoder) + '\n'
+    
+    chunk = []
+    for index, item in enumerate(items):
+        # NDJSON items arrive as raw lines, JSON body items are already parsed
+        if isinstance(item, bytes):
+            try:
+                item = json.loads(item)
+            except ValueError as e:
+                yield json.dumps({'index': index, 'status': 'error', 'errors': {'input': f'Invalid JSON: {str(e)}'}}) + '\n'
+                continue
+        
+        if not isinstance(item, dict):
+            yield json.dumps({'index': index, 'status': 'error', 'errors': {'input': 'trigger_data must be an object'}}) + '\n'
+            continue
+        
+        chunk.append((index, item))
+        if len(chunk) >= EXECUTE_BATCH_CHUNK_SIZE:
+            yield from process(chunk)
+            chunk = []
+    
+    if chunk:
+        yield from process(chunk)
+
+
+def _serialize_executions(executions, request):
+    """
+    Serialize executions with node inputs and outputs restored from their node runs
+
+    ``?payloads=false`` skips the restore and returns only node status, timings
+    and payload hashes, which is much cheaper for long histories.
+    """
+    executions = list(executions)
+    data = WorkflowExecutionSerializer(executions, many=True).data
+    if request.query_params.get('payloads', 'true').lower() == 'false':
+        return data
+    
+    node_states = load_node_states_many(executions)
+    for item, execution in zip(data, executions):
+        item['node_states'] = node_states[execution.pk]
+    return data
 
 
 class WorkflowViewSet(viewsets.ModelViewSet):
@@ -46,6 +170,7 @@ class WorkflowViewSet(viewsets.ModelViewSet):
         serializer.save(user=self.request.user if self.request.user.is_authenticated else None)
     
     @action(detail=True, methods=['post'])
+    @idempotent
     def execute(self, request, pk=None):
         """Execute a workflow"""
         workflow = self.get_object()
@@ -56,7 +181,11 @@ class WorkflowViewSet(viewsets.ModelViewSet):
         
         trigger_data = serializer.validated_data.get('trigger_data', {})
         start_node_id = serializer.validated_data.get('start_node_id')
-        credentials = serializer.validated_data.get('credentials', {})
+        
+        try:
+            credentials = resolve_credentials(request.user, serializer.validated_data.get('credentials'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Generate execution ID
         execution_id = str(uuid.uuid4())
@@ -74,16 +203,7 @@ class WorkflowViewSet(viewsets.ModelViewSet):
             )
             
             # Save execution to database
-            execution = WorkflowExecution.objects.create(
-                workflow=workflow,
-                status=context.status,
-                started_at=context.start_time,
-                finished_at=context.end_time,
-                execution_order=context.execution_order,
-                node_states=context.node_states,
-                errors=context.errors,
-                trigger_data=trigger_data
-            )
+            save_execution(workflow, context, trigger_data)
             
             return Response({
                 'execution_id': execution_id,
@@ -108,7 +228,11 @@ class WorkflowViewSet(viewsets.ModelViewSet):
         
         node_id = serializer.validated_data['node_id']
         trigger_data = serializer.validated_data.get('trigger_data', {})
-        credentials = serializer.validated_data.get('credentials', {})
+        
+        try:
+            credentials = resolve_credentials(request.user, serializer.validated_data.get('credentials'))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         # Check if node exists in workflow
         node = next((n for n in workflow.nodes if n['id'] == node_id), None)
@@ -132,16 +256,7 @@ class WorkflowViewSet(viewsets.ModelViewSet):
             )
             
             # Save execution to database
-            execution = WorkflowExecution.objects.create(
-                workflow=workflow,
-                status=context.status,
-                started_at=context.start_time,
-                finished_at=context.end_time,
-                execution_order=context.execution_order,
-                node_states=context.node_states,
-                errors=context.errors,
-                trigger_data=trigger_data
-            )
+            save_execution(workflow, context, trigger_data)
             
             return Response({
                 'execution_id': execution_id,
@@ -157,13 +272,185 @@ class WorkflowViewSet(viewsets.ModelViewSet):
                 'node_id': node_id
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
     
+    @action(detail=True, methods=['patch'])
+    def graph(self, request, pk=None):
+        """Apply RFC 6902 JSON Patch operations to the workflow's nodes and edges"""
+        workflow = self.get_object()
+        serializer = WorkflowGraphPatchSerializer(data=request.data)
+        
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        
+        operations = serializer.validated_data['operations']
+        expected_updated_at = serializer.validated_data.get('updated_at')
+        
+        if expected_updated_at and expected_updated_at != workflow.updated_at:
+            return Response({
+                'error': 'Workflow was modified by another request',
+                'updated_at': workflow.updated_at
+            }, status=status.HTTP_409_CONFLICT)
+        
+        try:
+            graph = apply_patch({'nodes': workflow.nodes, 'edges': workflow.edges}, operations)
+        except JSONPatchError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        if set(graph) != {'nodes', 'edges'} or not isinstance(graph['nodes'], list) or not isinstance(graph['edges'], list):
+            return Response({
+                'error': 'Patched graph must contain only nodes and edges lists'
+            }, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Compare-and-swap on updated_at so concurrent autosaves cannot overwrite each other
+        updated_at = timezone.now()
+        updated = Workflow.objects.filter(pk=workflow.pk, updated_at=workflow.updated_at).update(
+            nodes=graph['nodes'],
+            edges=graph['edges'],
+            updated_at=updated_at
+        )
+        if not updated:
+            workflow.refresh_from_db(fields=['updated_at'])
+            return Response({
+                'error': 'Workflow was modified by another request',
+                'updated_at': workflow.updated_at
+            }, status=status.HTTP_409_CONFLICT)
+        
+        return Response({
+            'id': str(workflow.id),
+            'updated_at': updated_at,
+            'nodes_count': len(graph['nodes']),
+            'edges_count': len(graph['edges'])
+        })
+    
+    @action(detail=True, methods=['post'])
+    def execute_batch(self, request, pk=None):
+        """Execute a workflow once per trigger payload and stream NDJSON results"""
+        workflow = self.get_object()
+        
+        if request.content_type.startswith('application/x-ndjson'):
+            # DRF exposes an empty body as a None stream
+            if request.stream is None:
+                return Response({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+            # One trigger_data object per line, read lazily while results stream out
+            items = (line for line in request.stream if line.strip())
+            first = next(items, None)
+            if first is None:
+                return Response({'error': 'Request body contains no items'}, status=status.HTTP_400_BAD_REQUEST)
+            items = itertools.chain([first], items)
+            requested_credentials = {}
+            try:
+                concurrency = int(request.query_params.get('concurrency', 4))
+            except ValueError:
+                return Response({'error': 'concurrency must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            concurrency = max(1, min(concurrency, EXECUTE_BATCH_MAX_CONCURRENCY))
+        else:
+            serializer = ExecuteBatchSerializer(data=request.data)
+            if not serializer.is_valid():
+                return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+            items = serializer.validated_data['items']
+            requested_credentials = serializer.validated_data.get('credentials', {})
+            concurrency = serializer.validated_data.get('concurrency', 4)
+        
+        try:
+            credentials = resolve_credentials(request.user, requested_credentials)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Build the execution plan once and share it across every item
+        try:
+            plan = execution_engine.compile_plan(workflow.nodes, workflow.edges)
+        except (ValueError, KeyError) as e:
+            return Response({'error': f'Invalid workflow graph: {str(e)}'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return StreamingHttpResponse(
+            _stream_batch_execution(workflow, plan, items, credentials, concurrency),
+            content_type='application/x-ndjson'
+        )
+    
     @action(detail=True, methods=['get'])
     def executions(self, request, pk=None):
         """Get execution history for a workflow"""
         workflow = self.get_object()
         executions = workflow.executions.all()
-        serializer = WorkflowExecutionSerializer(executions, many=True)
-        return Response(serializer.data)
+        return Response(_serialize_executions(executions, request))
+    
+    @action(detail=False, methods=['get'], url_path='export.ndjson')
+    def export_ndjson(self, request):
+        """Stream all of the user's workflows as newline-delimited JSON"""
+        rows = self.get_queryset().order_by('created_at').values(*NDJSON_EXPORT_FIELDS)
+        
+        def generate():
+            for row in rows.iterator(chunk_size=NDJSON_EXPORT_CHUNK_SIZE):
+                yield json.dumps(row, cls=DjangoJSONEncoder) + '\n'
+        
+        response = StreamingHttpResponse(generate(), content_type='application/x-ndjson')
+        response['Content-Disposition'] = 'attachment; filename="workflows.ndjson"'
+        return response
+    
+    @action(detail=False, methods=['post'], url_path='import')
+    def import_ndjson(self, request):
+        """Import workflows from a newline-delimited JSON body in batches"""
+        user = request.user if request.user.is_authenticated else None
+        imported = 0
+        failed = 0
+        errors = []  # Only the first NDJSON_IMPORT_MAX_ERRORS are reported
+        batch = []
+        
+        # DRF exposes an empty body as a None stream
+        if request.stream is None:
+            return Response({'error': 'Request body is empty'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # request.stream yields the raw body line by line without buffering it all
+        for line_number, line in enumerate(request.stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            
+            try:
+                data = json.loads(line)
+            except ValueError as e:
+                failed += 1
+                if len(errors) < NDJSON_IMPORT_MAX_ERRORS:
+                    errors.append({'line': line_number, 'error': f'Invalid JSON: {str(e)}'})
+                continue
+            
+            serializer = WorkflowSerializer(data=data)
+            if not serializer.is_valid():
+                failed += 1
+                if len(errors) < NDJSON_IMPORT_MAX_ERRORS:
+                    errors.append({'line': line_number, 'error': serializer.errors})
+                continue
+            
+            batch.append(Workflow(user=user, **serializer.validated_data))
+            if len(batch) >= NDJSON_IMPORT_BATCH_SIZE:
+                Workflow.objects.bulk_create(batch)
+                imported += len(batch)
+                batch = []
+        
+        if batch:
+            Workflow.objects.bulk_create(batch)
+            imported += len(batch)
+        
+        if not imported and not failed:
+            return Response({'error': 'Request body contains no workflows'}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'imported': imported,
+            'failed': failed,
+            'errors': errors
+        }, status=status.HTTP_400_BAD_REQUEST if failed and not imported else status.HTTP_201_CREATED)
+    
+    @action(detail=True, methods=['get'])
+    def stats(self, request, pk=None):
+        """Get execution counts, error rates and latency percentiles from the rollup tables"""
+        workflow = self.get_object()
+        rollups = {rollup.node_type: rollup for rollup in workflow.rollups.all()}
+        workflow_stats = rollups.pop(WORKFLOW_ROLLUP, None)
+        
+        return Response({
+            'workflow_id': str(workflow.id),
+            'executions': summarize_rollup(workflow_stats),
+            'node_types': {node_type: summarize_rollup(rollup) for node_type, rollup in rollups.items()}
+        })
     
     @action(detail=False, methods=['post'])
     def validate(self, request):
@@ -205,14 +492,73 @@ class WorkflowExecutionViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = WorkflowExecutionSerializer
     
     def get_queryset(self):
-        """Filter executions by authenticated user's workflows"""
+        """Filter executions by authenticated user and optional query parameters"""
         queryset = WorkflowExecution.objects.all()
         if self.request.user.is_authenticated:
-            queryset = queryset.filter(workflow__user=self.request.user)
+            # Uses the denormalized user column and its (user, -started_at) index
+            queryset = queryset.filter(user=self.request.user)
         else:
             queryset = queryset.none()
+        
+        # Filter by workflow
+        workflow_id = self.request.query_params.get('workflow')
+        if workflow_id:
+            try:
+                workflow_id = uuid.UUID(workflow_id)
+            except ValueError:
+                raise ValidationError({'workflow': 'Invalid workflow id, expected a UUID'})
+            queryset = queryset.filter(workflow_id=workflow_id)
+        
+        # Filter by status
+        execution_status = self.request.query_params.get('status')
+        if execution_status:
+            queryset = queryset.filter(status=execution_status)
+        
+        # Filter by start time range (ISO 8601 datetimes)
+        for param, lookup in (('started_after', 'started_at__gte'), ('started_before', 'started_at__lt')):
+            value = self.request.query_params.get(param)
+            if value:
+                try:
+                    parsed = parse_datetime(value)
+                except ValueError:
+                    # Well-formed but out of range, e.g. month 13
+                    parsed = None
+                if parsed is None:
+                    raise ValidationError({param: 'Invalid datetime, expected ISO 8601'})
+                queryset = queryset.filter(**{lookup: parsed})
+        
         return queryset
     
+    def list(self, request, *args, **kwargs):
+        """List executions in the stored shape, node inputs and outputs included"""
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(_serialize_executions(page, request))
+        return Response(_serialize_executions(queryset, request))
+    
+    def retrieve(self, request, *args, **kwargs):
+        """Get a single execution with node inputs and outputs restored from its node runs"""
+        try:
+            execution = self.get_object()
+        except Http404:
+            if not request.user.is_authenticated:
+                raise
+            # Executions still queued for write-behind are served from memory
+            pending = pending_execution(kwargs.get('pk'), request.user.pk)
+            if pending is not None:
+                return Response(pending)
+            # Fall back to executions moved to cold storage by archive_executions
+            record = execution_archive.get(kwargs.get('pk'), user_id=request.user.pk)
+            if record is None:
+                raise
+            record.pop('user', None)
+            return Response({**record, 'archived': True})
+        
+        data = self.get_serializer(execution).data
+        data['node_states'] = load_node_states(execution)
+        return Response(data)
+    
     @action(detail=True, methods=['get'])
     def status(self, request, pk=None):
         """Get current execution status"""
@@ -230,7 +576,7 @@ class WorkflowExecutionViewSet(viewsets.ReadOnlyModelViewSet):
             'started_at': execution.started_at.isoformat(),
             'finished_at': execution.finished_at.isoformat() if execution.finished_at else None,
             'execution_order': execution.execution_order,
-            'node_states': execution.node_states,
+            'node_states': load_node_states(execution),
             'errors': execution.errors
         })
 
@@ -270,12 +616,15 @@ from rest_framework.response import Response
 
 
 @api_view(['POST'])
+@idempotent
 def trigger_chat(request):
     """Trigger a workflow from a chat message"""
     workflow_id = request.data.get('workflow_id')
     message = request.data.get('message', '')
     user = request.data.get('user', 'anonymous')
     channel = request.data.get('channel', '')
+    # Optional conversation id; without it memory is partitioned by channel and user
+    session_id = request.data.get('session_id', '')
     
     if not workflow_id:
         return Response({'error': 'workflow_id is required'}, status=status.HTTP_400_BAD_REQUEST)
@@ -300,22 +649,14 @@ def trigger_chat(request):
                 'message': message,
                 'user': user,
                 'channel': channel,
+                'session_id': session_id,
                 'timestamp': '',
             },
-            credentials={}
+            credentials=resolve_credentials(workflow.user)
         )
         
         # Save execution
-        execution = WorkflowExecution.objects.create(
-            workflow=workflow,
-            status=context.status,
-            started_at=context.start_time,
-            finished_at=context.end_time,
-            execution_order=context.execution_order,
-            node_states=context.node_states,
-            errors=context.errors,
-            trigger_data={'message': message, 'user': user, 'channel': channel}
-        )
+        save_execution(workflow, context, {'message': message, 'user': user, 'channel': channel, 'session_id': session_id})
         
         return Response({
             'execution_id': execution_id,
@@ -355,11 +696,15 @@ def ai_chat(request):
                 'error': 'message is required'
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        # Use settings from request or fallback to environment variables
-        api_key = settings.get('apiKey') or os.getenv('GROQ_API_KEY')
+        # Use settings from request or fall back to the caller's stored credentials
         model = settings.get('model') or 'llama-3.1-8b-instant'
         base_url = settings.get('baseUrl') or 'https://api.groq.com/openai/v1'
         provider = settings.get('llmProvider', 'groq')
+        key_name = f'{provider}_api_key'
+        try:
+            api_key = resolve_credentials(request.user, {key_name: settings.get('apiKey')}).get(key_name)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         if not api_key:
             return Response({
@@ -769,8 +1114,8 @@ def get_available_memory_types(request):
             {
                 'id': 'vector-memory',
                 'name': 'Vector Memory',
-                'description': 'Store and retrieve information using vector embeddings (legacy)',
-                'category': 'Legacy',
+                'description': 'Recall relevant earlier messages using vector embeddings',
+                'category': 'Semantic',
                 'features': ['Vector search', 'Semantic matching', 'Scalable']
             }
         ]
@@ -515,16 +515,23 @@ const PropertyPanel = ({ node, onUpdate, onClose }) => {
           />
         );
 
-      case 'number':
+      case 'number': {
+        // Properties with a fractional step (e.g. 0.01) keep decimals, the rest are integers
+        const fractional = propDef.step && !Number.isInteger(propDef.step);
         return (
           <input
             type="number"
             value={value}
-            onChange={(e) => handlePropertyChange(propKey, parseInt(e.target.value))}
+            onChange={(e) => handlePropertyChange(
+              propKey,
+              fractional ? parseFloat(e.target.value) : parseInt(e.target.value)
+            )}
             min={propDef.min}
             max={propDef.max}
+            step={propDef.step}
           />
         );
+      }
 
       case 'select':
         return (
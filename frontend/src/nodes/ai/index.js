@@ -7,9 +7,20 @@ import {
   textProperty,
   valueProperty,
   jsonProperty,
+  booleanProperty,
+  selectProperty,
   claudeModels
 } from '../base/commonProperties';
 
+// Reuse stored responses for identical inputs instead of calling the model again
+const cacheResponsesProperty = booleanProperty('Cache Responses', false);
+
+// Used when the input is a list of texts
+const batchProperties = {
+  batchSize: valueProperty(20, 1, 200, 'Batch Size', 'Texts sent to the model in one request'),
+  maxConcurrentBatches: valueProperty(4, 1, 32, 'Concurrent Batches', 'Requests in flight at the same time')
+};
+
 export const aiNodes = {
   'ai-agent': createAgentNode({
     name: 'AI Agent',
@@ -18,7 +29,10 @@ export const aiNodes = {
     icon: 'AiOutlineRobot',
     description: 'Generates an action plan and executes it. Can use external tools.',
     properties: {
-      prompt: systemPromptProperty
+      prompt: systemPromptProperty,
+      semanticCache: booleanProperty('Semantic Response Cache', false),
+      semanticCacheThreshold: valueProperty(0.92, 0, 1, 'Similarity Threshold', 'Cosine similarity a new prompt needs to reuse a stored answer', 0.01),
+      embeddingModel: textProperty('Embedding Model', false, 'BAAI/bge-small-en-v1.5')
     }
   }),
 
@@ -77,7 +91,12 @@ export const aiNodes = {
     icon: 'FiFileText',
     description: 'Transforms text into a concise summary',
     properties: {
-      maxLength: valueProperty(500, 100, 2000)
+      maxLength: valueProperty(500, 100, 2000),
+      mode: selectProperty('Mode', 'auto', ['auto', 'single', 'map-reduce']),
+      chunkSize: valueProperty(2000, 100, 100000, 'Chunk Size', 'Tokens per chunk in map-reduce mode'),
+      maxConcurrentChunks: valueProperty(4, 1, 32, 'Concurrent Chunks', 'Chunk summaries generated at the same time'),
+      reduceFanIn: valueProperty(8, 2, 50, 'Reduce Fan-in', 'Partial summaries combined per reduce step'),
+      cacheResponses: cacheResponsesProperty
     }
   }),
 
@@ -88,7 +107,8 @@ export const aiNodes = {
     icon: 'BiData',
     description: 'Extract information from text in a structured format',
     properties: {
-      schema: jsonProperty('Extraction Schema', '{\n  "fields": ["name", "email", "company"]\n}')
+      schema: jsonProperty('Extraction Schema', '{\n  "fields": ["name", "email", "company"]\n}'),
+      cacheResponses: cacheResponsesProperty
     }
   }),
 
@@ -100,7 +120,9 @@ export const aiNodes = {
     description: 'Classify your text into distinct categories',
     properties: {
       text: messageProperty(true),
-      categories: textProperty('Categories (comma separated)', true, 'positive, negative, neutral')
+      categories: textProperty('Categories (comma separated)', true, 'positive, negative, neutral'),
+      ...batchProperties,
+      cacheResponses: cacheResponsesProperty
     }
   }),
 
@@ -111,7 +133,9 @@ export const aiNodes = {
     icon: 'FiTrendingUp',
     description: 'Analyze the sentiment of your text',
     properties: {
-      text: messageProperty(true)
+      text: messageProperty(true),
+      ...batchProperties,
+      cacheResponses: cacheResponsesProperty
     }
   })
 };
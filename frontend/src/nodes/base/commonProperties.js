@@ -20,6 +20,7 @@ export const temperatureProperty = {
   default: 0.7,
   min: 0,
   max: 2,
+  step: 0.1,
   description: 'Controls randomness. Lower values are more focused, higher values are more creative.'
 };
 
@@ -128,12 +129,13 @@ export const intervalProperty = {
 };
 
 // Value property (for numeric inputs)
-export const valueProperty = (defaultValue = 1, min = 1, max = null, label = 'Value', description = 'Numeric value') => ({
+export const valueProperty = (defaultValue = 1, min = 1, max = null, label = 'Value', description = 'Numeric value', step = null) => ({
   type: 'number',
   label,
   default: defaultValue,
   min,
   ...(max && { max }),
+  ...(step && { step }),
   description
 });
 
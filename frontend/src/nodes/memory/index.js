@@ -1,5 +1,13 @@
 import { createMemoryNode } from '../base/nodeFactory';
-import { valueProperty, textProperty, selectProperty } from '../base/commonProperties';
+import { valueProperty, textProperty, selectProperty, booleanProperty } from '../base/commonProperties';
+
+const windowOptionProperties = {
+  windowMode: selectProperty('Window Mode', 'messages', ['messages', 'tokens']),
+  tokenBudget: valueProperty(2000, 100, 200000, 'Token Budget', 'Estimated tokens of history to keep when Window Mode is tokens'),
+  reserveHeadroom: booleanProperty('Reserve System Prompt Headroom', false),
+  compaction: booleanProperty('Summarize Older Turns', false),
+  summaryMaxWords: valueProperty(200, 20, 2000, 'Summary Max Words', 'Length limit for the running summary of older turns')
+};
 
 export const memoryNodes = {
   'window-buffer-memory': createMemoryNode({
@@ -9,7 +17,8 @@ export const memoryNodes = {
     icon: 'FiDatabase',
     description: 'Maintains a sliding window of recent messages using Alith SDK',
     properties: {
-      windowSize: valueProperty(20, 1, 1000, 'Window Size', 'Number of messages to keep in memory')
+      windowSize: valueProperty(20, 1, 1000, 'Window Size', 'Number of messages to keep in memory'),
+      ...windowOptionProperties
     }
   }),
 
@@ -20,7 +29,8 @@ export const memoryNodes = {
     icon: 'FiDatabase',
     description: 'Persistent memory storage using Django database - survives server restarts',
     properties: {
-      windowSize: valueProperty(20, 1, 1000, 'Window Size', 'Number of messages to keep in memory')
+      windowSize: valueProperty(20, 1, 1000, 'Window Size', 'Number of messages to keep in memory'),
+      ...windowOptionProperties
     }
   }),
 
@@ -40,9 +50,13 @@ export const memoryNodes = {
     category: 'Memory',
     color: '#8b5cf6',
     icon: 'FiDatabase',
-    description: 'Store and retrieve information using vector embeddings (legacy)',
+    description: 'Recall relevant earlier messages using vector embeddings',
     properties: {
-      collection: textProperty('Collection Name', true, 'default')
+      collection: textProperty('Collection Name', true, 'default'),
+      windowSize: valueProperty(20, 1, 1000, 'Window Size', 'Number of recent messages always kept in the prompt'),
+      topK: valueProperty(4, 1, 50, 'Recalled Messages', 'Number of similar older messages added to the prompt'),
+      minScore: valueProperty(0.3, 0, 1, 'Minimum Similarity', 'Cosine similarity a message needs to be recalled', 0.01),
+      embeddingModel: textProperty('Embedding Model', false, 'BAAI/bge-small-en-v1.5')
     }
   })
 };